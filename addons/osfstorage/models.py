@@ -16,7 +16,7 @@ from osf.exceptions import InvalidTagError, NodeStateError, TagNotFoundError
 from framework.auth.core import Auth
 from osf.models.mixins import Loggable
 from osf.models import AbstractNode
-from osf.models.files import File, FileVersion, Folder, TrashedFileNode, BaseFileNode, BaseFileNodeManager
+from osf.models.files import File, FileVersion, Folder, TrashedFileNode, BaseFileNode, BaseFileNodeManager, BaseFileVersionsThrough
 from osf.models.metaschema import FileMetadataSchema
 from osf.utils import permissions
 from website.files import exceptions
@@ -44,41 +44,94 @@ class OsfStorageFileNode(BaseFileNode):
 
     @property
     def materialized_path(self):
+        if not self.pk:
+            return '/'
+        if not hasattr(self, '_cached_materialized_path'):
+            self.prefetch_materialized_paths([self])
+        return self._cached_materialized_path
+
+    @materialized_path.setter
+    def materialized_path(self, val):
+        # raise Exception('Cannot set materialized path on OSFStorage as it is computed.')
+        logger.warn('Cannot set materialized path on OSFStorage because it\'s computed.')
+
+    @classmethod
+    def prefetch_materialized_paths(cls, file_nodes):
+        """Compute and cache ``materialized_path`` for all of ``file_nodes`` with a single
+        query, by resolving the paths of their parent folders. A folder listing therefore
+        costs one recursive query instead of one per file.
+        """
+        file_nodes = [each for each in file_nodes if each.pk and not hasattr(each, '_cached_materialized_path')]
+        parent_paths = cls._get_materialized_paths({each.parent_id for each in file_nodes if each.parent_id})
+        for file_node in file_nodes:
+            if file_node.parent_id is None:
+                path = file_node.name
+            elif file_node.parent_id in parent_paths:
+                path = '{}/{}'.format(parent_paths[file_node.parent_id], file_node.name)
+            else:
+                file_node._cached_materialized_path = '/'
+                continue
+            file_node._cached_materialized_path = path if file_node.is_file else path + '/'
+
+    @classmethod
+    def _get_materialized_paths(cls, ids):
+        """Return a map of id -> materialized path, without the trailing slash of folders."""
+        if not ids:
+            return {}
         sql = """
-            WITH RECURSIVE materialized_path_cte(parent_id, GEN_PATH) AS (
+            WITH RECURSIVE materialized_path_cte(start_id, parent_id, GEN_PATH) AS (
               SELECT
+                T.id,
                 T.parent_id,
                 T.name :: TEXT AS GEN_PATH
               FROM %s AS T
-              WHERE T.id = %s
+              WHERE T.id = ANY(%s)
               UNION ALL
               SELECT
+                R.start_id,
                 T.parent_id,
                 (T.name || '/' || R.GEN_PATH) AS GEN_PATH
               FROM materialized_path_cte AS R
                 JOIN %s AS T ON T.id = R.parent_id
               WHERE R.parent_id IS NOT NULL
             )
-            SELECT gen_path
+            SELECT start_id, gen_path
             FROM materialized_path_cte AS N
-            WHERE parent_id IS NULL
-            LIMIT 1;
+            WHERE parent_id IS NULL;
         """
         with connection.cursor() as cursor:
-            cursor.execute(sql, [AsIs(self._meta.db_table), self.pk, AsIs(self._meta.db_table)])
-            row = cursor.fetchone()
-            if not row:
-                return '/'
+            cursor.execute(sql, [AsIs(cls._meta.db_table), list(ids), AsIs(cls._meta.db_table)])
+            return dict(cursor.fetchall())
 
-            path = row[0]
-            if not self.is_file:
-                path = path + '/'
-            return path
+    def _clear_materialized_path_cache(self):
+        self.__dict__.pop('_cached_materialized_path', None)
 
-    @materialized_path.setter
-    def materialized_path(self, val):
-        # raise Exception('Cannot set materialized path on OSFStorage as it is computed.')
-        logger.warn('Cannot set materialized path on OSFStorage because it\'s computed.')
+    @property
+    def storage_usage(self):
+        """Total size of the versions of this file, or of every file under this folder."""
+        sql = """
+            WITH RECURSIVE descendants_cte(id, type) AS (
+              SELECT T.id, T.type
+              FROM %s AS T
+              WHERE T.id = %s
+              UNION ALL
+              SELECT T.id, T.type
+              FROM descendants_cte AS R
+                JOIN %s AS T ON T.parent_id = R.id
+            )
+            SELECT COALESCE(SUM(V.size), 0)
+            FROM descendants_cte AS N
+              JOIN %s AS VT ON VT.basefilenode_id = N.id
+              JOIN %s AS V ON V.id = VT.fileversion_id
+            WHERE N.type = %s;
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                AsIs(self._meta.db_table), self.pk, AsIs(self._meta.db_table),
+                AsIs(BaseFileVersionsThrough._meta.db_table), AsIs(FileVersion._meta.db_table),
+                OsfStorageFile._typedmodels_type,
+            ])
+            return cursor.fetchone()[0]
 
     @classmethod
     def get(cls, _id, target):
@@ -176,6 +229,7 @@ class OsfStorageFileNode(BaseFileNode):
         if self.is_checked_out:
             raise exceptions.FileNodeCheckedOutError()
         self.update_region_from_latest_version(destination_parent)
+        self._clear_materialized_path_cache()
         return super(OsfStorageFileNode, self).move_under(destination_parent, name)
 
     def check_in_or_out(self, user, checkout, save=False):
@@ -233,6 +287,8 @@ class OsfStorageFileNode(BaseFileNode):
     def save(self):
         self._path = ''
         self._materialized_path = ''
+        # name or parent may have changed
+        self._clear_materialized_path_cache()
         return super(OsfStorageFileNode, self).save()
 
 
@@ -5,12 +5,14 @@ import unittest
 
 import pytest
 import pytz
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from nose.tools import *  # noqa
 
 from framework.auth import Auth
 from addons.osfstorage.models import OsfStorageFile, OsfStorageFileNode, OsfStorageFolder
-from osf.models import BaseFileNode
+from osf.models import BaseFileNode, PageCounter
 from osf.exceptions import ValidationError
 from osf.utils.permissions import WRITE, ADMIN
 from osf.utils.fields import EncryptedJSONField
@@ -188,6 +190,7 @@ class TestOsfstorageFileNode(StorageTestCase):
         utils.update_analytics(self.project, child, 0)
         utils.update_analytics(self.project, child, 1)
         utils.update_analytics(self.project, child, 2)
+        PageCounter.flush_events()
 
         assert_equals(child.get_download_count(), 3)
         assert_equals(child.get_download_count(0), 1)
@@ -309,6 +312,32 @@ class TestOsfstorageFileNode(StorageTestCase):
         child = self.node_settings.get_root().append_folder('Cloud').append_file('Carp')
         assert_equals('/Cloud/Carp', child.materialized_path)
 
+    def test_materialized_path_root(self):
+        assert_equals('/', self.node_settings.get_root().materialized_path)
+
+    def test_materialized_path_updated_on_move_and_rename(self):
+        root = self.node_settings.get_root()
+        child = root.append_folder('Cloud').append_file('Carp')
+        assert_equals('/Cloud/Carp', child.materialized_path)
+
+        child.move_under(root.append_folder('Sea'), name='Koi')
+        assert_equals('/Sea/Koi', child.materialized_path)
+
+    def test_prefetch_materialized_paths(self):
+        root = self.node_settings.get_root()
+        folder = root.append_folder('Cloud')
+        children = [folder.append_file('Carp'), folder.append_folder('Koi'), folder.append_file('Trout')]
+        children = list(OsfStorageFileNode.objects.filter(id__in=[child.id for child in children]).order_by('name'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            OsfStorageFileNode.prefetch_materialized_paths(children + [root])
+            assert_equals(
+                [child.materialized_path for child in children],
+                ['/Cloud/Carp', '/Cloud/Koi/', '/Cloud/Trout']
+            )
+            assert_equals('/', root.materialized_path)
+        assert_equals(len(ctx.captured_queries), 1)
+
     def test_copy(self):
         to_copy = self.node_settings.get_root().append_file('Carp')
         copy_to = self.node_settings.get_root().append_folder('Cloud')
@@ -7,7 +7,7 @@ from nose.tools import *  # noqa
 from framework import sessions
 from framework.flask import request
 
-from osf.models import Session
+from osf.models import PageCounter, Session
 from addons.osfstorage.tests import factories
 from addons.osfstorage import utils
 
@@ -34,6 +34,7 @@ class TestSerializeRevision(StorageTestCase):
         utils.update_analytics(self.project, self.record, 0)
         utils.update_analytics(self.project, self.record, 0)
         utils.update_analytics(self.project, self.record, 2)
+        PageCounter.flush_events()
         expected = {
             'index': 1,
             'user': {
@@ -61,6 +62,7 @@ class TestSerializeRevision(StorageTestCase):
         utils.update_analytics(self.project, self.record, 0)
         utils.update_analytics(self.project, self.record, 0)
         utils.update_analytics(self.project, self.record, 2)
+        PageCounter.flush_events()
         expected = {
             'index': 2,
             'user': None,
@@ -124,7 +124,7 @@ def osfstorage_get_revisions(file_node, payload, target, **kwargs):
 @decorators.waterbutler_opt_hook
 def osfstorage_copy_hook(source, destination, name=None, **kwargs):
     ret = source.copy_under(destination, name=name).serialize(), http_status.HTTP_201_CREATED
-    update_storage_usage(destination.target)
+    update_storage_usage(destination.target, source.storage_usage)
     return ret
 
 @decorators.waterbutler_opt_hook
@@ -142,10 +142,11 @@ def osfstorage_move_hook(source, destination, name=None, **kwargs):
             'message_long': 'Cannot move file as it is the primary file of preprint.'
         })
 
-    # once the move is complete recalculate storage for both targets if it's a inter-target move.
+    # once the move is complete move its size between both targets if it's a inter-target move.
     if source_target != destination.target:
-        update_storage_usage(destination.target)
-        update_storage_usage(source_target)
+        size = source.storage_usage
+        update_storage_usage(destination.target, size)
+        update_storage_usage(source_target, -size)
 
     return ret
 
@@ -343,7 +344,7 @@ def osfstorage_create_child(file_node, payload, **kwargs):
         new_version = file_node.create_version(user, location, metadata)
 
         if not current_version or not current_version.is_duplicate(new_version):
-            update_storage_usage(file_node.target)
+            update_storage_usage(file_node.target, new_version.size or 0)
 
         version_id = new_version._id
         archive_exists = new_version.archive is not None
@@ -372,6 +373,7 @@ def osfstorage_delete(file_node, payload, target, **kwargs):
     if file_node == OsfStorageFolder.objects.get_root(target=target):
             raise HTTPError(http_status.HTTP_400_BAD_REQUEST)
 
+    size = file_node.storage_usage
     try:
         file_node.delete(user=user)
 
@@ -382,7 +384,7 @@ def osfstorage_delete(file_node, payload, target, **kwargs):
             'message_long': 'Cannot delete file as it is the primary file of preprint.'
         })
 
-    update_storage_usage(file_node.target)
+    update_storage_usage(file_node.target, -size)
     return {'status': 'success'}
 
 
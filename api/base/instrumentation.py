@@ -0,0 +1,270 @@
+"""Per-view request instrumentation.
+
+For a sample of requests (``API_INSTRUMENTATION_SAMPLE_RATE``), ``InstrumentationMiddleware``
+measures the total time, the number and duration of database queries, and the time spent
+serializing, embedding and running post-commit tasks, and records them in per-process
+histograms labelled with the view's ``view_fqn``. ``render_metrics`` exports them in the
+Prometheus text format. Requests slower than ``API_INSTRUMENTATION_SLOW_REQUEST_SECONDS``, or
+with more than ``API_INSTRUMENTATION_SLOW_REQUEST_QUERIES`` queries, are logged as one JSON
+line with their queries.
+
+Serializer time includes the embeds rendered within it.
+
+Post-commit tasks, of the API and of the Flask app alike, are timed per task in
+``osf_postcommit_task_seconds``. Events that are only counted, such as throttled requests,
+are kept in the counters of ``COUNTERS``.
+"""
+import json
+import logging
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import wraps
+from timeit import default_timer
+
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+
+from api.base import settings as api_settings
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# name -> (help, buckets, label)
+METRICS = OrderedDict([
+    ('osf_api_request_duration_seconds', ('Time to handle the request', TIME_BUCKETS, 'view')),
+    ('osf_api_request_queries', ('Database queries made', QUERY_BUCKETS, 'view')),
+    ('osf_api_request_db_seconds', ('Time spent in database queries', TIME_BUCKETS, 'view')),
+    ('osf_api_request_serializer_seconds', ('Time spent serializing, embeds included', TIME_BUCKETS, 'view')),
+    ('osf_api_request_embed_seconds', ('Time spent rendering embeds', TIME_BUCKETS, 'view')),
+    ('osf_api_request_postcommit_seconds', ('Time spent running post-commit tasks', TIME_BUCKETS, 'view')),
+    ('osf_postcommit_task_seconds', ('Time to run a post-commit task, or to publish the celery ones', TIME_BUCKETS, 'task')),
+])
+
+# name -> (help, label)
+COUNTERS = OrderedDict([
+    ('osf_api_throttle_hits_total', ('Requests refused by a throttle', 'scope')),
+    ('osf_varnish_bans_total', ('Varnish bans sent, failed, or merged into another ban', 'outcome')),
+    ('osf_search_updates_total', ('Search updates scheduled, or coalesced into a pending one', 'outcome')),
+])
+
+_local = threading.local()
+
+
+class Histogram(object):
+    """Counts of observations in cumulative ``le`` buckets, as in Prometheus."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf', ), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry(object):
+    """The histograms and counters of this process, keyed by metric name and label."""
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, label, value):
+        """Add ``value`` to the histogram of metric ``name`` for ``label`` (e.g. the view)."""
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(METRICS[name][1]))
+        histogram.observe(value)
+
+    def increment(self, name, label, amount=1):
+        """Add ``amount`` to the counter of metric ``name`` for ``label``."""
+        assert name in COUNTERS
+        key = (name, label)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+
+
+class RequestMetrics(object):
+    """What is measured of the request being handled by this thread."""
+    def __init__(self):
+        self.start = default_timer()
+        self.timings = dict.fromkeys(['serializer', 'embed', 'postcommit'], 0)
+        self.depths = dict.fromkeys(self.timings, 0)
+        self.query_count = 0
+        self.db_time = 0
+        self.queries = []
+
+    def record_query(self, sql, duration):
+        self.query_count += 1
+        self.db_time += duration
+        if len(self.queries) < api_settings.API_INSTRUMENTATION_MAX_CAPTURED_QUERIES:
+            self.queries.append((sql, duration))
+
+
+def current():
+    """The RequestMetrics of the request being handled by this thread, if it is sampled."""
+    return getattr(_local, 'metrics', None)
+
+
+def start_request():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def end_request():
+    metrics = current()
+    _local.metrics = None
+    return metrics
+
+
+class timed(object):
+    """Add the time spent in a block, or in calls to the decorated function, to the
+    ``name`` timing of the current request. Nested blocks of the same name count once.
+
+    Usage:
+
+        with timed('postcommit'):
+            ...
+
+        @timed('serializer')
+        def to_representation(self, obj):
+            ...
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.metrics = current()
+        if self.metrics is not None:
+            self.metrics.depths[self.name] += 1
+            if self.metrics.depths[self.name] == 1:
+                self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.metrics is not None:
+            self.metrics.depths[self.name] -= 1
+            if not self.metrics.depths[self.name]:
+                self.metrics.timings[self.name] += default_timer() - self.start
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            with timed(self.name):
+                return func(*args, **kwargs)
+        return wrapped
+
+
+class InstrumentedCursorMixin(object):
+    def execute(self, sql, params=None):
+        metrics = current()
+        if metrics is None:
+            return super(InstrumentedCursorMixin, self).execute(sql, params)
+        start = default_timer()
+        try:
+            return super(InstrumentedCursorMixin, self).execute(sql, params)
+        finally:
+            metrics.record_query(sql, default_timer() - start)
+
+    def executemany(self, sql, param_list):
+        metrics = current()
+        if metrics is None:
+            return super(InstrumentedCursorMixin, self).executemany(sql, param_list)
+        start = default_timer()
+        try:
+            return super(InstrumentedCursorMixin, self).executemany(sql, param_list)
+        finally:
+            metrics.record_query(sql, default_timer() - start)
+
+
+class InstrumentedCursorWrapper(InstrumentedCursorMixin, CursorWrapper):
+    pass
+
+
+class InstrumentedCursorDebugWrapper(InstrumentedCursorMixin, CursorDebugWrapper):
+    pass
+
+
+def instrument_connection(connection):
+    """Make the cursors of ``connection`` record their queries in the current request's metrics."""
+    if getattr(connection, 'instrumented', False):
+        return
+    connection.make_cursor = lambda cursor: InstrumentedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: InstrumentedCursorDebugWrapper(cursor, connection)
+    connection.instrumented = True
+
+
+def record(view_fqn, metrics, request, response):
+    """Add a finished request to the histograms of its view, and log it if it was slow."""
+    duration = default_timer() - metrics.start
+    registry.observe('osf_api_request_duration_seconds', view_fqn, duration)
+    registry.observe('osf_api_request_queries', view_fqn, metrics.query_count)
+    registry.observe('osf_api_request_db_seconds', view_fqn, metrics.db_time)
+    for name, value in metrics.timings.items():
+        registry.observe('osf_api_request_{}_seconds'.format(name), view_fqn, value)
+
+    if (duration >= api_settings.API_INSTRUMENTATION_SLOW_REQUEST_SECONDS or
+            metrics.query_count >= api_settings.API_INSTRUMENTATION_SLOW_REQUEST_QUERIES):
+        logger.warning(json.dumps(OrderedDict([
+            ('event', 'slow_request'),
+            ('view', view_fqn),
+            ('method', request.method),
+            ('path', request.path),
+            ('status', response.status_code),
+            ('duration', round(duration, 4)),
+            ('query_count', metrics.query_count),
+            ('db_time', round(metrics.db_time, 4)),
+            ('timings', {name: round(value, 4) for name, value in metrics.timings.items()}),
+            ('queries', [[sql, round(duration, 4)] for sql, duration in metrics.queries]),
+        ])))
+
+
+def format_label(name, value):
+    return '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def render_metrics():
+    """The histograms and counters of this process in the Prometheus text exposition format."""
+    lines = []
+    histograms = sorted(registry.histograms.items())
+    for name, (help_text, _, label_name) in METRICS.items():
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} histogram'.format(name))
+        for (metric_name, label_value), histogram in histograms:
+            if metric_name != name:
+                continue
+            label = format_label(label_name, label_value)
+            for bound, count in histogram.cumulative_counts():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, bound, count))
+            lines.append('{}_sum{{{}}} {}'.format(name, label, histogram.sum))
+            lines.append('{}_count{{{}}} {}'.format(name, label, histogram.count))
+    counters = sorted(registry.counters.items())
+    for name, (help_text, label_name) in COUNTERS.items():
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} counter'.format(name))
+        for (metric_name, label_value), value in counters:
+            if metric_name == name:
+                lines.append('{}{{{}}} {}'.format(name, format_label(label_name, label_value), value))
+    return '\n'.join(lines) + '\n'
@@ -2,9 +2,11 @@ import gc
 from io import StringIO
 import cProfile
 import pstats
+import random
 import threading
 
 from django.conf import settings
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
 from raven.contrib.django.raven_compat.models import sentry_exception_handler
 import corsheaders.middleware
@@ -18,10 +20,40 @@ from framework.celery_tasks.handlers import (
     celery_after_request,
     celery_teardown_request,
 )
+from osf.utils import permission_resolver
 from .api_globals import api_globals
+from api.base import instrumentation
 from api.base import settings as api_settings
 
 
+class InstrumentationMiddleware(MiddlewareMixin):
+    """Measure a sample of requests and record them per view; see api.base.instrumentation.
+    Goes first, so that the measurements cover the other middleware.
+    """
+    def process_request(self, request):
+        request.instrumented_view = None
+        if random.random() < api_settings.API_INSTRUMENTATION_SAMPLE_RATE:
+            for connection in connections.all():
+                instrumentation.instrument_connection(connection)
+            instrumentation.start_request()
+        else:
+            instrumentation.end_request()
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        view_class = getattr(callback, 'cls', None)
+        if getattr(view_class, 'view_category', None) and getattr(view_class, 'view_name', None):
+            request.instrumented_view = ':'.join([view_class.view_category, view_class.view_name])
+        else:
+            request.instrumented_view = request.resolver_match.view_name
+
+    def process_response(self, request, response):
+        metrics = instrumentation.end_request()
+        # Requests that matched no view are not recorded, to keep the number of labels bounded
+        if metrics is not None and getattr(request, 'instrumented_view', None):
+            instrumentation.record(request.instrumented_view, metrics, request, response)
+        return response
+
+
 class CeleryTaskMiddleware(MiddlewareMixin):
     """Celery Task middleware."""
 
@@ -104,7 +136,20 @@ class PostcommitTaskMiddleware(MiddlewareMixin):
         postcommit_before_request()
 
     def process_response(self, request, response):
-        postcommit_after_request(response=response, base_status_error_code=400)
+        with instrumentation.timed('postcommit'):
+            postcommit_after_request(response=response, base_status_error_code=400)
+        return response
+
+
+class PermissionResolverMiddleware(MiddlewareMixin):
+    """
+    Share one PermissionResolver among the permission checks of a request.
+    """
+    def process_request(self, request):
+        permission_resolver.resolver_before_request()
+
+    def process_response(self, request, response):
+        permission_resolver.resolver_teardown_request()
         return response
 
 
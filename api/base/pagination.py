@@ -1,8 +1,15 @@
+import base64
+import datetime
+import json
+
 from django.utils import six
 from collections import OrderedDict
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
 from django.core.urlresolvers import reverse
 from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
-from django.db.models import QuerySet
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.db.models.constants import LOOKUP_SEP
 
 from rest_framework import pagination
 from rest_framework.exceptions import NotFound
@@ -10,6 +17,7 @@ from rest_framework.response import Response
 from rest_framework.utils.urls import (
     replace_query_param, remove_query_param,
 )
+from api.base.exceptions import InvalidQueryStringError
 from api.base.serializers import is_anonymized
 from api.base.settings import MAX_PAGE_SIZE
 from api.base.utils import absolute_reverse
@@ -18,16 +26,182 @@ from osf.models import AbstractNode, Comment, Preprint, Guid
 from website.search.elastic_search import DOC_TYPE_TO_MODEL
 
 
+def encode_cursor(position, reverse=False):
+    def encode_value(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if value is None or isinstance(value, (bool, float) + six.integer_types + six.string_types):
+            return value
+        return six.text_type(value)
+
+    raw = json.dumps({'p': [encode_value(value) for value in position], 'r': reverse})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the position and direction of an opaque cursor; the empty cursor is the first page."""
+    if not cursor:
+        return None, False
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return list(data['p']), bool(data['r'])
+    except (TypeError, ValueError, KeyError):
+        raise NotFound('Invalid cursor.')
+
+
+def estimate_count(queryset):
+    """Number of rows the query planner expects ``queryset`` to return. Far cheaper than
+    a COUNT(*) over a large table, at the cost of being approximate.
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPaginator(object):
+    """Paginates a queryset by the values of its sort keys instead of by offset, so that
+    every page costs the same no matter how deep it is and no COUNT(*) is needed.
+
+    Pages are addressed by opaque cursors holding the sort keys of the row a page
+    starts after (or, for previous pages, before). The primary key is appended to the
+    ordering to make it total.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.per_page = per_page
+        self.ordering = self.get_ordering(queryset)
+        self.queryset = queryset.order_by(*[
+            '{}{}'.format('-' if descending else '', lookup) for lookup, descending, nullable in self.ordering
+        ])
+        self.has_next = self.has_previous = False
+        self.next_cursor = self.previous_cursor = None
+
+    def get_ordering(self, queryset):
+        """Return the ordering of ``queryset`` as (lookup, descending, nullable) tuples."""
+        unsupported = InvalidQueryStringError(
+            parameter='page[cursor]',
+            detail='Cursor pagination is not supported for this ordering.',
+        )
+        query = queryset.query
+        if query.extra_order_by:
+            raise unsupported
+
+        ordering = []
+        for order in query.order_by or (queryset.model._meta.ordering if query.default_ordering else []):
+            if not isinstance(order, six.string_types) or order == '?' or '.' in order:
+                raise unsupported
+            descending = order.startswith('-')
+            lookup = order.lstrip('-')
+            if lookup in query.annotations:
+                nullable = True
+            else:
+                field = self.get_field(queryset.model, lookup)
+                if field is None:
+                    raise unsupported
+                nullable = field.null or LOOKUP_SEP in lookup
+                if field.primary_key and LOOKUP_SEP not in lookup:
+                    lookup = 'pk'
+            ordering.append((lookup, descending, nullable))
+
+        if not any(lookup == 'pk' for lookup, descending, nullable in ordering):
+            ordering.append(('pk', False, False))
+        return ordering
+
+    def get_field(self, model, lookup):
+        """Return the concrete field ``lookup`` ends at, or None if it does not end at one."""
+        field = None
+        for part in lookup.split(LOOKUP_SEP):
+            if field is not None:
+                if not field.is_relation:
+                    return None
+                model = field.related_model
+            try:
+                field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+        if field.is_relation:
+            return None
+        return field
+
+    def get_position(self, obj):
+        position = []
+        for lookup, descending, nullable in self.ordering:
+            value = obj
+            for part in lookup.split(LOOKUP_SEP):
+                value = getattr(value, part, None)
+            position.append(value)
+        return position
+
+    def get_filter(self, ordering, position):
+        """Return a Q matching the rows that sort after ``position`` in ``ordering``.
+        Postgres sorts NULLs as larger than any value.
+        """
+        query = None
+        equal = Q()
+        for (lookup, descending, nullable), value in zip(ordering, position):
+            if value is None:
+                after = Q(**{lookup + '__isnull': False}) if descending else None
+                same = Q(**{lookup + '__isnull': True})
+            else:
+                after = Q(**{'{}__{}'.format(lookup, 'lt' if descending else 'gt'): value})
+                if nullable and not descending:
+                    after |= Q(**{lookup + '__isnull': True})
+                same = Q(**{lookup: value})
+            if after is not None:
+                query = equal & after if query is None else query | (equal & after)
+            equal &= same
+        return query
+
+    def page(self, cursor):
+        position, reverse = decode_cursor(cursor)
+        if position is not None and len(position) != len(self.ordering):
+            raise NotFound('Invalid cursor.')
+
+        queryset = self.queryset
+        ordering = self.ordering
+        if reverse:
+            queryset = queryset.reverse()
+            ordering = [(lookup, not descending, nullable) for lookup, descending, nullable in ordering]
+        if position is not None:
+            queryset = queryset.filter(self.get_filter(ordering, position))
+
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if reverse:
+            items.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if self.has_next:
+            self.next_cursor = encode_cursor(self.get_position(items[-1])) if items else ''
+        if self.has_previous and items:
+            self.previous_cursor = encode_cursor(self.get_position(items[0]), reverse=True)
+        return items
+
+
 class JSONAPIPagination(pagination.PageNumberPagination):
     """
     Custom paginator that formats responses in a JSON-API compatible format.
 
     Properly handles pagination of embedded objects.
 
+    Passing ``page[cursor]`` (empty for the first page) switches a list to keyset pagination,
+    see `KeysetPaginator`; its meta total is then the query planner's estimate.
     """
 
     page_size_query_param = 'page[size]'
+    cursor_query_param = 'page[cursor]'
     max_page_size = MAX_PAGE_SIZE
+    keyset_paginator = None
 
     def page_number_query(self, url, page_number):
         """
@@ -68,7 +242,37 @@ class JSONAPIPagination(pagination.PageNumberPagination):
         page_number = self.page.next_page_number()
         return self.page_number_query(url, page_number)
 
+    def cursor_query(self, url, cursor):
+        """
+        Builds uri and adds cursor param.
+        """
+        url = remove_query_param(self.request.build_absolute_uri(url), '_')
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_keyset_links(self, url):
+        paginator = self.keyset_paginator
+        return OrderedDict([
+            ('self', self.cursor_query(url, self.request.query_params.get(self.cursor_query_param, ''))),
+            ('first', self.cursor_query(url, '')),
+            ('last', None),
+            ('prev', self.cursor_query(url, paginator.previous_cursor) if paginator.previous_cursor is not None else None),
+            ('next', self.cursor_query(url, paginator.next_cursor) if paginator.next_cursor is not None else None),
+        ])
+
+    def get_keyset_meta(self):
+        return OrderedDict([
+            ('total', estimate_count(self.keyset_paginator.queryset)),
+            ('total_is_estimate', True),
+            ('per_page', self.keyset_paginator.per_page),
+        ])
+
     def get_response_dict_deprecated(self, data, url):
+        if self.keyset_paginator is not None:
+            links = self.get_keyset_links(url)
+            links.pop('self')
+            links['meta'] = self.get_keyset_meta()
+            return OrderedDict([('data', data), ('links', links)])
         return OrderedDict([
             ('data', data),
             (
@@ -88,6 +292,12 @@ class JSONAPIPagination(pagination.PageNumberPagination):
         ])
 
     def get_response_dict(self, data, url):
+        if self.keyset_paginator is not None:
+            return OrderedDict([
+                ('data', data),
+                ('meta', self.get_keyset_meta()),
+                ('links', self.get_keyset_links(url)),
+            ])
         return OrderedDict([
             ('data', data),
             (
@@ -164,6 +374,19 @@ class JSONAPIPagination(pagination.PageNumberPagination):
             self.request = request
             return list(self.page)
 
+        elif self.cursor_query_param in request.query_params:
+            if not isinstance(queryset, QuerySet):
+                raise InvalidQueryStringError(
+                    parameter=self.cursor_query_param,
+                    detail='Cursor pagination is not supported for this endpoint.',
+                )
+            page_size = self.get_page_size(request)
+            if not page_size:
+                return None
+            self.keyset_paginator = KeysetPaginator(queryset, page_size)
+            self.request = request
+            return self.keyset_paginator.page(request.query_params[self.cursor_query_param])
+
         else:
             return super(JSONAPIPagination, self).paginate_queryset(queryset, request, view=None)
 
@@ -220,8 +443,13 @@ class NodeContributorPagination(JSONAPIPagination):
         response = super(NodeContributorPagination, self).get_paginated_response(data)
         response_dict = response.data
         kwargs = self.request.parser_context['kwargs'].copy()
-        node = self.get_resource(kwargs)
-        total_bibliographic = node.visible_contributors.count()
+        prefetched = getattr(self.request.parser_context['view'], 'prefetched_contributors', None)
+        if prefetched is not None:
+            # An embedded page already holds every contributor of its node
+            total_bibliographic = len([contributor for contributor in prefetched if contributor.visible])
+        else:
+            node = self.get_resource(kwargs)
+            total_bibliographic = node.visible_contributors.count()
         if self.request.version < '2.1':
             response_dict['links']['meta']['total_bibliographic'] = total_bibliographic
         else:
@@ -13,6 +13,7 @@ from rest_framework.fields import SkipField
 from rest_framework.fields import get_attribute as get_nested_attributes
 from rest_framework.mixins import RetrieveModelMixin
 
+from api.base import instrumentation
 from api.base import utils
 from osf.utils import permissions as osf_permissions
 from osf.utils import sanitize
@@ -665,11 +666,11 @@ class RelationshipField(ser.HyperlinkedIdentityField):
                 field_counts_requested = self.process_related_counts_parameters(show_related_counts, value)
 
                 if utils.is_truthy(show_related_counts):
-                    meta[key] = functional.rapply(meta_data[key], _url_val, obj=value, serializer=self.parent, request=self.context['request'])
+                    meta[key] = self.get_related_count(meta_data[key], value)
                 elif utils.is_falsy(show_related_counts):
                     continue
                 elif self.field_name in field_counts_requested:
-                    meta[key] = functional.rapply(meta_data[key], _url_val, obj=value, serializer=self.parent, request=self.context['request'])
+                    meta[key] = self.get_related_count(meta_data[key], value)
                 else:
                     continue
             elif key == 'projects_in_common':
@@ -682,6 +683,16 @@ class RelationshipField(ser.HyperlinkedIdentityField):
                 meta[key] = functional.rapply(meta_data[key], _url_val, obj=value, serializer=self.parent, request=self.context['request'])
         return meta
 
+    def get_related_count(self, meta_value, value):
+        """
+        Returns the count annotated on the object by `JSONAPISerializer.prefetch_related_counts` if
+        there is one, otherwise computes it.
+        """
+        prefetched = getattr(value, '_related_counts', None) or {}
+        if isinstance(meta_value, str) and meta_value in prefetched:
+            return prefetched[meta_value]
+        return functional.rapply(meta_value, _url_val, obj=value, serializer=self.parent, request=self.context['request'])
+
     def lookup_attribute(self, obj, lookup_field):
         """
         Returns attribute from target object unless attribute surrounded in angular brackets where it returns the lookup field.
@@ -1153,6 +1164,7 @@ class NodeFileHyperLinkField(RelationshipField):
 
 
 class JSONAPIListSerializer(ser.ListSerializer):
+    @instrumentation.timed('serializer')
     def to_representation(self, data):
         enable_esi = self.context.get('enable_esi', False)
         envelope = self.context.update({'envelope': None})
@@ -1168,6 +1180,13 @@ class JSONAPIListSerializer(ser.ListSerializer):
                 self.child.to_esi_representation(item, envelope=None) for item in data
             ]
         else:
+            # Let each embed and related count load what the whole page needs at once rather than per item
+            data = list(data)
+            for embed in self.context.get('embed', {}).values():
+                if getattr(embed, 'prefetch', None):
+                    embed.prefetch(data)
+            if getattr(self.child, 'prefetch_related_counts', None):
+                self.child.prefetch_related_counts(data)
             ret = [
                 self.child.to_representation(item, envelope=envelope) for item in data
             ]
@@ -1245,6 +1264,11 @@ class JSONAPIListSerializer(ser.ListSerializer):
         return ret
 
 
+# How `JSONAPISerializer.to_representation` renders each field, see `JSONAPISerializer.get_field_plan`
+SerializerPlan = collections.namedtuple('SerializerPlan', ['context', 'type_', 'is_anonymous', 'enable_esi', 'fields'])
+FieldPlan = collections.namedtuple('FieldPlan', ['field', 'relation', 'is_relationship', 'is_link', 'embed', 'hidden'])
+
+
 class SparseFieldsetMixin(object):
     def parse_sparse_fields(self, allow_unsafe=False, **kwargs):
         request = kwargs.get('context', {}).get('request', None)
@@ -1301,6 +1325,43 @@ class JSONAPISerializer(BaseAPISerializer):
         )
         return invalid_embeds
 
+    def get_related_counts_annotations(self):
+        """Return expressions computing related counts, keyed by the name of the serializer
+        method that computes the same count for a single object.
+        """
+        return {}
+
+    def prefetch_related_counts(self, objs):
+        """Annotate the related counts requested by `related_counts` for a page of objects in a
+        single query. `RelationshipField` reads them back instead of calling the count method of
+        every object.
+        """
+        request = self.context['request']
+        show_related_counts = request.query_params.get('related_counts', False)
+        if not objs or utils.is_falsy(show_related_counts) or (request.parser_context.get('kwargs') or {}).get('is_embedded'):
+            return
+        annotations = self.get_related_counts_annotations()
+        if not annotations:
+            return
+
+        field_counts_requested = None if utils.is_truthy(show_related_counts) else show_related_counts.split(',')
+        selected = {}
+        for field_name, field in self.fields.items():
+            related_meta = getattr(getattr(field, 'field', None) or field, 'related_meta', None) or {}
+            count_method = related_meta.get('count')
+            if count_method in annotations and (field_counts_requested is None or field_name in field_counts_requested):
+                selected[count_method] = annotations[count_method]
+        if not selected:
+            return
+
+        model = type(objs[0])._meta.concrete_model
+        counts = {
+            row.pop('pk'): row for row in
+            model.objects.filter(pk__in=[obj.pk for obj in objs]).annotate(**selected).values('pk', *selected.keys())
+        }
+        for obj in objs:
+            obj._related_counts = counts.get(obj.pk)
+
     def to_esi_representation(self, data, envelope='data'):
         href = None
         query_params_blacklist = ['page[size]']
@@ -1335,32 +1396,21 @@ class JSONAPISerializer(BaseAPISerializer):
         return getattr(field, 'child_relation', field)
 
     # overrides Serializer
-    def to_representation(self, obj, envelope='data'):
-        """Serialize to final representation.
-
-        :param obj: Object to be serialized.
-        :param envelope: Key for resource object.
+    def get_field_plan(self):
+        """Work out what to serialize for the current context: sparse fieldsets, anonymized and
+        embedded fields and how each field is rendered. Computed once and reused for every object
+        serialized with the same context, e.g. every item of a list page.
         """
-        ret = {}
+        plan = getattr(self, '_field_plan', None)
+        if plan is not None and plan.context is self.context:
+            return plan
+
         request = self.context.get('request')
         type_ = get_meta_type(self, request)
         assert type_ is not None, 'Must define Meta.type_ or Meta.get_type()'
         self.parse_sparse_fields(allow_unsafe=True, context=self.context)
 
-        data = {
-            'id': '',
-            'type': type_,
-            'attributes': {},
-            'relationships': {},
-            'embeds': {},
-            'links': {},
-        }
-
         embeds = self.context.get('embed', {})
-        context_envelope = self.context.get('envelope', envelope)
-        if context_envelope == 'None':
-            context_envelope = None
-        enable_esi = self.context.get('enable_esi', False)
         is_anonymous = is_anonymized(self.context['request'])
         to_be_removed = set()
         if is_anonymous and hasattr(self, 'non_anonymized_fields'):
@@ -1384,19 +1434,67 @@ class JSONAPISerializer(BaseAPISerializer):
                 ),
             )
 
+        field_plans = []
         for field in fields:
             nested_field = self.get_unwrapped_field(field)
+            field_plans.append(FieldPlan(
+                field=field,
+                relation=field.child_relation if hasattr(field, 'child_relation') else field,
+                is_relationship=isinstance(nested_field, RelationshipField),
+                is_link=bool(getattr(field, 'json_api_link', False) or getattr(nested_field, 'json_api_link', False)),
+                # If embed=field_name is appended to the query string or 'always_embed' flag is True, directly embed the
+                # results in addition to adding a relationship link
+                embed=bool(embeds and (field.field_name in embeds or getattr(field, 'always_embed', None))),
+                hidden=bool(
+                    is_anonymous and
+                    hasattr(field, 'view_name') and
+                    field.view_name in self.views_to_hide_if_anonymous,
+                ),
+            ))
+
+        self._field_plan = SerializerPlan(
+            context=self.context,
+            type_=type_,
+            is_anonymous=is_anonymous,
+            enable_esi=self.context.get('enable_esi', False),
+            fields=field_plans,
+        )
+        return self._field_plan
+
+    @instrumentation.timed('serializer')
+    def to_representation(self, obj, envelope='data'):
+        """Serialize to final representation.
+
+        :param obj: Object to be serialized.
+        :param envelope: Key for resource object.
+        """
+        ret = {}
+        plan = self.get_field_plan()
+
+        data = {
+            'id': '',
+            'type': plan.type_,
+            'attributes': {},
+            'relationships': {},
+            'embeds': {},
+            'links': {},
+        }
+
+        context_envelope = self.context.get('envelope', envelope)
+        if context_envelope == 'None':
+            context_envelope = None
+        is_anonymous = plan.is_anonymous
+
+        for field_plan in plan.fields:
+            field = field_plan.field
             try:
-                if hasattr(field, 'child_relation'):
-                    attribute = field.child_relation.get_attribute(obj)
-                else:
-                    attribute = field.get_attribute(obj)
+                attribute = field_plan.relation.get_attribute(obj)
             except SkipField:
                 continue
             if attribute is None:
                 # We skip `to_representation` for `None` values so that
                 # fields do not have to explicitly deal with that case.
-                if isinstance(nested_field, RelationshipField):
+                if field_plan.is_relationship:
                     # if this is a RelationshipField, serialize as a null relationship
                     data['relationships'][field.field_name] = {'data': None}
                 else:
@@ -1404,23 +1502,15 @@ class JSONAPISerializer(BaseAPISerializer):
                     data['attributes'][field.field_name] = None
             else:
                 try:
-                    if hasattr(field, 'child_relation'):
-                        if hasattr(attribute, 'all'):
-                            representation = field.child_relation.to_representation(attribute.all())
-                        else:
-                            representation = field.child_relation.to_representation(attribute)
+                    if hasattr(attribute, 'all'):
+                        representation = field_plan.relation.to_representation(attribute.all())
                     else:
-                        if hasattr(attribute, 'all'):
-                            representation = field.to_representation(attribute.all())
-                        else:
-                            representation = field.to_representation(attribute)
+                        representation = field_plan.relation.to_representation(attribute)
                 except SkipField:
                     continue
-                if getattr(field, 'json_api_link', False) or getattr(nested_field, 'json_api_link', False):
-                    # If embed=field_name is appended to the query string or 'always_embed' flag is True, directly embed the
-                    # results in addition to adding a relationship link
-                    if embeds and (field.field_name in embeds or getattr(field, 'always_embed', None)):
-                        if enable_esi:
+                if field_plan.is_link:
+                    if field_plan.embed:
+                        if plan.enable_esi:
                             try:
                                 result = field.to_esi_representation(attribute, envelope=envelope)
                             except SkipField:
@@ -1436,15 +1526,8 @@ class JSONAPISerializer(BaseAPISerializer):
                             data['embeds'][field.field_name] = result
                         else:
                             data['embeds'][field.field_name] = {'error': 'This field is not embeddable.'}
-                    try:
-                        if not (
-                            is_anonymous and
-                            hasattr(field, 'view_name') and
-                                field.view_name in self.views_to_hide_if_anonymous
-                        ):
-                            data['relationships'][field.field_name] = representation
-                    except SkipField:
-                        continue
+                    if not field_plan.hidden:
+                        data['relationships'][field.field_name] = representation
                 elif field.field_name == 'id':
                     data['id'] = representation
                 elif field.field_name == 'links':
@@ -180,7 +180,7 @@ REST_FRAMEWORK = {
         'api.base.authentication.drf.OSFCASAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.UserRateThrottle',
+        'api.base.throttling.UserRateThrottle',
         'api.base.throttling.NonCookieAuthThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
@@ -209,9 +209,11 @@ CORS_ALLOW_CREDENTIALS = True
 ORIGINS_WHITELIST = ()
 
 MIDDLEWARE = (
+    'api.base.middleware.InstrumentationMiddleware',
     'api.base.middleware.DjangoGlobalMiddleware',
     'api.base.middleware.CeleryTaskMiddleware',
     'api.base.middleware.PostcommitTaskMiddleware',
+    'api.base.middleware.PermissionResolverMiddleware',
     # A profiling middleware. ONLY FOR DEV USE
     # Uncomment and add "prof" to url params to recieve a profile for that url
     # 'api.base.middleware.ProfileMiddleware',
@@ -301,6 +303,16 @@ NPLUSONE_RAISE = False
 # salt used for generating hashids
 HASHIDS_SALT = 'pinkhimalayan'
 
+# Per-view request instrumentation (see api.base.instrumentation)
+# Fraction of requests measured
+API_INSTRUMENTATION_SAMPLE_RATE = 1.0
+# Measured requests at least this slow, or making at least this many queries, are logged with their queries
+API_INSTRUMENTATION_SLOW_REQUEST_SECONDS = 2.0
+API_INSTRUMENTATION_SLOW_REQUEST_QUERIES = 250
+API_INSTRUMENTATION_MAX_CAPTURED_QUERIES = 500
+# Bearer token required by the metrics endpoint at /_/instrumentation/; unset to disable it
+API_INSTRUMENTATION_METRICS_TOKEN = None
+
 # django-elasticsearch-metrics
 ELASTICSEARCH_DSL = {
     'default': {
@@ -313,6 +325,9 @@ ELASTICSEARCH_METRICS_DATE_FORMAT = '%Y'
 
 WAFFLE_CACHE_NAME = 'waffle_cache'
 STORAGE_USAGE_CACHE_NAME = 'storage_usage'
+SEARCH_UPDATE_CACHE_NAME = 'search_update'
+SESSION_CACHE_NAME = 'session'
+THROTTLE_CACHE_NAME = 'throttle'
 
 
 CACHES = {
@@ -323,7 +338,34 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'osf_cache_table',
     },
+    SEARCH_UPDATE_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_search_update_cache_table',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
     WAFFLE_CACHE_NAME: {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     },
+    # Read-through cache in front of osf.Session. Sessions are only cached when this is a shared
+    # backend (e.g. redis), so that logging out is seen by every process at once.
+    SESSION_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'osf_session_cache',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Rate limiter state, one number per throttled client and scope (see api.base.throttling).
+    # Limits are only shared between processes that share this cache, so point it at a backend
+    # with an atomic incr (e.g. redis or memcached) in production.
+    THROTTLE_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'osf_throttle_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
@@ -1,13 +1,32 @@
+from django.conf import settings as django_settings
+from django.core.cache import caches
 from rest_framework import permissions
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle, SimpleRateThrottle
+from rest_framework import throttling
 import logging
 
+from api.base import instrumentation
 from api.base import settings
 
 logger = logging.getLogger(__name__)
 
 
-class BaseThrottle(SimpleRateThrottle):
+class BaseThrottle(throttling.SimpleRateThrottle):
+    """Rate limit with the generic cell rate algorithm (GCRA), a token bucket kept as a single
+    number per key: the theoretical arrival time (TAT) of the next request, in milliseconds.
+
+    Requests are spaced ``duration / num_requests`` apart and may burst up to ``num_requests``
+    at once. A request is allowed unless it comes more than ``duration`` minus one interval
+    before the TAT. The TAT is advanced with the cache's atomic ``incr``, so the limit holds
+    across workers sharing the throttle cache.
+    """
+
+    def __init__(self):
+        super(BaseThrottle, self).__init__()
+        self.wait_time = None
+
+    @property
+    def cache(self):
+        return caches[django_settings.THROTTLE_CACHE_NAME]
 
     def get_ident(self, request):
         if request.META.get('HTTP_X_THROTTLE_TOKEN'):
@@ -29,19 +48,56 @@ class BaseThrottle(SimpleRateThrottle):
         if self.key is None:
             return True
 
-        self.history = self.cache.get(self.key, [])
-        self.now = self.timer()
-
-        # Drop any requests from the history which have now passed the throttle duration
-        while self.history and self.history[-1] <= self.now - self.duration:
-            self.history.pop()
-
-        if len(self.history) >= self.num_requests:
+        interval = int(self.duration * 1000 // self.num_requests)
+        # Keys outlive the longest a TAT can be ahead of now, and are refreshed while in use
+        timeout = self.duration * 2
+        now = int(self.timer() * 1000)
+
+        if self.cache.add(self.key, now + interval, timeout):
+            return self.throttle_success()
+        try:
+            tat = self.cache.incr(self.key, interval)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.set(self.key, now + interval, timeout)
+            return self.throttle_success()
+
+        if tat - interval < now:
+            # Idle for longer than it takes to refill, restart from now
+            self.cache.set(self.key, now + interval, timeout)
+            return self.throttle_success()
+
+        allowed_at = tat - interval - (self.duration * 1000 - interval)
+        if allowed_at > now:
+            # Don't let refused requests push back the TAT
+            self.cache.decr(self.key, interval)
+            self.wait_time = (allowed_at - now) / 1000.0
             return self.throttle_failure()
+
+        if self.cache.add('{}:refresh'.format(self.key), True, self.duration):
+            self.cache.set(self.key, tat, timeout)
         return self.throttle_success()
 
+    def throttle_success(self):
+        return True
+
+    def throttle_failure(self):
+        instrumentation.registry.increment('osf_api_throttle_hits_total', self.scope)
+        return False
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserRateThrottle(BaseThrottle, throttling.UserRateThrottle):
+    pass
+
+
+class AnonRateThrottle(BaseThrottle, throttling.AnonRateThrottle):
+    pass
+
 
-class NonCookieAuthThrottle(BaseThrottle, AnonRateThrottle):
+class NonCookieAuthThrottle(AnonRateThrottle):
 
     scope = 'non-cookie-auth'
 
@@ -55,7 +111,7 @@ class NonCookieAuthThrottle(BaseThrottle, AnonRateThrottle):
         return super(NonCookieAuthThrottle, self).allow_request(request, view)
 
 
-class AddContributorThrottle(BaseThrottle, UserRateThrottle):
+class AddContributorThrottle(UserRateThrottle):
 
     scope = 'add-contributor'
 
@@ -69,7 +125,7 @@ class AddContributorThrottle(BaseThrottle, UserRateThrottle):
         return super(AddContributorThrottle, self).allow_request(request, view)
 
 
-class CreateGuidThrottle(BaseThrottle, UserRateThrottle):
+class CreateGuidThrottle(UserRateThrottle):
 
     scope = 'create-guid'
 
@@ -88,17 +144,17 @@ class RootAnonThrottle(AnonRateThrottle):
     scope = 'root-anon-throttle'
 
 
-class TestUserRateThrottle(BaseThrottle, UserRateThrottle):
+class TestUserRateThrottle(UserRateThrottle):
 
     scope = 'test-user'
 
 
-class TestAnonRateThrottle(BaseThrottle, AnonRateThrottle):
+class TestAnonRateThrottle(AnonRateThrottle):
 
     scope = 'test-anon'
 
 
-class SendEmailThrottle(BaseThrottle, UserRateThrottle):
+class SendEmailThrottle(UserRateThrottle):
 
     scope = 'send-email'
 
@@ -22,6 +22,7 @@ urlpatterns = [
                 url(r'^chronos/', include('api.chronos.urls', namespace='chronos')),
                 url(r'^meetings/', include('api.meetings.urls', namespace='meetings')),
                 url(r'^metrics/', include('api.metrics.urls', namespace='metrics')),
+                url(r'^instrumentation/$', views.instrumentation_metrics, name='instrumentation-metrics'),
             ],
         ),
     ),
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 from past.builtins import basestring
 import furl
+import re
 from future.moves.urllib.parse import urlunsplit, urlsplit, parse_qs, urlencode
 from distutils.version import StrictVersion
 from hashids import Hashids
 
+from django.utils import six
 from django.utils.http import urlquote
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import QuerySet, F
+from django.core.urlresolvers import NoReverseMatch, get_script_prefix, get_urlconf
+from django.db.models import Count, F, IntegerField, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework.exceptions import NotFound
 from rest_framework.reverse import reverse
 
@@ -33,6 +37,10 @@ UPDATE_METHODS = ['PUT', 'PATCH']
 
 hashids = Hashids(alphabet='abcdefghijklmnopqrstuvwxyz', salt=HASHIDS_SALT)
 
+# URL kwarg values that can be filled into a cached URL template, see `cached_reverse`
+TEMPLATE_KWARG_VALUE = re.compile(r'^[A-Za-z0-9_]+$')
+_reverse_templates = {}
+
 def decompose_field(field):
     from api.base.serializers import (
         HideIfWithdrawal, HideIfRegistration,
@@ -73,9 +81,44 @@ def get_user_auth(request):
     return auth
 
 
+def cached_reverse(view_name, kwargs=None):
+    """Like django's `reverse`, but the URL is resolved once per view, version and set of kwarg names
+    into a template that is filled in for later calls. Serializers reverse the same few views for
+    every object of a page.
+
+    Only plain ASCII word values, like guids and ids, are filled into templates; any other value
+    goes through `reverse`.
+    """
+    kwargs = kwargs or {}
+    names = sorted(name for name in kwargs.keys() if name != 'version')
+    if not all(TEMPLATE_KWARG_VALUE.match(six.text_type(kwargs[name])) for name in names):
+        return reverse(view_name, kwargs=kwargs)
+
+    key = (get_urlconf(), get_script_prefix(), view_name, 'version' in kwargs, kwargs.get('version'), tuple(names))
+    placeholders = ['Zq{}X9'.format(index) for index in range(len(names))]
+    if key not in _reverse_templates:
+        template_kwargs = dict(zip(names, placeholders))
+        if 'version' in kwargs:
+            template_kwargs['version'] = kwargs['version']
+        try:
+            template = reverse(view_name, kwargs=template_kwargs)
+        except NoReverseMatch:
+            # The URL pattern does not accept the placeholders, don't template it
+            template = None
+        if template is not None and not all(template.count(placeholder) == 1 for placeholder in placeholders):
+            template = None
+        _reverse_templates[key] = template
+
+    template = _reverse_templates[key]
+    if template is None:
+        return reverse(view_name, kwargs=kwargs)
+    for name, placeholder in zip(names, placeholders):
+        template = template.replace(placeholder, six.text_type(kwargs[name]))
+    return template
+
 def absolute_reverse(view_name, query_kwargs=None, args=None, kwargs=None):
     """Like django's `reverse`, except returns an absolute URL. Also add query parameters."""
-    relative_url = reverse(view_name, kwargs=kwargs)
+    relative_url = cached_reverse(view_name, kwargs=kwargs)
 
     url = website_util.api_v2_url(relative_url, params=query_kwargs, base_prefix='')
     return url
@@ -143,6 +186,13 @@ def get_object_or_error(model_or_qs, query_or_pk=None, request=None, display_nam
             raise Gone(detail='The requested {name} is no longer available.'.format(name=display_name))
     return obj
 
+def count_subquery(queryset, outer_field):
+    """Return an expression counting the rows of ``queryset`` whose ``outer_field`` points at the
+    outer row, for annotating counts without joining (and multiplying) the outer rows.
+    """
+    counts = queryset.filter(**{outer_field: OuterRef('pk')}).order_by().values(outer_field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
 def default_node_list_queryset(model_cls):
     assert model_cls in {Node, Registration}
     return model_cls.objects.filter(is_deleted=False).annotate(region=F('addons_osfstorage_node_settings__region___id'))
@@ -7,7 +7,8 @@ from django_bulk_update.helper import bulk_update
 from django.conf import settings as django_settings
 from django.db import transaction
 from django.db.models import F, Q
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
 from django.contrib.contenttypes.models import ContentType
 from rest_framework import generics
 from rest_framework import permissions as drf_permissions
@@ -17,7 +18,9 @@ from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.mixins import ListModelMixin
 from rest_framework.response import Response
 
+from api.base import instrumentation
 from api.base import permissions as base_permissions
+from api.base import settings as api_settings
 from api.base import utils
 from api.base.exceptions import RelationshipPostMakesNoChanges, InvalidFilterValue, InvalidFilterOperator
 from api.base.filters import ListFilterMixin
@@ -64,18 +67,17 @@ class JSONAPIBaseView(generics.GenericAPIView):
         if getattr(field, 'field', None):
             field = field.field
 
-        def partial(item):
+        if not hasattr(self.request._request, '_embed_cache'):
+            self.request._request._embed_cache = {}
+        cache = self.request._request._embed_cache
+
+        def build_view(item):
             # resolve must be implemented on the field
             v, view_args, view_kwargs = field.resolve(item, field_name, self.request)
             if not v:
-                return None
+                return None, None
 
             request = EmbeddedRequest(self.request)
-
-            if not hasattr(request._request, '_embed_cache'):
-                request._request._embed_cache = {}
-            cache = request._request._embed_cache
-
             request.parents.setdefault(type(item), {})[item._id] = item
 
             view_kwargs.update({
@@ -91,6 +93,38 @@ class JSONAPIBaseView(generics.GenericAPIView):
             view.request = request
             view.request.parser_context['kwargs'] = view_kwargs
             view.format_kwarg = view.get_format_suffix(**view_kwargs)
+            return v, view
+
+        @instrumentation.timed('embed')
+        def prefetch(items):
+            """Build the embedded views of a page of items up front and let each view class
+            load what its views need in bulk (see `prefetch_embedded_views`), instead of one
+            view at a time as `partial` is called for every item.
+            """
+            views_by_class = defaultdict(list)
+            for item in items:
+                try:
+                    v, view = build_view(item)
+                except Exception:
+                    # Left to `partial`, which surfaces the error exactly as before
+                    continue
+                if not v:
+                    continue
+                cache[('embed_view', field_name, type(item), item.id)] = (v, view)
+                views_by_class[v.cls].append(view)
+
+            for view_class, views in views_by_class.items():
+                prefetch_views = getattr(view_class, 'prefetch_embedded_views', None)
+                if prefetch_views:
+                    prefetch_views(views)
+
+        @instrumentation.timed('embed')
+        def partial(item):
+            prefetched = cache.pop(('embed_view', field_name, type(item), item.id), None)
+            v, view = prefetched or build_view(item)
+            if not v:
+                return None
+            request = view.request
 
             if not isinstance(view, ListModelMixin):
                 try:
@@ -136,6 +170,7 @@ class JSONAPIBaseView(generics.GenericAPIView):
 
             return ret
 
+        partial.prefetch = prefetch
         return partial
 
     def get_serializer_context(self):
@@ -448,6 +483,16 @@ def status_check(request, format=None, **kwargs):
     })
 
 
+def instrumentation_metrics(request):
+    """Per-view histograms of this process, for Prometheus to scrape with the
+    API_INSTRUMENTATION_METRICS_TOKEN bearer token.
+    """
+    token = api_settings.API_INSTRUMENTATION_METRICS_TOKEN
+    if not token or not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {}'.format(token)):
+        return error_404(request)
+    return HttpResponse(instrumentation.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def error_404(request, format=None, *args, **kwargs):
     return JsonResponse(
         {'errors': [{'detail': 'Not found.'}]},
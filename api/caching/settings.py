@@ -2,3 +2,8 @@ NEVER_TIMEOUT = None  # for django caches setting None as a timeout value means
 FIVE_MIN_TIMEOUT = 60 * 5
 
 STORAGE_USAGE_KEY = 'storage_usage:{target_id}'
+
+# Varnish BAN pipeline
+BAN_TIMEOUT = 0.3  # 300ms timeout for bans
+BAN_POOL_SIZE = 10  # keep-alive connections per varnish server
+BAN_MAX_PATTERN_LENGTH = 2000  # keep merged ban regexes below common request-line limits
@@ -2,10 +2,19 @@ from future.moves.urllib.parse import urlparse
 
 import requests
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from gevent.pool import Pool
+
+from datetime import timedelta
 
 from django.apps import apps
+from api.base import instrumentation
 from api.caching.utils import storage_usage_cache
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.utils import timezone
 from framework.postcommit_tasks.handlers import enqueue_postcommit_task
 
 from api.caching import settings as cache_settings
@@ -14,108 +23,317 @@ from website import settings
 
 logger = logging.getLogger(__name__)
 
+_local = threading.local()
+_ban_sessions = {}
+_sessions_lock = threading.Lock()
+
 
 def get_varnish_servers():
     #  TODO: this should get the varnish servers from HAProxy or a setting
     return settings.VARNISH_SERVERS
 
 
-def get_bannable_urls(instance):
+def get_bannable_paths(instance):
+    """Return the API paths that should be banned when ``instance`` changes,
+    along with the hostname varnish caches them under.
+    """
     from osf.models import Comment
-    bannable_urls = []
-    parsed_absolute_url = {}
 
     if not hasattr(instance, 'absolute_api_v2_url'):
         logger.warning('Tried to ban {}:{} but it didn\'t have a absolute_api_v2_url method'.format(instance.__class__, instance))
         return [], ''
 
-    for host in get_varnish_servers():
-        # add instance url
-        varnish_parsed_url = urlparse(host)
-        parsed_absolute_url = urlparse(instance.absolute_api_v2_url)
-        url_string = '{scheme}://{netloc}{path}.*'.format(
+    parsed_absolute_url = urlparse(instance.absolute_api_v2_url)
+    bannable_paths = [parsed_absolute_url.path]
+    if isinstance(instance, Comment):
+        try:
+            bannable_paths.append(urlparse(instance.target.referent.absolute_api_v2_url).path)
+        except AttributeError:
+            # some referents don't have an absolute_api_v2_url
+            # I'm looking at you NodeWikiPage
+            # Note: NodeWikiPage has been deprecated. Is this an issue with WikiPage/WikiVersion?
+            pass
+
+        try:
+            bannable_paths.append(urlparse(instance.root_target.referent.absolute_api_v2_url).path)
+        except AttributeError:
+            # some root_targets don't have an absolute_api_v2_url
+            pass
+
+    return bannable_paths, parsed_absolute_url.hostname
+
+
+class PendingBans(object):
+    """Paths waiting to be banned, by hostname.
+
+    The object itself is handed to the postcommit task that sends the bans, which runs in
+    another greenlet than the request and so cannot find it in ``_local``. It hashes by
+    identity, so it is queued once per request however many bans it collects.
+    """
+    def __init__(self):
+        self.paths_by_hostname = {}
+        self.sent = False
+
+
+def pending_bans():
+    """The bans collected by this thread (or greenlet) that have not been sent yet."""
+    pending = getattr(_local, 'pending_bans', None)
+    if pending is None or pending.sent:
+        pending = _local.pending_bans = PendingBans()
+    return pending
+
+
+def merge_ban_paths(paths):
+    """Collapse ``paths`` into as few ban regexes as possible.
+
+    Every ban matches ``<path>.*``, so a path is dropped when another queued path
+    is a prefix of it. The survivors are grouped by parent directory into
+    alternations (``/v2/nodes/(?:abc12/|def34/).*``), split so that no pattern
+    exceeds ``BAN_MAX_PATTERN_LENGTH``.
+
+    :return: tuple of (list of regexes, number of paths merged away)
+    """
+    paths = sorted(set(paths))
+    kept = []
+    for path in paths:
+        if kept and path.startswith(kept[-1]):
+            continue
+        kept.append(path)
+
+    groups = OrderedDict()
+    for path in kept:
+        parent = path.rstrip('/').rpartition('/')[0] + '/'
+        groups.setdefault(parent, []).append(path[len(parent):])
+
+    patterns = []
+    for parent, leaves in groups.items():
+        chunks = [[]]
+        length = len(parent)
+        for leaf in leaves:
+            if chunks[-1] and length + len(leaf) + 1 > cache_settings.BAN_MAX_PATTERN_LENGTH:
+                chunks.append([])
+                length = len(parent)
+            chunks[-1].append(leaf)
+            length += len(leaf) + 1
+        for chunk in chunks:
+            if len(chunk) == 1:
+                patterns.append('{}{}.*'.format(parent, chunk[0]))
+            else:
+                patterns.append('{}(?:{}).*'.format(parent, '|'.join(chunk)))
+
+    return patterns, len(paths) - len(patterns)
+
+
+def get_ban_session(server):
+    """Return a keep-alive ``requests.Session`` shared by every ban sent to ``server``."""
+    with _sessions_lock:
+        session = _ban_sessions.get(server)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=cache_settings.BAN_POOL_SIZE,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _ban_sessions[server] = session
+    return session
+
+
+def _send_server_bans(server, hostname, patterns):
+    varnish_parsed_url = urlparse(server)
+    session = get_ban_session(server)
+    for pattern in patterns:
+        url_to_ban = '{scheme}://{netloc}{pattern}'.format(
             scheme=varnish_parsed_url.scheme,
             netloc=varnish_parsed_url.netloc,
-            path=parsed_absolute_url.path,
+            pattern=pattern,
         )
-        bannable_urls.append(url_string)
-        if isinstance(instance, Comment):
-            try:
-                parsed_target_url = urlparse(instance.target.referent.absolute_api_v2_url)
-            except AttributeError:
-                # some referents don't have an absolute_api_v2_url
-                # I'm looking at you NodeWikiPage
-                # Note: NodeWikiPage has been deprecated. Is this an issue with WikiPage/WikiVersion?
-                pass
-            else:
-                url_string = '{scheme}://{netloc}{path}.*'.format(
-                    scheme=varnish_parsed_url.scheme,
-                    netloc=varnish_parsed_url.netloc,
-                    path=parsed_target_url.path,
-                )
-                bannable_urls.append(url_string)
-
-            try:
-                parsed_root_target_url = urlparse(instance.root_target.referent.absolute_api_v2_url)
-            except AttributeError:
-                # some root_targets don't have an absolute_api_v2_url
-                pass
-            else:
-                url_string = '{scheme}://{netloc}{path}.*'.format(
-                    scheme=varnish_parsed_url.scheme,
-                    netloc=varnish_parsed_url.netloc,
-                    path=parsed_root_target_url.path,
-                )
-                bannable_urls.append(url_string)
-
-    return bannable_urls, parsed_absolute_url.hostname
-
-
-@app.task(max_retries=5, default_retry_delay=60)
-def ban_url(instance):
-    # TODO: Refactor; Pull url generation into postcommit_task handling so we only ban urls once per request
-    timeout = 0.3  # 300ms timeout for bans
-    if settings.ENABLE_VARNISH:
-        bannable_urls, hostname = get_bannable_urls(instance)
-
-        for url_to_ban in set(bannable_urls):
-            try:
-                response = requests.request(
-                    'BAN', url_to_ban, timeout=timeout, headers=dict(
-                        Host=hostname,
-                    ),
-                )
-            except Exception as ex:
+        try:
+            prepared = session.prepare_request(requests.Request('BAN', url_to_ban, headers=dict(Host=hostname)))
+            # requests percent-encodes ``|``, which varnish would then match literally
+            prepared.url = url_to_ban
+            response = session.send(prepared, timeout=cache_settings.BAN_TIMEOUT)
+        except Exception as ex:
+            instrumentation.registry.increment('osf_varnish_bans_total', 'failed')
+            logger.error('Banning {} failed: {}'.format(url_to_ban, ex))
+        else:
+            if not response.ok:
+                instrumentation.registry.increment('osf_varnish_bans_total', 'failed')
                 logger.error('Banning {} failed: {}'.format(
                     url_to_ban,
-                    ex.message,
+                    response.text,
                 ))
             else:
-                if not response.ok:
-                    logger.error('Banning {} failed: {}'.format(
-                        url_to_ban,
-                        response.text,
-                    ))
-                else:
-                    logger.info('Banning {} succeeded'.format(
-                        url_to_ban,
-                    ))
+                instrumentation.registry.increment('osf_varnish_bans_total', 'issued')
+                logger.info('Banning {} succeeded'.format(
+                    url_to_ban,
+                ))
+
+
+def send_bans(paths_by_hostname):
+    """Merge the queued paths and send them to every varnish server, in parallel across servers."""
+    servers = get_varnish_servers()
+    if not servers:
+        return
+    pool = Pool(len(servers))
+    for hostname, paths in paths_by_hostname.items():
+        patterns, merged = merge_ban_paths(paths)
+        if merged:
+            instrumentation.registry.increment('osf_varnish_bans_total', 'merged', merged)
+        for server in servers:
+            pool.spawn(_send_server_bans, server, hostname, patterns)
+    pool.join()
+
+
+def send_pending_bans(pending):
+    """Send the bans collected in ``pending``, once."""
+    if pending.sent:
+        return
+    pending.sent = True
+    if pending.paths_by_hostname and settings.ENABLE_VARNISH:
+        send_bans(pending.paths_by_hostname)
+
+
+def enqueue_ban(instance):
+    """Queue the bannable paths of ``instance`` to be sent once, after the request
+    commits or at the end of the surrounding ``ban_batch``.
+    """
+    if not settings.ENABLE_VARNISH:
+        return
+    bannable_paths, hostname = get_bannable_paths(instance)
+    if not bannable_paths:
+        return
+    pending = pending_bans()
+    pending.paths_by_hostname.setdefault(hostname, set()).update(bannable_paths)
+    if not getattr(_local, 'ban_batch_depth', 0):
+        enqueue_postcommit_task(send_pending_bans, (pending, ), {}, celery=False, once_per_request=True)
+
+
+@contextmanager
+def ban_batch():
+    """Collect bans enqueued inside the block and send them on exit, for code running
+    outside of requests, where there is no postcommit queue to send them from.
+    """
+    _local.ban_batch_depth = getattr(_local, 'ban_batch_depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.ban_batch_depth -= 1
+        if not _local.ban_batch_depth:
+            send_pending_bans(pending_bans())
+
+
+def compute_storage_usage(node_ids):
+    """Map of node id -> total size of every version of the node's osfstorage files, in one query."""
+    BaseFileNode = apps.get_model('osf.BaseFileNode')
+    AbstractNode = apps.get_model('osf.AbstractNode')
+    ContentType = apps.get_model('contenttypes.ContentType')
+
+    usage = {node_id: 0 for node_id in node_ids}
+    totals = BaseFileNode.objects.filter(
+        type='osf.osfstoragefile',
+        target_object_id__in=node_ids,
+        target_content_type=ContentType.objects.get_for_model(AbstractNode),
+    ).order_by().values('target_object_id').annotate(sum=models.Sum('versions__size')).values_list('target_object_id', 'sum')
+    for node_id, total in totals:
+        usage[node_id] = total or 0
+    return usage
+
+
+def set_storage_usage(nodes):
+    """Count the storage usage of ``nodes`` from scratch and store it. Returns a map of node id -> usage."""
+    usage = compute_storage_usage([node.id for node in nodes])
+    storage_usage_cache.set_many({
+        cache_settings.STORAGE_USAGE_KEY.format(target_id=node._id): usage[node.id]
+        for node in nodes
+    }, cache_settings.NEVER_TIMEOUT)
+    return usage
 
 
 @app.task(max_retries=5, default_retry_delay=10)
 def update_storage_usage_cache(target_id):
     AbstractNode = apps.get_model('osf.AbstractNode')
 
-    storage_usage_total = AbstractNode.objects.get(
-        guids___id=target_id,
-    ).files.aggregate(sum=models.Sum('versions__size'))['sum'] or 0
+    set_storage_usage([AbstractNode.objects.get(guids___id=target_id)])
+
+
+def get_storage_usage(nodes):
+    """Map of node id -> storage usage for many nodes, counting the ones not stored yet in one query."""
+    keys = {cache_settings.STORAGE_USAGE_KEY.format(target_id=node._id): node for node in nodes}
+    stored = storage_usage_cache.get_many(list(keys))
+    usage = {keys[key].id: value for key, value in stored.items()}
+    missing = [node for key, node in keys.items() if key not in stored]
+    if missing:
+        usage.update(set_storage_usage(missing))
+    return usage
+
+
+def incr_storage_usage(target, delta):
+    """Add ``delta`` bytes to the stored usage of ``target``, if any is stored.
+
+    The cache row is locked for the read and write, so that concurrent deltas are not lost,
+    and written back with no expiry. Returns whether a total was stored.
+    """
+    key = cache_settings.STORAGE_USAGE_KEY.format(target_id=target._id)
+    db = router.db_for_write(storage_usage_cache.cache_model_class)
+    with transaction.atomic(using=db):
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                'SELECT cache_key FROM {} WHERE cache_key = %s FOR UPDATE'.format(connections[db].ops.quote_name(storage_usage_cache._table)),
+                [storage_usage_cache.make_key(key)],
+            )
+        total = storage_usage_cache.get(key)
+        if total is None:
+            return False
+        storage_usage_cache.set(key, total + delta, cache_settings.NEVER_TIMEOUT)
+    return True
 
-    key = cache_settings.STORAGE_USAGE_KEY.format(target_id=target_id)
-    storage_usage_cache.set(key, storage_usage_total, cache_settings.FIVE_MIN_TIMEOUT)
 
+def update_storage_usage(target, delta=None):
+    """Account for a change in ``target``'s storage usage.
 
-def update_storage_usage(target):
+    The stored total is adjusted by ``delta`` bytes in place. If there is no delta or
+    nothing has been stored for the target yet, it is counted from scratch after the
+    request has committed.
+    """
     Preprint = apps.get_model('osf.preprint')
 
-    if not isinstance(target, Preprint) and not target.is_quickfiles:
-        enqueue_postcommit_task(update_storage_usage_cache, (target._id,), {}, celery=True)
+    if isinstance(target, Preprint) or target.is_quickfiles:
+        return
+
+    if delta is not None:
+        if not delta:
+            return
+        if incr_storage_usage(target, delta):
+            return
+
+    enqueue_postcommit_task(update_storage_usage_cache, (target._id,), {}, celery=True)
+
+
+@app.task(name='api.caching.tasks.reconcile_storage_usage', max_retries=0)
+def reconcile_storage_usage(hours=24, batch_size=1000):
+    """Recount the storage usage of every node whose osfstorage files changed in the last ``hours``,
+    correcting any drift in the stored totals.
+    """
+    AbstractNode = apps.get_model('osf.AbstractNode')
+    BaseFileNode = apps.get_model('osf.BaseFileNode')
+    ContentType = apps.get_model('contenttypes.ContentType')
+
+    # Includes trashed osfstorage files, whose targets lost their size
+    node_ids = sorted(set(BaseFileNode.objects.filter(
+        provider='osfstorage',
+        modified__gte=timezone.now() - timedelta(hours=hours),
+        target_content_type=ContentType.objects.get_for_model(AbstractNode),
+    ).values_list('target_object_id', flat=True)))
+    corrected = 0
+    for i in range(0, len(node_ids), batch_size):
+        nodes = [
+            node for node in AbstractNode.objects.filter(id__in=node_ids[i:i + batch_size])
+            if not node.is_quickfiles
+        ]
+        stored = get_storage_usage(nodes)
+        actual = set_storage_usage(nodes)
+        corrected += sum(1 for node_id, total in actual.items() if stored[node_id] != total)
+    logger.info('Reconciled storage usage of {} nodes, {} corrected'.format(len(node_ids), corrected))
+    return corrected
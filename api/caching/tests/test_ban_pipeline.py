@@ -0,0 +1,102 @@
+import threading
+
+import mock
+import pytest
+
+from api.base import instrumentation
+from api.caching import tasks
+from api.caching.tasks import ban_batch, enqueue_ban, merge_ban_paths, pending_bans, send_bans
+from osf_tests.factories import ProjectFactory
+
+
+class TestMergeBanPaths:
+
+    def test_prefixed_paths_are_collapsed(self):
+        patterns, merged = merge_ban_paths([
+            '/v2/nodes/abcde/',
+            '/v2/nodes/abcde/contributors/',
+            '/v2/nodes/abcde/',
+        ])
+        assert patterns == ['/v2/nodes/abcde/.*']
+        assert merged == 1
+
+    def test_siblings_are_grouped_into_one_regex(self):
+        patterns, merged = merge_ban_paths([
+            '/v2/nodes/abcde/',
+            '/v2/nodes/fghij/',
+            '/v2/users/klmno/',
+        ])
+        assert patterns == [
+            '/v2/nodes/(?:abcde/|fghij/).*',
+            '/v2/users/klmno/.*',
+        ]
+        assert merged == 1
+
+    def test_long_groups_are_split(self):
+        paths = ['/v2/nodes/{:05d}/'.format(i) for i in range(10)]
+        with mock.patch('api.caching.settings.BAN_MAX_PATTERN_LENGTH', 40):
+            patterns, merged = merge_ban_paths(paths)
+        assert len(patterns) > 1
+        assert all(len(pattern) <= 45 for pattern in patterns)
+        assert merged == len(paths) - len(patterns)
+
+
+@pytest.mark.django_db
+class TestBanQueue:
+
+    @pytest.fixture(autouse=True)
+    def enable_varnish(self):
+        with mock.patch('website.settings.ENABLE_VARNISH', True), \
+                mock.patch('website.settings.VARNISH_SERVERS', ['http://varnish-1', 'http://varnish-2']):
+            yield
+        tasks._local.pending_bans = None
+
+    def test_bans_are_deduplicated_and_sent_once_per_server(self):
+        project = ProjectFactory()
+        with mock.patch('api.caching.tasks._send_server_bans') as mock_send:
+            with ban_batch():
+                enqueue_ban(project)
+                enqueue_ban(project)
+                assert not mock_send.called
+        assert mock_send.call_count == 2
+        servers = sorted(call[0][0] for call in mock_send.call_args_list)
+        assert servers == ['http://varnish-1', 'http://varnish-2']
+        for call in mock_send.call_args_list:
+            assert call[0][2] == ['/v2/nodes/{}/.*'.format(project._id)]
+        assert pending_bans().paths_by_hostname == {}
+
+    def test_nothing_is_sent_when_varnish_is_disabled(self):
+        project = ProjectFactory()
+        with mock.patch('website.settings.ENABLE_VARNISH', False), \
+                mock.patch('api.caching.tasks._send_server_bans') as mock_send:
+            with ban_batch():
+                enqueue_ban(project)
+        assert not mock_send.called
+
+    def test_bans_are_sent_from_another_thread(self):
+        # Postcommit tasks run in their own greenlet, which has its own thread-locals
+        project = ProjectFactory()
+        with mock.patch('api.caching.tasks.enqueue_postcommit_task') as mock_enqueue, \
+                mock.patch('api.caching.tasks._send_server_bans') as mock_send:
+            enqueue_ban(project)
+            enqueue_ban(project)
+            task, args, _ = mock_enqueue.call_args[0]
+            thread = threading.Thread(target=task, args=args)
+            thread.start()
+            thread.join()
+        assert all(call[0][1] == args for call in mock_enqueue.call_args_list)
+        assert mock_send.call_count == 2
+        assert pending_bans().paths_by_hostname == {}
+
+    def test_ban_outcomes_are_counted(self):
+        instrumentation.registry.clear()
+        session = mock.Mock()
+        session.send.side_effect = [mock.Mock(ok=True), mock.Mock(ok=True), mock.Mock(ok=False), Exception('timed out')]
+        with mock.patch('api.caching.tasks.get_ban_session', return_value=session):
+            send_bans({'localhost:8000': ['/v2/nodes/abcde/', '/v2/nodes/abcde/contributors/', '/v2/users/klmno/']})
+        assert session.send.call_count == 4
+        assert instrumentation.registry.counters == {
+            ('osf_varnish_bans_total', 'issued'): 2,
+            ('osf_varnish_bans_total', 'failed'): 2,
+            ('osf_varnish_bans_total', 'merged'): 1,
+        }
@@ -0,0 +1,79 @@
+import mock
+import pytest
+from django.db import connection
+
+from api.caching import settings as cache_settings
+from api.caching.tasks import get_storage_usage, reconcile_storage_usage, update_storage_usage
+from api.caching.utils import storage_usage_cache
+from api_tests.utils import create_test_file
+from osf_tests.factories import AuthUserFactory, ProjectFactory
+
+
+@pytest.mark.django_db
+class TestStorageUsage:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        storage_usage_cache.clear()
+
+    @pytest.fixture()
+    def user(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def node(self, user):
+        return ProjectFactory(creator=user)
+
+    @pytest.fixture()
+    def node_two(self, user):
+        return ProjectFactory(creator=user)
+
+    def stored(self, node):
+        return storage_usage_cache.get(cache_settings.STORAGE_USAGE_KEY.format(target_id=node._id))
+
+    def test_get_storage_usage_for_many_nodes(self, user, node, node_two):
+        create_test_file(node, user, 'one', size=100)
+        create_test_file(node, user, 'two', size=20)
+        assert get_storage_usage([node, node_two]) == {node.id: 120, node_two.id: 0}
+        assert self.stored(node) == 120
+        assert self.stored(node_two) == 0
+
+    def test_delta_is_applied_to_stored_usage(self, user, node):
+        create_test_file(node, user, 'one', size=100)
+        get_storage_usage([node])
+        update_storage_usage(node, 50)
+        assert self.stored(node) == 150
+        update_storage_usage(node, -150)
+        assert self.stored(node) == 0
+
+    def test_delta_does_not_expire_stored_usage(self, user, node):
+        get_storage_usage([node])
+        update_storage_usage(node, 50)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT expires FROM {} WHERE cache_key = %s'.format(storage_usage_cache._table),
+                [storage_usage_cache.make_key(cache_settings.STORAGE_USAGE_KEY.format(target_id=node._id))],
+            )
+            expires = cursor.fetchone()[0]
+        assert expires.year == 9999
+
+    def test_stored_zero_usage_is_not_recounted(self, node):
+        get_storage_usage([node])
+        with mock.patch('osf.models.node.update_storage_usage') as mock_update:
+            assert node.storage_usage == 0
+        assert not mock_update.called
+
+    def test_file_storage_usage(self, user, node):
+        test_file = create_test_file(node, user, 'one', size=100)
+        folder = node.get_addon('osfstorage').get_root().append_folder('folder')
+        create_test_file(node, user, 'two', size=20).move_under(folder)
+        assert test_file.storage_usage == 100
+        assert folder.storage_usage == 20
+        assert node.get_addon('osfstorage').get_root().storage_usage == 120
+
+    def test_reconcile_corrects_drift(self, user, node):
+        create_test_file(node, user, 'one', size=100)
+        get_storage_usage([node])
+        update_storage_usage(node, 7)
+        assert reconcile_storage_usage() == 1
+        assert self.stored(node) == 100
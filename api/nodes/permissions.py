@@ -36,6 +36,9 @@ class ContributorOrPublic(permissions.BasePermission):
         assert_resource_type(obj, self.acceptable_models)
         auth = get_user_auth(request)
         if request.method in permissions.SAFE_METHODS:
+            # Embedded node views may have had read access resolved in bulk already
+            if isinstance(obj, AbstractNode) and obj.id in getattr(request, 'readable_node_ids', ()):
+                return True
             return obj.is_public or obj.can_view(auth)
         else:
             return obj.can_edit(auth)
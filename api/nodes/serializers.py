@@ -18,7 +18,7 @@ from api.base.serializers import (
 )
 from api.base.settings import ADDONS_FOLDER_CONFIGURABLE
 from api.base.utils import (
-    absolute_reverse, get_object_or_error,
+    absolute_reverse, count_subquery, get_object_or_error,
     get_user_auth, is_truthy,
 )
 from api.base.versioning import get_kebab_snake_case_field
@@ -35,9 +35,9 @@ from addons.base.exceptions import InvalidAuthError, InvalidFolderError
 from addons.osfstorage.models import Region
 from osf.exceptions import NodeStateError
 from osf.models import (
-    Comment, DraftRegistration, Institution,
+    Comment, Contributor, DraftRegistration, Institution,
     RegistrationSchema, AbstractNode, PrivateLink,
-    RegistrationProvider, OSFGroup,
+    RegistrationProvider, OSFGroup, NodeLog, NodeRelation,
 )
 from osf.models.external import ExternalAccount
 from osf.models.licenses import NodeLicense
@@ -558,33 +558,34 @@ class NodeSerializer(TaxonomizableSerializerMixin, JSONAPISerializer):
         if user.is_anonymous:
             return default_perm
 
-        if hasattr(obj, 'has_admin'):
-            user_perms = []
-            if obj.has_admin:
-                user_perms = [osf_permissions.ADMIN, osf_permissions.WRITE, osf_permissions.READ]
-            elif obj.has_write:
-                user_perms = [osf_permissions.WRITE, osf_permissions.READ]
-            elif obj.has_read:
-                user_perms = [osf_permissions.READ]
+        if hasattr(obj, 'user_permission_level'):
+            # Annotated by AbstractNodeQuerySet.annotate_user_permissions
+            user_perms = osf_permissions.API_CONTRIBUTOR_PERMISSIONS[:obj.user_permission_level][::-1]
         else:
             user_perms = obj.get_permissions(user)[::-1]
 
         user_perms = user_perms or default_perm
-        if not user_perms and user in obj.parent_admin_users:
-            user_perms = [osf_permissions.READ]
+        if not user_perms:
+            if hasattr(obj, 'user_is_admin_parent'):
+                is_admin_parent = obj.user_is_admin_parent
+            else:
+                is_admin_parent = user in obj.parent_admin_users
+            if is_admin_parent:
+                user_perms = [osf_permissions.READ]
         return user_perms
 
     def get_current_user_can_comment(self, obj):
         user = self.context['request'].user
         auth = Auth(user if not user.is_anonymous else None)
 
-        if hasattr(obj, 'has_read'):
+        if hasattr(obj, 'user_permission_level'):
+            has_read = obj.user_permission_level > 0
             if obj.comment_level == 'public':
                 return auth.logged_in and (
                     obj.is_public or
-                    (auth.user and obj.has_read)
+                    (auth.user and has_read)
                 )
-            return obj.has_read or False
+            return has_read
         else:
             return obj.can_comment(auth)
 
@@ -609,8 +610,8 @@ class NodeSerializer(TaxonomizableSerializerMixin, JSONAPISerializer):
 
     def get_current_user_is_contributor_or_group_member(self, obj):
         # Returns whether user is a contributor -or- a group member
-        if hasattr(obj, 'has_read'):
-            return obj.has_read
+        if hasattr(obj, 'user_permission_level'):
+            return obj.user_permission_level > 0
 
         user = self.context['request'].user
         if user.is_anonymous:
@@ -625,6 +626,25 @@ class NodeSerializer(TaxonomizableSerializerMixin, JSONAPISerializer):
 
     # TODO: See if we can get the count filters into the filter rather than the serializer.
 
+    def get_related_counts_annotations(self):
+        WikiPage = apps.get_model('addons_wiki.WikiPage')
+        node_links = NodeRelation.objects.filter(is_node_link=True)
+        return {
+            'get_logs_count': count_subquery(NodeLog.objects.all(), 'node'),
+            'get_contrib_count': count_subquery(Contributor.objects.all(), 'node'),
+            'get_wiki_page_count': count_subquery(WikiPage.objects.filter(deleted__isnull=True), 'node'),
+            'get_pointers_count': count_subquery(node_links, 'parent'),
+            'get_linked_by_nodes_count': count_subquery(
+                node_links.filter(parent__is_deleted=False, parent__type='osf.node'), 'child',
+            ),
+            'get_linked_by_registrations_count': count_subquery(
+                node_links.filter(parent__type='osf.registration', parent__retraction__isnull=True), 'child',
+            ),
+            'get_forks_count': count_subquery(
+                AbstractNode.objects.exclude(type='osf.registration').exclude(is_deleted=True), 'forked_from',
+            ),
+        }
+
     def get_logs_count(self, obj):
         return obj.logs.count()
 
@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 from distutils.version import StrictVersion
-from django.apps import apps
 from django.db.models import Q, OuterRef, Exists, Subquery, CharField, Value, BooleanField
-from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.status import is_server_error
@@ -11,8 +9,6 @@ import requests
 from addons.osfstorage.models import OsfStorageFile, OsfStorageFolder, NodeSettings, Region
 from addons.wiki.models import NodeSettings as WikiNodeSettings
 from osf.models import AbstractNode, Preprint, Guid, NodeRelation, Contributor
-from osf.models.node import NodeGroupObjectPermission
-from osf.utils import permissions
 
 from api.base.exceptions import ServiceUnavailableError
 from api.base.utils import get_object_or_error, waterbutler_api_url_for, get_user_auth, has_admin_scope
@@ -81,8 +77,6 @@ class NodeOptimizationMixin(object):
     slow down the request significantly**
     """
     def optimize_node_queryset(self, queryset):
-        OSFUserGroup = apps.get_model('osf', 'osfuser_groups')
-
         auth = get_user_auth(self.request)
         admin_scope = has_admin_scope(self.request)
         abstract_node_contenttype_id = ContentType.objects.get_for_model(AbstractNode).id
@@ -93,18 +87,10 @@ class NodeOptimizationMixin(object):
         region = Region.objects.filter(id=OuterRef('region_id'))
         node_settings = NodeSettings.objects.annotate(region_abbrev=Subquery(region.values('_id')[:1])).filter(owner_id=OuterRef('pk'))
 
-        admin_permission = Permission.objects.get(codename=permissions.ADMIN_NODE)
-        write_permission = Permission.objects.get(codename=permissions.WRITE_NODE)
-        read_permission = Permission.objects.get(codename=permissions.READ_NODE)
         contrib = Contributor.objects.filter(user=auth.user, node=OuterRef('pk'))
-        user_group = OSFUserGroup.objects.filter(osfuser_id=auth.user.id if auth.user else None, group_id=OuterRef('group_id'))
-        node_group = NodeGroupObjectPermission.objects.annotate(user_group=Subquery(user_group.values_list('group_id')[:1])).filter(user_group__isnull=False, content_object_id=OuterRef('pk'))
-        # user_is_contrib means user is a traditional contributor, while has_read/write/admin are permissions the user has either through group membership or contributorship
-        return queryset.prefetch_related('root').prefetch_related('subjects').annotate(
+        # user_is_contrib means user is a traditional contributor, while user_permission_level is the permission the user has either through group membership or contributorship
+        return queryset.prefetch_related('root').prefetch_related('subjects').annotate_user_permissions(auth.user).annotate(
             user_is_contrib=Exists(contrib),
-            has_read=Exists(node_group.filter(permission_id=read_permission.id)),
-            has_write=Exists(node_group.filter(permission_id=write_permission.id)),
-            has_admin=Exists(node_group.filter(permission_id=admin_permission.id)),
             has_wiki_addon=Exists(wiki_addon),
             annotated_parent_id=Subquery(parent.values('parent__id')[:1], output_field=CharField()),
             has_viewable_preprints=Exists(preprints),
@@ -1,4 +1,5 @@
 import re
+from collections import defaultdict
 
 from django.apps import apps
 from django.db.models import Q, OuterRef, Exists, Subquery, F
@@ -10,7 +11,7 @@ from rest_framework.response import Response
 from rest_framework.status import HTTP_204_NO_CONTENT
 
 from addons.base.exceptions import InvalidAuthError
-from addons.osfstorage.models import OsfStorageFolder
+from addons.osfstorage.models import OsfStorageFileNode, OsfStorageFolder
 from api.addons.serializers import NodeAddonFolderSerializer
 from api.addons.views import AddonSettingsMixin
 from api.base import generic_bulk_views as bulk_views
@@ -124,6 +125,7 @@ from osf.features import OSF_GROUPS
 from osf.models import AbstractNode
 from osf.models import (Node, PrivateLink, Institution, Comment, DraftRegistration, Registration, )
 from osf.models import OSFUser
+from osf.models import Contributor
 from osf.models import OSFGroup
 from osf.models import NodeRelation, Guid
 from osf.models import BaseFileNode
@@ -172,6 +174,34 @@ class NodeMixin(object):
             self.check_object_permissions(self.request, node)
         return node
 
+    @classmethod
+    def prefetch_embedded_views(cls, views):
+        """Load the nodes of a page of embedded views in one query and seed each view's
+        `request.parents` with its node, so `get_node` does not query for it again.
+        Read access is resolved for all of them at once as well.
+        """
+        node_ids = {view.kwargs[cls.node_lookup_url_kwarg] for view in views}
+        nodes = {
+            node._id: node for node in
+            Node.objects.filter(guids___id__in=node_ids, is_deleted=False).annotate(region=F('addons_osfstorage_node_settings__region___id')).exclude(region=None)
+        }
+        if not nodes:
+            return
+
+        request = views[0].request
+        readable_node_ids = set()
+        # Private links are checked one node at a time by ContributorOrPublic
+        if 'view_only' not in request.query_params:
+            readable_node_ids = set(
+                Node.objects.filter(id__in=[node.id for node in nodes.values()]).can_view(request.user).values_list('id', flat=True),
+            )
+
+        for view in views:
+            node = nodes.get(view.kwargs[cls.node_lookup_url_kwarg])
+            if node is not None:
+                view.request.parents[Node].setdefault(node._id, node)
+                view.request.readable_node_ids = readable_node_ids
+
 
 class DraftMixin(object):
 
@@ -223,7 +253,7 @@ class NodeList(JSONAPIBaseView, bulk_views.BulkUpdateJSONAPIView, bulk_views.Bul
 
     # overrides NodesFilterMixin
     def get_default_queryset(self):
-        return default_node_list_permission_queryset(user=self.request.user, model_cls=Node)
+        return default_node_list_permission_queryset(user=self.request.user, model_cls=Node).annotate_user_permissions(self.request.user)
 
     # overrides ListBulkCreateJSONAPIView, BulkUpdateJSONAPIView
     def get_queryset(self):
@@ -395,6 +425,41 @@ class NodeContributorsList(BaseContributorList, bulk_views.BulkUpdateJSONAPIView
     view_name = 'node-contributors'
     ordering = ('_order',)  # default ordering
 
+    # Set by `prefetch_embedded_views` when this view is embedded in a list
+    prefetched_contributors = None
+
+    @classmethod
+    def prefetch_embedded_views(cls, views):
+        """Load the contributors of every node on a page of embedded views in one query and
+        hand each view the rows of its own node, so `get_default_queryset` does not query
+        for them again.
+        """
+        super(NodeContributorsList, cls).prefetch_embedded_views(views)
+        nodes = {}
+        for view in views:
+            node = view.request.parents.get(Node, {}).get(view.kwargs[cls.node_lookup_url_kwarg])
+            if node is not None:
+                nodes[node.id] = node
+        if not nodes:
+            return
+
+        contributors = defaultdict(list)
+        for contributor in Contributor.objects.filter(node_id__in=nodes.keys()).include('user__guids').order_by('_order'):
+            contributor.node = nodes[contributor.node_id]
+            contributors[contributor.node_id].append(contributor)
+
+        for view in views:
+            node = view.request.parents.get(Node, {}).get(view.kwargs[cls.node_lookup_url_kwarg])
+            if node is not None:
+                view.prefetched_contributors = contributors[node.id]
+
+    def get_default_queryset(self):
+        if self.prefetched_contributors is not None:
+            # Still checks that the node may be read
+            self.get_node()
+            return self.prefetched_contributors
+        return super(NodeContributorsList, self).get_default_queryset()
+
     def get_resource(self):
         return self.get_node()
 
@@ -1113,6 +1178,14 @@ class NodeFilesList(JSONAPIBaseView, generics.ListAPIView, WaterButlerMixin, Lis
         sub_qs = OsfStorageFolder.objects.filter(_children=OuterRef('pk'), pk=files_list.pk)
         return files_list.children.annotate(folder=Exists(sub_qs)).filter(folder=True).prefetch_related('versions', 'tags', 'guids')
 
+    # overrides ListAPIView
+    def paginate_queryset(self, queryset):
+        page = super(NodeFilesList, self).paginate_queryset(queryset)
+        if page and self.kwargs[self.provider_lookup_url_kwarg] == 'osfstorage':
+            # Resolve every materialized_path on the page with one query
+            OsfStorageFileNode.prefetch_materialized_paths(page)
+        return page
+
     # overrides ListAPIView
     def get_queryset(self):
         path = self.kwargs[self.path_lookup_url_kwarg]
@@ -325,7 +325,9 @@ class UserNodes(JSONAPIBaseView, generics.ListAPIView, UserMixin, UserNodesFilte
         default_queryset = user.nodes_contributor_or_group_member_to
         if user != self.request.user:
             # Further restrict UserNodes to nodes the *requesting* user can view
-            return Node.objects.get_nodes_for_user(self.request.user, base_queryset=default_queryset, include_public=True)
+            return Node.objects.get_nodes_for_user(
+                self.request.user, base_queryset=default_queryset, include_public=True,
+            ).annotate_user_permissions(self.request.user)
         return self.optimize_node_queryset(default_queryset)
 
     # overrides ListAPIView
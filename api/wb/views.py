@@ -85,8 +85,9 @@ class MoveFileMetadataView(FileMetadataView):
         ret = source.move_under(destination, name)
 
         if dest_target != source_target:
-            update_storage_usage(source.target)
-            update_storage_usage(destination.target)
+            size = source.storage_usage
+            update_storage_usage(source_target, -size)
+            update_storage_usage(dest_target, size)
 
         return ret
 
@@ -101,5 +102,5 @@ class CopyFileMetadataView(FileMetadataView):
 
     def perform_file_action(self, source, destination, name):
         ret = source.copy_under(destination, name)
-        update_storage_usage(destination.target)
+        update_storage_usage(destination.target, source.storage_usage)
         return ret
@@ -0,0 +1,70 @@
+import json
+
+import mock
+import pytest
+
+from api.base import instrumentation
+from api.base import settings as api_settings
+from api.base.settings.defaults import API_BASE
+from osf_tests.factories import ProjectFactory
+
+
+@pytest.mark.django_db
+class TestInstrumentation:
+
+    @pytest.fixture(autouse=True)
+    def clear_registry(self):
+        instrumentation.registry.clear()
+
+    @pytest.fixture()
+    def url(self):
+        return '/{}nodes/{}/'.format(API_BASE, ProjectFactory(is_public=True)._id)
+
+    def histogram(self, name, view_fqn='nodes:node-detail'):
+        return instrumentation.registry.histograms[(name, view_fqn)]
+
+    def test_requests_are_recorded_per_view(self, app, url):
+        app.get(url)
+        queries = self.histogram('osf_api_request_queries')
+        assert queries.count == 1
+        assert queries.sum > 0
+        assert self.histogram('osf_api_request_db_seconds').sum > 0
+        assert self.histogram('osf_api_request_serializer_seconds').sum > 0
+        assert self.histogram('osf_api_request_duration_seconds').count == 1
+
+    def test_unsampled_requests_are_not_recorded(self, app, url):
+        with mock.patch.object(api_settings, 'API_INSTRUMENTATION_SAMPLE_RATE', 0):
+            app.get(url)
+        assert not instrumentation.registry.histograms
+
+    def test_slow_requests_are_logged_with_their_queries(self, app, url):
+        with mock.patch.object(api_settings, 'API_INSTRUMENTATION_SLOW_REQUEST_QUERIES', 1), \
+                mock.patch.object(instrumentation.logger, 'warning') as mock_warning:
+            app.get(url)
+        logged = json.loads(mock_warning.call_args[0][0])
+        assert logged['event'] == 'slow_request'
+        assert logged['view'] == 'nodes:node-detail'
+        assert logged['status'] == 200
+        assert len(logged['queries']) == logged['query_count'] > 0
+
+    def test_nested_timings_count_once(self):
+        metrics = instrumentation.start_request()
+        try:
+            with mock.patch.object(instrumentation, 'default_timer', side_effect=[1, 3]):
+                with instrumentation.timed('serializer'):
+                    with instrumentation.timed('serializer'):
+                        pass
+        finally:
+            instrumentation.end_request()
+        assert metrics.timings['serializer'] == 2
+
+    def test_metrics_endpoint(self, app, url):
+        app.get(url)
+        assert app.get('/_/instrumentation/', expect_errors=True).status_code == 404
+        with mock.patch.object(api_settings, 'API_INSTRUMENTATION_METRICS_TOKEN', 'secret'):
+            assert app.get('/_/instrumentation/', headers={'Authorization': 'Bearer wrong'}, expect_errors=True).status_code == 404
+            res = app.get('/_/instrumentation/', headers={'Authorization': 'Bearer secret'})
+        assert res.content_type == 'text/plain'
+        assert '# TYPE osf_api_request_queries histogram' in res.text
+        assert 'osf_api_request_queries_count{view="nodes:node-detail"} 1' in res.text
+        assert 'osf_api_request_duration_seconds_bucket{view="nodes:node-detail",le="+Inf"} 1' in res.text
@@ -54,3 +54,55 @@ class TestJSONAPIPagination(ApiTestCase):
         assert_not_in('meta', links)
         assert_in('total', meta)
         assert_in('per_page', meta)
+
+
+class TestKeysetPagination(ApiTestCase):
+
+    def setUp(self):
+        super(TestKeysetPagination, self).setUp()
+
+        self.url = '/{}nodes/?version=2.1&page[size]=5&page[cursor]='.format(settings.API_BASE)
+        self.user = factories.AuthUserFactory()
+        self.nodes = [factories.ProjectFactory(creator=self.user) for i in range(0, 11)]
+
+    def test_cursor_walks_every_node_once(self):
+        url, pages = self.url, []
+        while url:
+            res = self.app.get(url, auth=self.user.auth)
+            assert_equal(res.status_code, 200)
+            pages.append([node['id'] for node in res.json['data']])
+            url = res.json['links']['next']
+        assert_equal([len(page) for page in pages], [5, 5, 1])
+        ids = sum(pages, [])
+        assert_equal(sorted(ids), sorted(node._id for node in self.nodes))
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.app.get(self.url, auth=self.user.auth)
+        assert_is_none(first.json['links']['prev'])
+        second = self.app.get(first.json['links']['next'], auth=self.user.auth)
+        previous = self.app.get(second.json['links']['prev'], auth=self.user.auth)
+        assert_equal(
+            [node['id'] for node in previous.json['data']],
+            [node['id'] for node in first.json['data']],
+        )
+
+    def test_sorted_cursor_pages_keep_order(self):
+        url = '{}&sort=title'.format(self.url)
+        ids = []
+        while url:
+            res = self.app.get(url, auth=self.user.auth)
+            ids.extend(node['id'] for node in res.json['data'])
+            url = res.json['links']['next']
+        expected = sorted(self.nodes, key=lambda node: (node.title, node.id))
+        assert_equal(ids, [node._id for node in expected])
+
+    def test_meta_total_is_estimate(self):
+        res = self.app.get(self.url, auth=self.user.auth)
+        meta = res.json['meta']
+        assert_true(meta['total_is_estimate'])
+        assert_equal(meta['per_page'], 5)
+        assert_is_none(res.json['links']['last'])
+
+    def test_invalid_cursor(self):
+        res = self.app.get('{}garbage'.format(self.url), auth=self.user.auth, expect_errors=True)
+        assert_equal(res.status_code, 404)
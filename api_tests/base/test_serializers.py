@@ -3,6 +3,7 @@ from rest_framework import status as http_status
 import importlib
 import pkgutil
 
+import mock
 import pytest
 from pytz import utc
 from datetime import datetime
@@ -21,6 +22,8 @@ from api.base.settings.defaults import API_BASE
 from api.schemas.serializers import SchemaSerializer
 from api.base.serializers import JSONAPISerializer, BaseAPISerializer
 from api.base import serializers as base_serializers
+from api.base import utils as api_utils
+from django.core.urlresolvers import reverse
 from api.nodes.serializers import NodeSerializer, RelationshipField
 from api.waffle.serializers import WaffleSerializer, BaseWaffleSerializer
 from api.registrations.serializers import RegistrationSerializer
@@ -556,6 +559,32 @@ class TestRelationshipField:
             field['related']['href']
         )
 
+    def test_field_plan_is_reused_for_a_list(self):
+        req = make_drf_request_with_version(version='2.0')
+        nodes = [factories.NodeFactory(), factories.NodeFactory()]
+        serializer = self.BasicNodeSerializer(nodes, many=True, context={'request': req})
+        with mock.patch.object(
+            self.BasicNodeSerializer, 'parse_sparse_fields', autospec=True,
+            side_effect=self.BasicNodeSerializer.parse_sparse_fields,
+        ) as parse_sparse_fields:
+            data = serializer.data
+        assert parse_sparse_fields.call_count == 1
+        assert [item['id'] for item in data] == [node._id for node in nodes]
+        for item, node in zip(data, nodes):
+            assert_in('/v2/nodes/{}/'.format(node._id), item['relationships']['parent']['links']['related']['href'])
+
+    def test_cached_reverse_matches_reverse(self):
+        node = factories.NodeFactory()
+        for view_name, kwargs in (
+            ('nodes:node-detail', {'node_id': node._id, 'version': 'v2'}),
+            ('nodes:node-pointer-detail', {'node_id': node._id, 'node_link_id': 'abc12', 'version': 'v2'}),
+            # Not templated
+            ('nodes:node-detail', {'node_id': u'n\xf6de', 'version': 'v2'}),
+        ):
+            # The second call fills in the cached template
+            assert api_utils.cached_reverse(view_name, kwargs=kwargs) == reverse(view_name, kwargs=kwargs)
+            assert api_utils.cached_reverse(view_name, kwargs=kwargs) == reverse(view_name, kwargs=kwargs)
+
     def test_field_with_callable_related_attrs(self):
         req = make_drf_request_with_version(version='2.0')
         project = factories.ProjectFactory()
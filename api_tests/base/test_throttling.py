@@ -36,7 +36,7 @@ class TestRootThrottle(ApiTestCase):
         assert_equal(res.status_code, 200)
         assert_equal(mock_allow.call_count, 1)
 
-    @mock.patch('rest_framework.throttling.UserRateThrottle.allow_request')
+    @mock.patch('api.base.throttling.UserRateThrottle.allow_request')
     def test_root_throttle_authenticated_request(self, mock_allow):
         res = self.app.get(self.url, auth=self.user.auth)
         assert_equal(res.status_code, 200)
@@ -50,7 +50,7 @@ class TestUserRateThrottle(ApiTestCase):
         self.user = AuthUserFactory()
         self.url = '/{}nodes/'.format(API_BASE)
 
-    @mock.patch('rest_framework.throttling.UserRateThrottle.allow_request')
+    @mock.patch('api.base.throttling.UserRateThrottle.allow_request')
     def test_user_rate_allow_request_called(self, mock_allow):
         res = self.app.get(self.url, auth=self.user.auth)
         assert_equal(res.status_code, 200)
@@ -117,7 +117,7 @@ class TestAddContributorEmailThrottle(ApiTestCase):
         assert_equal(mock_allow.call_count, 1)
 
     @mock.patch('api.base.throttling.NonCookieAuthThrottle.allow_request')
-    @mock.patch('rest_framework.throttling.UserRateThrottle.allow_request')
+    @mock.patch('api.base.throttling.UserRateThrottle.allow_request')
     @mock.patch('api.base.throttling.AddContributorThrottle.allow_request')
     def test_add_contrib_throttle_rate_and_default_rates_called(
             self, mock_contrib_allow, mock_user_allow, mock_anon_allow):
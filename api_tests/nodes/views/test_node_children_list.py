@@ -214,6 +214,30 @@ class TestNodeChildrenList:
         # Nodes with implicit admin perms are also included in the count
         assert res.json['data']['relationships']['children']['links']['related']['meta']['count'] == 1
 
+    def test_node_children_list_related_counts_match_detail(self, app, user, public_project, private_project):
+        # Counts of a list page are annotated in one query, they must match the per-node counts
+        child = NodeFactory(parent=public_project, creator=user, is_public=True)
+        child.add_contributor(AuthUserFactory(), permissions.WRITE, auth=Auth(user), save=True)
+        child.add_pointer(private_project, auth=Auth(user))
+        NodeFactory(parent=public_project, creator=user, is_public=True)
+        fields = ['contributors', 'logs', 'forks', 'node_links', 'linked_by_nodes', 'linked_by_registrations']
+
+        url = '/{}nodes/{}/children/?related_counts=true'.format(API_BASE, public_project._id)
+        res = app.get(url, auth=user.auth)
+        assert res.status_code == 200
+        assert len(res.json['data']) == 2
+        for node in res.json['data']:
+            detail = app.get('/{}nodes/{}/?related_counts=true'.format(API_BASE, node['id']), auth=user.auth)
+            for field in fields:
+                count = node['relationships'][field]['links']['related']['meta']['count']
+                assert count == detail.json['data']['relationships'][field]['links']['related']['meta']['count']
+
+        url = '/{}nodes/{}/children/?related_counts=contributors'.format(API_BASE, public_project._id)
+        res = app.get(url, auth=user.auth)
+        counts = {node['id']: node['relationships']['contributors']['links']['related']['meta']['count'] for node in res.json['data']}
+        assert counts[child._id] == 2
+        assert res.json['data'][0]['relationships']['logs']['links']['related']['meta'] == {}
+
     def test_child_counts_permissions(self, app, user, public_project):
         NodeFactory(parent=public_project, creator=user)
 
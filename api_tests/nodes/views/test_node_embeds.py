@@ -1,5 +1,7 @@
 import functools
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from api.base.settings.defaults import API_BASE
 from framework.auth.core import Auth
@@ -156,3 +158,56 @@ class TestNodeEmbeds:
         res = app.get(url, auth=write_contrib_one.auth)
         assert res.status_code == 200
         assert res.json['data']['embeds']['contributors']['meta']['total_bibliographic'] == 3
+
+    def test_embed_parent_on_list(
+            self, app, user, write_contrib_one, subchild,
+            root_node, child_one, child_two):
+        # Parents of a list page are loaded and permission checked in bulk
+        url = '/{}nodes/{}/children/?embed=parent'.format(API_BASE, root_node._id)
+        res = app.get(url, auth=user.auth)
+        assert res.status_code == 200
+        assert len(res.json['data']) == 2
+        for child in res.json['data']:
+            assert child['embeds']['parent']['data']['id'] == root_node._id
+
+        url = '/{}users/me/nodes/?embed=parent'.format(API_BASE)
+        res = app.get(url, auth=write_contrib_one.auth)
+        assert res.status_code == 200
+        embeds = {node['id']: node.get('embeds', {}) for node in res.json['data']}
+        assert embeds[child_one._id]['parent']['data']['id'] == root_node._id
+        assert embeds[subchild._id]['parent']['errors'][0]['detail'] == exceptions.PermissionDenied.default_detail
+        assert 'parent' not in embeds[root_node._id]
+
+    def test_embed_contributors_on_list(
+            self, app, user, write_contrib_one, write_contrib_two):
+        # Contributors of a whole page are loaded in one query, whatever the page size
+        nodes = [ProjectFactory(is_public=True, creator=user) for _ in range(4)]
+        for node in nodes:
+            node.add_contributor(write_contrib_one, WRITE, auth=Auth(user), save=True)
+            node.add_contributor(write_contrib_two, WRITE, visible=False, auth=Auth(user), save=True)
+
+        def contributor_queries(page_size, embed):
+            url = '/{}users/me/nodes/?page[size]={}'.format(API_BASE, page_size)
+            if embed:
+                url += '&embed=contributors'
+            with CaptureQueriesContext(connection) as ctx:
+                res = app.get(url, auth=user.auth)
+            assert res.status_code == 200
+            assert len(res.json['data']) == page_size
+            count = len([query for query in ctx.captured_queries if '"osf_contributor"' in query['sql']])
+            return res, count
+
+        res, _ = contributor_queries(4, embed=True)
+        for node in res.json['data']:
+            contributors = node['embeds']['contributors']
+            assert [contrib['id'] for contrib in contributors['data']] == [
+                '{}-{}'.format(node['id'], contrib._id) for contrib in (user, write_contrib_one, write_contrib_two)
+            ]
+            assert contributors['links']['meta']['total_bibliographic'] == 2
+
+        added = []
+        for page_size in (2, 4):
+            _, with_embed = contributor_queries(page_size, embed=True)
+            _, without_embed = contributor_queries(page_size, embed=False)
+            added.append(with_embed - without_embed)
+        assert added[0] == added[1]
@@ -1,6 +1,10 @@
 import mock
 import pytest
+from django.conf import settings as django_settings
+from django.core.cache import caches
 
+from api.base import instrumentation
+from api.base import throttling
 from api.base.settings.defaults import API_BASE
 from osf_tests.factories import AuthUserFactory
 
@@ -74,3 +78,39 @@ class TestThrottling:
         assert res.status_code == 200
         res = app.get(url, headers=headers, expect_errors=True)
         assert res.status_code == 429
+
+
+@pytest.mark.django_db
+class TestGCRAThrottle:
+
+    @pytest.fixture(autouse=True)
+    def clear_throttle_cache(self):
+        caches[django_settings.THROTTLE_CACHE_NAME].clear()
+        instrumentation.registry.clear()
+
+    @pytest.fixture()
+    def user(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def url(self):
+        return '/{}test/throttle/'.format(API_BASE)
+
+    def test_throttle_hits_are_counted_per_scope(self, app, url, user):
+        app.get(url, auth=user.auth)
+        app.get(url, auth=user.auth)
+        res = app.get(url, auth=user.auth, expect_errors=True)
+        assert res.status_code == 429
+        # 2/hour, so the next request is allowed half an hour after the first
+        assert 1790 <= int(res.headers['Retry-After']) <= 1800
+        assert instrumentation.registry.counters == {('osf_api_throttle_hits_total', 'test-user'): 1}
+        assert 'osf_api_throttle_hits_total{scope="test-user"} 1' in instrumentation.render_metrics()
+
+    def test_requests_are_allowed_again_as_the_bucket_refills(self, app, url, user):
+        with mock.patch.object(throttling.BaseThrottle, 'timer', return_value=1000000.0):
+            app.get(url, auth=user.auth)
+            app.get(url, auth=user.auth)
+            assert app.get(url, auth=user.auth, expect_errors=True).status_code == 429
+        with mock.patch.object(throttling.BaseThrottle, 'timer', return_value=1000000.0 + 1800):
+            assert app.get(url, auth=user.auth).status_code == 200
+            assert app.get(url, auth=user.auth, expect_errors=True).status_code == 429
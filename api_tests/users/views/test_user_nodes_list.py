@@ -353,6 +353,15 @@ class TestNodeListPermissionFiltering:
         assert len(res.json['data']) == 1
         assert [admin_node._id] == [node['id'] for node in res.json['data']]
 
+    def test_current_user_permissions_field(self, app, contrib, no_perm_node, read_node, write_node, admin_node):
+        url = '/{}users/me/nodes/'.format(API_BASE)
+        res = app.get(url, auth=contrib.auth)
+        assert {node['id']: node['attributes']['current_user_permissions'] for node in res.json['data']} == {
+            read_node._id: [permissions.READ],
+            write_node._id: [permissions.WRITE, permissions.READ],
+            admin_node._id: [permissions.ADMIN, permissions.WRITE, permissions.READ],
+        }
+
     def test_filter_my_current_user_permissions_to_other_users_nodes(self, app, contrib, no_perm_node, read_node, write_node, admin_node):
         url = '/{}users/{}/nodes/?filter[current_user_permissions]='.format(API_BASE, contrib._id)
 
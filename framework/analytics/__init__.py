@@ -32,6 +32,18 @@ def update_counter(resource, file, version, action, node_info=None):
     return PageCounter.update_counter(resource, file, version=version, action=action, node_info=node_info)
 
 
+def update_counters(resource, file, versions, action, node_info=None):
+    """Update the counters of several versions of a file at once.
+
+    :param obj resource
+    :param obj file
+    :param list versions, None for the counter of all versions
+    :param str action, ex. 'download'
+    """
+    from osf.models import PageCounter
+    return PageCounter.update_counters(resource, file, versions, action=action, node_info=node_info)
+
+
 def get_basic_counters(resource, file, version, action):
     from osf.models import PageCounter
     return PageCounter.get_basic_counters(resource, file, version=version, action=action)
@@ -0,0 +1,23 @@
+import logging
+
+from framework.celery_tasks import app
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name='framework.analytics.tasks.flush_page_counter_events', max_retries=0)
+def flush_page_counter_events(batch_size=None):
+    """Add the download and view hits recorded since the last run to their PageCounters."""
+    from osf.models import PageCounter
+    flushed = PageCounter.flush_events(batch_size)
+    logger.info('Flushed {} page counter events'.format(flushed))
+    return flushed
+
+
+@app.task(name='framework.analytics.tasks.flush_user_activity_events', max_retries=0)
+def flush_user_activity_events(batch_size=None):
+    """Add the user actions recorded since the last run to their UserActivityCounters."""
+    from osf.models import UserActivityCounter
+    flushed = UserActivityCounter.flush_events(batch_size)
+    logger.info('Flushed {} user activity events'.format(flushed))
+    return flushed
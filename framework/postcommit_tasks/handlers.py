@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 import functools
-import hashlib
 import logging
 import threading
+import time
+import weakref
 
 import binascii
 from collections import OrderedDict
 import os
 
+import gevent
 from celery.canvas import Signature
 from celery.local import PromiseProxy
-from gevent.pool import Pool
+from gevent.lock import BoundedSemaphore
+from gevent.pool import Group
 from flask import _app_ctx_stack as context_stack
 
 from website import settings
@@ -18,6 +21,10 @@ from website import settings
 _local = threading.local()
 logger = logging.getLogger(__name__)
 
+# One semaphore per gevent hub (i.e. per thread), bounding the post-commit tasks run at
+# once by all of the requests it serves
+_semaphores = weakref.WeakKeyDictionary()
+
 def postcommit_queue():
     if not hasattr(_local, 'postcommit_queue'):
         _local.postcommit_queue = OrderedDict()
@@ -32,6 +39,48 @@ def postcommit_before_request():
     _local.postcommit_queue = OrderedDict()
     _local.postcommit_celery_queue = OrderedDict()
 
+def get_postcommit_semaphore():
+    hub = gevent.get_hub()
+    if hub not in _semaphores:
+        _semaphores[hub] = BoundedSemaphore(settings.POSTCOMMIT_POOL_SIZE)
+    return _semaphores[hub]
+
+def task_name(task):
+    if isinstance(task, Signature):
+        return task.task
+    func = getattr(task, 'func', task)
+    return '{}.{}'.format(func.__module__, func.__name__)
+
+def record_timing(name, seconds):
+    """Record how long a task took in this process's instrumentation, for profiling."""
+    from api.base import instrumentation
+
+    instrumentation.registry.observe('osf_postcommit_task_seconds', name, seconds)
+
+def timed(task):
+    start = time.time()
+    try:
+        return task()
+    finally:
+        record_timing(task_name(task), time.time() - start)
+
+def run_limited(semaphore, task):
+    """Run ``task`` once one of the slots of ``semaphore`` is free. Waiting happens in the
+    task's own greenlet, so it counts against the request's budget instead of delaying it.
+    """
+    with semaphore:
+        return timed(task)
+
+def publish_celery_tasks(signatures):
+    """Publish ``signatures`` to the broker over a single connection."""
+    from framework.celery_tasks import app as celery_app
+
+    start = time.time()
+    with celery_app.producer_or_acquire() as producer:
+        for signature in signatures:
+            signature.apply_async(producer=producer)
+    record_timing('celery.publish', time.time() - start)
+
 def postcommit_after_request(response, base_status_error_code=500):
     if response.status_code >= base_status_error_code:
         _local.postcommit_queue = OrderedDict()
@@ -39,20 +88,19 @@ def postcommit_after_request(response, base_status_error_code=500):
         return response
     try:
         if postcommit_queue():
-            number_of_threads = 30  # one db connection per greenlet, let's share
-            pool = Pool(number_of_threads)
+            semaphore = get_postcommit_semaphore()
+            group = Group()
             for func in postcommit_queue().values():
-                pool.spawn(func)
-            pool.join(timeout=5.0, raise_error=True)  # 5 second timeout and reraise exceptions
+                group.spawn(run_limited, semaphore, func)
+            # Tasks still waiting or running after the budget carry on, as the response goes out
+            group.join(timeout=settings.POSTCOMMIT_TIMEOUT, raise_error=True)
 
         if postcommit_celery_queue():
             if settings.USE_CELERY:
-                for task_dict in postcommit_celery_queue().values():
-                    task = Signature.from_dict(task_dict)
-                    task.apply_async()
+                publish_celery_tasks([Signature.from_dict(task_dict) for task_dict in postcommit_celery_queue().values()])
             else:
                 for task in postcommit_celery_queue().values():
-                    task()
+                    timed(task)
 
     except AttributeError as ex:
         if not settings.DEBUG_MODE:
@@ -68,6 +116,16 @@ def get_task_from_postcommit_queue(name, predicate, celery=True):
         raise ValueError()
     return False
 
+def task_key(fn, args, kwargs):
+    """Key identifying a call of ``fn``, so that it is only queued once per request."""
+    key = (fn.__module__, fn.__name__, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        # Unhashable arguments (lists, dicts, sets): fall back to comparing their repr
+        key = (fn.__module__, fn.__name__, repr(args), repr(sorted(kwargs.items())))
+    return key
+
 def enqueue_postcommit_task(fn, args, kwargs, celery=False, once_per_request=True):
     """
     Any task queued with this function where celery=True will be run asynchronously.
@@ -76,15 +134,11 @@ def enqueue_postcommit_task(fn, args, kwargs, celery=False, once_per_request=Tru
         # For testing purposes only: run fn directly
         fn(*args, **kwargs)
     else:
-        # make a hash of the pertinent data
-        raw = [fn.__name__, fn.__module__, args, kwargs]
-        m = hashlib.md5()
-        m.update('-'.join([x.__repr__() for x in raw]).encode())
-        key = m.hexdigest()
+        key = task_key(fn, args, kwargs)
 
         if not once_per_request:
             # we want to run it once for every occurrence, add a random string
-            key = '{}:{}'.format(key, binascii.hexlify(os.urandom(8)))
+            key = (key, binascii.hexlify(os.urandom(8)))
 
         if celery and isinstance(fn, PromiseProxy):
             postcommit_celery_queue().update({key: fn.si(*args, **kwargs)})
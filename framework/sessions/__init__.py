@@ -14,7 +14,8 @@ from weakref import WeakKeyDictionary
 from werkzeug.local import LocalProxy
 
 from framework.flask import redirect
-from framework.sessions.utils import remove_session
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from framework.sessions.utils import load_session, remove_session, session_cache
 from website import settings
 
 
@@ -92,7 +93,7 @@ def create_session(response, data=None):
     current_session = get_session()
     if current_session:
         current_session.data.update(data or {})
-        current_session.save()
+        current_session.save_if_dirty()
         cookie_value = itsdangerous.Signer(settings.SECRET_KEY).sign(current_session._id)
     else:
         session_id = str(bson.objectid.ObjectId())
@@ -110,6 +111,16 @@ sessions = WeakKeyDictionary()
 session = LocalProxy(get_session)
 
 
+def update_date_last_login(user_id):
+    OSFUser = apps.get_model('osf.OSFUser')
+    (
+        OSFUser.objects
+        .filter(guids___id__isnull=False, guids___id=user_id)
+        # Throttle updates
+        .filter(Q(date_last_login__isnull=True) | Q(date_last_login__lt=timezone.now() - dt.timedelta(seconds=settings.DATE_LAST_LOGIN_THROTTLE)))
+    ).update(date_last_login=timezone.now())
+
+
 # Request callbacks
 # NOTE: This gets attached in website.app.init_app to ensure correct callback order
 def before_request():
@@ -132,8 +143,8 @@ def before_request():
             email=request.authorization.username,
             password=request.authorization.password
         )
-        # Create an empty session
-        # TODO: Shoudn't need to create a session for Basic Auth
+        # Create an empty session. It is never saved: no cookie refers to it, so it only lives
+        # for this request.
         user_session = Session()
         set_session(user_session)
 
@@ -147,9 +158,7 @@ def before_request():
                     return
             user_session.data['auth_user_username'] = user.username
             user_session.data['auth_user_fullname'] = user.fullname
-            if user_session.data.get('auth_user_id', None) != user._primary_key:
-                user_session.data['auth_user_id'] = user._primary_key
-                user_session.save()
+            user_session.data['auth_user_id'] = user._primary_key
         else:
             # Invalid key: Not found in database
             user_session.data['auth_error_code'] = http_status.HTTP_401_UNAUTHORIZED
@@ -159,19 +168,16 @@ def before_request():
     if cookie:
         try:
             session_id = itsdangerous.Signer(settings.SECRET_KEY).unsign(cookie)
-            user_session = Session.load(session_id) or Session(_id=session_id)
+            user_session = load_session(session_id) or Session(_id=session_id)
         except itsdangerous.BadData:
             return
         if not throttle_period_expired(user_session.created, settings.OSF_SESSION_TIMEOUT):
-            # Update date last login when making non-api requests
-            if user_session.data.get('auth_user_id') and 'api' not in request.url:
-                OSFUser = apps.get_model('osf.OSFUser')
-                (
-                    OSFUser.objects
-                    .filter(guids___id__isnull=False, guids___id=user_session.data['auth_user_id'])
-                    # Throttle updates
-                    .filter(Q(date_last_login__isnull=True) | Q(date_last_login__lt=timezone.now() - dt.timedelta(seconds=settings.DATE_LAST_LOGIN_THROTTLE)))
-                ).update(date_last_login=timezone.now())
+            # Update date last login when making non-api requests, at most once per throttle
+            # period and process for each user, after the response has been sent
+            user_id = user_session.data.get('auth_user_id')
+            if user_id and 'api' not in request.url:
+                if session_cache().add('last-login:{}'.format(user_id), True, timeout=settings.DATE_LAST_LOGIN_THROTTLE):
+                    enqueue_postcommit_task(update_date_last_login, (user_id, ), {}, celery=False)
             set_session(user_session)
         else:
             remove_session(user_session)
@@ -1,4 +1,77 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Cache backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_CACHES = (DummyCache, LocMemCache)
+
+
+def session_cache():
+    return caches[django_settings.SESSION_CACHE_NAME]
+
+
+def is_session_cache_shared():
+    """
+    Whether sessions can be cached: only in a cache shared by every process, so that a
+    session removed by one process (e.g. on logout) is not still accepted by the others.
+    """
+    return not isinstance(session_cache(), PROCESS_LOCAL_CACHES)
+
+
+def session_cache_key(session_id):
+    return 'session:{}'.format(session_id)
+
+
+def load_session(session_id):
+    """
+    Load a session by its id, from the session cache if possible.
+
+    :param session_id: str
+    :return: Session or None
+    """
+    from osf.models import Session
+
+    if not is_session_cache_shared():
+        return Session.load(session_id)
+
+    cached = session_cache().get(session_cache_key(session_id))
+    if cached is not None:
+        field_names, values = cached
+        return Session.from_db('default', field_names, values)
+
+    session = Session.load(session_id)
+    if session is not None:
+        cache_session(session)
+    return session
+
+
+def cache_session(session):
+    """
+    Store a session as loaded from the database in the session cache.
+
+    :param session: Session
+    """
+    if not is_session_cache_shared():
+        return
+    field_names = [field.attname for field in session._meta.concrete_fields]
+    values = [getattr(session, field_name) for field_name in field_names]
+    session_cache().set(session_cache_key(session._id), (field_names, values))
+
+
+def forget_sessions(session_ids):
+    """
+    Drop sessions from the session cache once the current transaction commits, so that the
+    cache is not refilled with their old rows before then.
+
+    :param session_ids: list of str
+    """
+    keys = [session_cache_key(session_id) for session_id in session_ids]
+    if keys and is_session_cache_shared():
+        session_cache().delete_many(keys)
+        transaction.on_commit(lambda: session_cache().delete_many(keys))
 
 
 def remove_sessions_for_user(user):
@@ -11,7 +84,9 @@ def remove_sessions_for_user(user):
     from osf.models import Session
 
     if user._id:
-        Session.objects.filter(data__auth_user_id=user._id).delete()
+        sessions = Session.objects.filter(data__auth_user_id=user._id)
+        forget_sessions(list(sessions.values_list('_id', flat=True)))
+        sessions.delete()
 
 
 def remove_session(session):
@@ -22,4 +97,5 @@ def remove_session(session):
     :return:
     """
     from osf.models import Session
+    forget_sessions([session._id])
     Session.objects.filter(id=session.id).delete()
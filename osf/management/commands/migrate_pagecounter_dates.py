@@ -0,0 +1,44 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from framework import sentry
+from framework.celery_tasks import app as celery_app
+from osf.models import PageCounter
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name='management.commands.migrate_pagecounter_dates')
+def migrate_pagecounter_dates(batch_size=1000, max_batches=None):
+    """Move the per-day counts kept in PageCounter.date to PageCounterDay rows."""
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = PageCounter.migrate_dates(batch_size)
+        batches += 1
+        logger.info('Moved the per-day counts of {} page counters'.format(moved))
+        if moved < batch_size:
+            sentry.log_message('Migrate pagecounter dates complete')
+            return
+
+
+class Command(BaseCommand):
+    help = '''Moves the per-day download and view counts of page counters out of their JSON date field into
+    PageCounterDay rows, in batches. Can be interrupted and run again until it is done.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='How many page counters to move per transaction',
+        )
+        parser.add_argument(
+            '--max_batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches',
+        )
+
+    def handle(self, *args, **options):
+        migrate_pagecounter_dates(options['batch_size'], options['max_batches'])
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from osf.models import NodeClosure
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Rebuilds or verifies osf_nodeclosure against osf_noderelation.
+
+    Run a rebuild before turning on the ``node_closure_table`` switch.
+
+    Examples:
+
+        python manage.py rebuild_node_closure
+        python manage.py rebuild_node_closure --verify
+    """
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            dest='verify',
+            help='Only report rows that are missing or stale; make no changes',
+        )
+
+    def handle(self, *args, **options):
+        if options.get('verify', False):
+            missing, stale = NodeClosure.objects.verify()
+            logger.info('{} missing and {} stale node closure rows'.format(missing, stale))
+            if missing or stale:
+                raise CommandError('Node closure table is out of date; rerun without --verify to rebuild it')
+        else:
+            count = NodeClosure.objects.rebuild()
+            logger.info('Wrote {} node closure rows'.format(count))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import osf.utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0193_create_search_update_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivejob',
+            name='bytes_archived',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivejob',
+            name='files_archived',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivejob',
+            name='last_progress',
+            field=osf.utils.fields.NonNaiveDateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivetarget',
+            name='copies_pending',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivetarget',
+            name='copies_total',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0194_archive_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCounterDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('unique', models.PositiveIntegerField(default=0)),
+                ('page_counter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='days', to='osf.PageCounter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PageCounterEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('daily_unique', models.BooleanField(default=False)),
+                ('counted', models.BooleanField(default=True)),
+                ('is_unique', models.BooleanField(default=False)),
+                ('page_counter', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.PageCounter')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pagecounterday',
+            unique_together=set([('page_counter', 'date')]),
+        ),
+    ]
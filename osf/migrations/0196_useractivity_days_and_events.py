@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0195_pagecounter_days_and_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('counter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='days', to='osf.UserActivityCounter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserActivityEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_guid', models.CharField(max_length=5)),
+                ('action', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='useractivityday',
+            unique_together=set([('counter', 'action', 'date')]),
+        ),
+    ]
@@ -1,7 +1,10 @@
+import base64
+import hashlib
 import logging
+import struct
 
 from dateutil import parser
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import Sum
 from django.db.models.expressions import RawSQL
 from django.utils import timezone
@@ -9,11 +12,63 @@ from django.utils import timezone
 from framework.sessions import session
 from osf.models.base import BaseModel, Guid
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
+from website import settings
 
 logger = logging.getLogger(__name__)
 
 
+# Folds a batch of UserActivityEvents into the totals and per-day rows of their users'
+# counters, creating counters as needed, and deletes them.
+FLUSH_USER_ACTIVITY_SQL = """
+    WITH events AS (
+        DELETE FROM osf_useractivityevent
+        WHERE id IN (
+            SELECT id FROM osf_useractivityevent ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+        )
+        RETURNING user_guid, action, date
+    ), counters AS (
+        INSERT INTO osf_useractivitycounter (_id, total, action, date, created, modified)
+        SELECT user_guid, COUNT(*), '{}'::jsonb, '{}'::jsonb, now(), now()
+        FROM events
+        GROUP BY user_guid
+        ON CONFLICT (_id) DO UPDATE SET
+            total = osf_useractivitycounter.total + EXCLUDED.total,
+            modified = EXCLUDED.modified
+        RETURNING id, _id
+    ), days AS (
+        INSERT INTO osf_useractivityday (counter_id, action, date, total)
+        SELECT counters.id, events.action, events.date, COUNT(*)
+        FROM events JOIN counters ON counters._id = events.user_guid
+        GROUP BY counters.id, events.action, events.date
+        ON CONFLICT (counter_id, action, date) DO UPDATE SET
+            total = osf_useractivityday.total + EXCLUDED.total
+    )
+    SELECT COUNT(*) FROM events
+"""
+
+
+def flush_in_batches(sql, batch_size):
+    """Run ``sql``, which folds up to ``batch_size`` buffered events and selects how many,
+    until the buffer is empty. Returns how many events were folded.
+    """
+    flushed = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [batch_size])
+            count = cursor.fetchone()[0]
+        flushed += count
+        if count < batch_size:
+            return flushed
+
+
 class UserActivityCounter(BaseModel):
+    """How many actions a user has taken, in total and per day.
+
+    ``increment`` appends to UserActivityEvent without locking the counter; ``flush_events``
+    adds the events to ``total`` and to the UserActivityDay rows in batches.
+    ``action`` and ``date`` hold the per-action and per-day counts recorded before
+    UserActivityDay existed; they are included in ``total`` and no longer updated.
+    """
     primary_identifier_name = '_id'
 
     _id = models.CharField(max_length=5, null=False, blank=False, db_index=True,
@@ -31,31 +86,132 @@ class UserActivityCounter(BaseModel):
 
     @classmethod
     def increment(cls, user_id, action, date_string):
-        date = parser.parse(date_string).strftime('%Y/%m/%d')
-        with transaction.atomic():
-            # select_for_update locks the row but only inside a transaction
-            uac, created = cls.objects.select_for_update().get_or_create(_id=user_id)
-            if uac.total > 0:
-                uac.total += 1
-            else:
-                uac.total = 1
-            if action in uac.action:
-                uac.action[action]['total'] += 1
-                if date in uac.action[action]['date']:
-                    uac.action[action]['date'][date] += 1
-                else:
-                    uac.action[action]['date'][date] = 1
-            else:
-                uac.action[action] = dict(total=1, date={date: 1})
-            if date in uac.date:
-                uac.date[date]['total'] += 1
-            else:
-                uac.date[date] = dict(total=1)
-            uac.save()
+        date = parser.parse(date_string).date()
+        UserActivityEvent.objects.create(user_guid=user_id, action=action, date=date)
+        return True
+
+    @classmethod
+    def flush_events(cls, batch_size=None):
+        """Add recorded actions to the counters in batches of ``batch_size``. Returns how many were added."""
+        return flush_in_batches(FLUSH_USER_ACTIVITY_SQL, batch_size or settings.USER_ACTIVITY_FLUSH_BATCH_SIZE)
+
+
+class UserActivityDay(models.Model):
+    """How many times a user took an action on one day."""
+    counter = models.ForeignKey(UserActivityCounter, related_name='days', on_delete=models.CASCADE)
+    action = models.CharField(max_length=255)
+    date = models.DateField()
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('counter', 'action', 'date')
+
+
+class UserActivityEvent(models.Model):
+    """An action of the user with the guid ``user_guid`` that has not been counted yet."""
+    user_guid = models.CharField(max_length=5)
+    action = models.CharField(max_length=255)
+    date = models.DateField()
+
+
+# Folds a batch of PageCounterEvents into the per-day rows and the totals of their
+# counters, and deletes them. SKIP LOCKED lets concurrent flushes take disjoint batches.
+FLUSH_EVENTS_SQL = """
+    WITH events AS (
+        DELETE FROM osf_pagecounterevent
+        WHERE id IN (
+            SELECT id FROM osf_pagecounterevent ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+        )
+        RETURNING page_counter_id, date, daily_unique, counted, is_unique
+    ), days AS (
+        INSERT INTO osf_pagecounterday (page_counter_id, date, total, "unique")
+        SELECT page_counter_id, date, COUNT(*), COUNT(*) FILTER (WHERE daily_unique)
+        FROM events
+        GROUP BY page_counter_id, date
+        ON CONFLICT (page_counter_id, date) DO UPDATE SET
+            total = osf_pagecounterday.total + EXCLUDED.total,
+            "unique" = osf_pagecounterday."unique" + EXCLUDED."unique"
+    ), totals AS (
+        UPDATE osf_pagecounter PC
+        SET total = PC.total + T.total, "unique" = PC."unique" + T."unique"
+        FROM (
+            SELECT page_counter_id, COUNT(*) FILTER (WHERE counted) AS total, COUNT(*) FILTER (WHERE is_unique) AS "unique"
+            FROM events
+            GROUP BY page_counter_id
+        ) T
+        WHERE PC.id = T.page_counter_id
+    )
+    SELECT COUNT(*) FROM events
+"""
+
+# Moves the legacy per-day JSON of a batch of PageCounters into PageCounterDay rows.
+MIGRATE_DATES_SQL = """
+    WITH counters AS (
+        SELECT id, date FROM osf_pagecounter
+        WHERE date <> '{}'::jsonb
+        ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+    ), days AS (
+        INSERT INTO osf_pagecounterday (page_counter_id, date, total, "unique")
+        SELECT counters.id, to_date(day.key, 'YYYY/MM/DD'),
+            COALESCE((day.value->>'total')::int, 0), COALESCE((day.value->>'unique')::int, 0)
+        FROM counters, jsonb_each(counters.date) day
+        ON CONFLICT (page_counter_id, date) DO UPDATE SET
+            total = osf_pagecounterday.total + EXCLUDED.total,
+            "unique" = osf_pagecounterday."unique" + EXCLUDED."unique"
+    ), cleared AS (
+        UPDATE osf_pagecounter SET date = '{}'::jsonb
+        WHERE id IN (SELECT id FROM counters)
+    )
+    SELECT COUNT(*) FROM counters
+"""
+
+
+class VisitedPages(object):
+    """The pages visited in a session, as a bounded set of 32-bit hashes of their keys.
+
+    Serializes to a string of at most ``SESSION_VISITED_PAGES_MAX`` hashes, so the session
+    stays small however many pages are visited. Once full, the pages visited longest ago
+    are forgotten and count as unique again if revisited; hash collisions make a new page
+    count as visited about once in 4 billion.
+    """
+    def __init__(self, serialized=None, pages=()):
+        packed = base64.b64decode(serialized) if serialized else b''
+        self.hashes = list(struct.unpack('<{}I'.format(len(packed) // 4), packed))
+        self.members = set(self.hashes)
+        for page in pages:
+            self.add(page)
+
+    @staticmethod
+    def hash(page):
+        return int(hashlib.md5(page.encode('utf-8')).hexdigest()[:8], 16)
+
+    def __contains__(self, page):
+        return self.hash(page) in self.members
+
+    def add(self, page):
+        """Add ``page``, returning whether it was not visited before."""
+        page_hash = self.hash(page)
+        if page_hash in self.members:
+            return False
+        self.hashes.append(page_hash)
+        self.members.add(page_hash)
+        while len(self.hashes) > settings.SESSION_VISITED_PAGES_MAX:
+            self.members.discard(self.hashes.pop(0))
         return True
 
+    def serialize(self):
+        return base64.b64encode(struct.pack('<{}I'.format(len(self.hashes)), *self.hashes)).decode('ascii')
+
 
 class PageCounter(BaseModel):
+    """Download and view counts of a file, or of one version of a file.
+
+    Hits are appended to PageCounterEvent by ``update_counters`` without locking the
+    counter; ``flush_events`` adds them to ``total``, ``unique`` and the per-day
+    PageCounterDay rows in batches, so the counts lag behind by up to one flush.
+    ``date`` holds the per-day counts recorded before PageCounterDay existed, until
+    ``manage.py migrate_pagecounter_dates`` moves them over.
+    """
     primary_identifier_name = '_id'
 
     _id = models.CharField(max_length=300, null=False, blank=False, db_index=True,
@@ -75,7 +231,7 @@ class PageCounter(BaseModel):
     def get_all_downloads_on_date(cls, date):
         """
         Queries the total number of downloads on a date
-        :param str date: must be formatted the same as a page counter key so 'yyyy/mm/dd'
+        :param datetime date: the day to count downloads on
         :return: long sum:
         """
         formatted_date = date.strftime('%Y/%m/%d')
@@ -84,9 +240,17 @@ class PageCounter(BaseModel):
 
         # Get the total download numbers from the nested dict on the PageCounter by annotating it as daily_total then
         # aggregating the sum.
-        daily_total = page_counters.annotate(daily_total=RawSQL("((date->%s->>'total')::int)", (formatted_date,))).aggregate(sum=Sum('daily_total'))['sum']
+        legacy_total = page_counters.annotate(daily_total=RawSQL("((date->%s->>'total')::int)", (formatted_date,))).aggregate(sum=Sum('daily_total'))['sum']
 
-        return daily_total
+        daily_total = PageCounterDay.objects.filter(
+            date=date,
+            page_counter__version__isnull=True,
+            page_counter__action='download'
+        ).aggregate(sum=Sum('total'))['sum']
+
+        if legacy_total is None and daily_total is None:
+            return None
+        return (legacy_total or 0) + (daily_total or 0)
 
     @staticmethod
     def clean_page(page):
@@ -96,22 +260,58 @@ class PageCounter(BaseModel):
             '$', '_'
         )
 
+    @staticmethod
+    def is_contributor(action, node_info):
+        """Whether the session's user is a contributor, whose downloads and views do not count."""
+        user_id = session.data.get('auth_user_id')
+        if action not in ('download', 'view') or not node_info or not user_id:
+            return False
+        return node_info['contributors'].filter(guids___id__isnull=False, guids___id=user_id).exists()
+
+    @staticmethod
+    def get_visited_pages(date_string=None):
+        """The pages visited in the session, ever or on the day of ``date_string``."""
+        if date_string is None:
+            # keep the most recent of the pages listed by sessions from before VisitedPages
+            legacy = session.data.get('visited', [])[-settings.SESSION_VISITED_PAGES_MAX:]
+            return VisitedPages(session.data.get('visited_pages'), legacy)
+        visited_by_date = session.data.get('visited_pages_by_date', {})
+        if visited_by_date.get('date') == date_string:
+            return VisitedPages(visited_by_date['pages'])
+        legacy = session.data.get('visited_by_date', {})
+        if legacy.get('date') == date_string:
+            return VisitedPages(pages=legacy['pages'][-settings.SESSION_VISITED_PAGES_MAX:])
+        return VisitedPages()
+
     @classmethod
     def update_counter(cls, resource, file, version, action, node_info):
-        if version is not None:
-            page = '{0}:{1}:{2}:{3}'.format(action, resource._id, file._id, version)
-        else:
-            page = '{0}:{1}:{2}'.format(action, resource._id, file._id)
+        cls.update_counters(resource, file, [version], action, node_info)
 
-        cleaned_page = cls.clean_page(page)
-        date = timezone.now()
+    @classmethod
+    def update_counters(cls, resource, file, versions, action, node_info):
+        """Record a hit on the counters of ``file`` for each of ``versions``, where a
+        version of None is the counter of all versions.
+        """
+        date = timezone.now().date()
         date_string = date.strftime('%Y/%m/%d')
-        visited_by_date = session.data.get('visited_by_date', {'date': date_string, 'pages': []})
-        with transaction.atomic():
+        counted = not cls.is_contributor(action, node_info)
+
+        visited = cls.get_visited_pages()
+        visited_today = cls.get_visited_pages(date_string)
+        session_changed = False
+
+        events = []
+        for version in versions:
+            if version is not None:
+                page = '{0}:{1}:{2}:{3}'.format(action, resource._id, file._id, version)
+            else:
+                page = '{0}:{1}:{2}'.format(action, resource._id, file._id)
+            cleaned_page = cls.clean_page(page)
+
             # Temporary backwards compat - when creating new PageCounters, temporarily keep writing to _id field.
             # After we're sure this is stable, we can stop writing to the _id field, and query on
             # resource/file/action/version
-            model_instance, created = cls.objects.select_for_update().get_or_create(
+            page_counter, created = cls.objects.get_or_create(
                 _id=cleaned_page,
                 resource=resource,
                 file=file,
@@ -119,59 +319,40 @@ class PageCounter(BaseModel):
                 version=version
             )
 
-            # if they visited something today
-            if date_string == visited_by_date['date']:
-                # if they haven't visited this page today
-                if cleaned_page not in visited_by_date['pages']:
-                    # if the model_instance has today in it
-                    if date_string in model_instance.date.keys():
-                        # increment the number of unique visitors for today
-                        model_instance.date[date_string]['unique'] += 1
-                    else:
-                        # set the number of unique visitors for today to 1
-                        model_instance.date[date_string] = dict(unique=1)
-            # if they haven't visited something today
-            else:
-                # set their visited by date to blank
-                visited_by_date['date'] = date_string
-                visited_by_date['pages'] = []
-                # if the model_instance has today in it
-                if date_string in model_instance.date.keys():
-                    # increment the number of unique visitors for today
-                    model_instance.date[date_string]['unique'] += 1
-                else:
-                    # set the number of unique visitors to 1
-                    model_instance.date[date_string] = dict(unique=1)
-
-            # update their sessions
-            visited_by_date['pages'].append(cleaned_page)
-            session.data['visited_by_date'] = visited_by_date
-
-            if date_string in model_instance.date.keys():
-                if 'total' not in model_instance.date[date_string].keys():
-                    model_instance.date[date_string].update(total=0)
-                model_instance.date[date_string]['total'] += 1
-            else:
-                model_instance.date[date_string] = dict(total=1)
-
-            # if a download counter is being updated, only perform the update
-            # if the user who is downloading isn't a contributor to the project
-            page_type = cleaned_page.split(':')[0]
-            if page_type in ('download', 'view') and node_info:
-                if node_info['contributors'].filter(guids___id__isnull=False, guids___id=session.data.get('auth_user_id')).exists():
-                    model_instance.save()
-                    return
-
-            visited = session.data.get('visited', [])
-            if page not in visited:
-                model_instance.unique += 1
-                visited.append(page)
-                session.data['visited'] = visited
+            daily_unique = visited_today.add(cleaned_page)
+            # downloads and views of contributors count towards the daily counts only
+            is_unique = counted and visited.add(page)
+            session_changed = session_changed or daily_unique or is_unique
+
+            events.append(PageCounterEvent(
+                page_counter=page_counter,
+                date=date,
+                daily_unique=daily_unique,
+                counted=counted,
+                is_unique=is_unique,
+            ))
 
+        PageCounterEvent.objects.bulk_create(events)
+
+        if session_changed or 'visited' in session.data or 'visited_by_date' in session.data:
+            # the unbounded lists of pages that sessions used to keep are replaced on their next hit
+            session.data.pop('visited', None)
+            session.data.pop('visited_by_date', None)
+            session.data['visited_pages'] = visited.serialize()
+            session.data['visited_pages_by_date'] = {'date': date_string, 'pages': visited_today.serialize()}
             session.save()
-            model_instance.total += 1
 
-            model_instance.save()
+    @classmethod
+    def flush_events(cls, batch_size=None):
+        """Add recorded hits to the counters in batches of ``batch_size``. Returns how many were added."""
+        return flush_in_batches(FLUSH_EVENTS_SQL, batch_size or settings.PAGE_COUNTER_FLUSH_BATCH_SIZE)
+
+    @classmethod
+    def migrate_dates(cls, batch_size):
+        """Move the legacy per-day JSON of up to ``batch_size`` counters to PageCounterDay. Returns how many were moved."""
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(MIGRATE_DATES_SQL, [batch_size])
+            return cursor.fetchone()[0]
 
     @classmethod
     def get_basic_counters(cls, resource, file, version, action):
@@ -180,3 +361,28 @@ class PageCounter(BaseModel):
             return (counter.unique, counter.total)
         except cls.DoesNotExist:
             return (None, None)
+
+
+class PageCounterDay(models.Model):
+    """The hits on a PageCounter on one day, and how many sessions they came from."""
+    page_counter = models.ForeignKey(PageCounter, related_name='days', on_delete=models.CASCADE)
+    date = models.DateField()
+    total = models.PositiveIntegerField(default=0)
+    unique = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('page_counter', 'date')
+
+
+class PageCounterEvent(models.Model):
+    """A hit on a PageCounter that has not been added to its counts yet.
+
+    ``counted`` is False for contributors' hits, which only count towards the day.
+    ``daily_unique`` and ``is_unique`` mark the first hit of the session on the day and ever.
+    """
+    # Unindexed, so that recording a hit is a single cheap insert
+    page_counter = models.ForeignKey(PageCounter, related_name='+', on_delete=models.CASCADE, db_index=False)
+    date = models.DateField()
+    daily_unique = models.BooleanField(default=False)
+    counted = models.BooleanField(default=True)
+    is_unique = models.BooleanField(default=False)
@@ -1,6 +1,7 @@
 from django.contrib.postgres.fields import ArrayField
 from django.utils import timezone
 from django.db import models
+from django.db.models import F, Q
 
 from osf.utils.fields import NonNaiveDateTimeField
 from website import settings
@@ -33,6 +34,9 @@ class ArchiveTarget(ObjectIDMixin, BaseModel):
     # }
     stat_result = DateTimeAwareJSONField(default=dict, blank=True)
     errors = ArrayField(models.TextField(), default=list, blank=True)
+    # WaterButler copies of a batched target, and how many have not called back yet
+    copies_total = models.IntegerField(default=0)
+    copies_pending = models.IntegerField(default=0)
 
     def __repr__(self):
         return '<{0}(_id={1}, name={2}, status={3})>'.format(
@@ -61,6 +65,11 @@ class ArchiveJob(ObjectIDMixin, BaseModel):
 
     target_addons = models.ManyToManyField('ArchiveTarget')
 
+    # Progress of the copies, used to measure throughput and detect stalled jobs
+    files_archived = models.IntegerField(default=0)
+    bytes_archived = models.BigIntegerField(default=0)
+    last_progress = NonNaiveDateTimeField(null=True, blank=True)
+
     def __repr__(self):
         return (
             '<{ClassName}(_id={self._id}, done={self.done}, '
@@ -87,6 +96,25 @@ class ArchiveJob(ObjectIDMixin, BaseModel):
             if target.status not in (ARCHIVER_SUCCESS, ARCHIVER_FAILURE)
         ])
 
+    @property
+    def throughput(self):
+        """Bytes archived per second, from initiation to the last progress."""
+        if not self.last_progress:
+            return 0.0
+        elapsed = (self.last_progress - self.datetime_initiated).total_seconds()
+        return self.bytes_archived / elapsed if elapsed > 0 else 0.0
+
+    @classmethod
+    def find_stalled(cls, stalled_timedelta=None):
+        """Unfinished jobs that have archived nothing for `stalled_timedelta`
+        (default: ARCHIVE_STALLED_TIMEDELTA).
+        """
+        stalled_since = timezone.now() - (stalled_timedelta or settings.ARCHIVE_STALLED_TIMEDELTA)
+        return cls.objects.filter(done=False).filter(
+            Q(last_progress__lt=stalled_since) |
+            Q(last_progress__isnull=True, datetime_initiated__lt=stalled_since)
+        )
+
     def info(self):
         return self.src_node, self.dst_node, self.initiator
 
@@ -162,6 +190,26 @@ class ArchiveJob(ObjectIDMixin, BaseModel):
             self._set_target(addon)
         self.save()
 
+    def record_copy(self, addon_short_name, source_path=None):
+        """Account for a finished WaterButler copy of `source_path` of an addon.
+
+        :return: whether the addon has no copies left, i.e. its target is archived
+        """
+        target = self.get_target(addon_short_name)
+        progress = target.stat_result
+        if progress.get('batched'):
+            progress = next((unit for unit in progress['targets'] if unit['target_id'] == source_path), {})
+        ArchiveJob.objects.filter(id=self.id).update(
+            files_archived=F('files_archived') + progress.get('num_files', 0),
+            bytes_archived=F('bytes_archived') + int(progress.get('disk_usage', 0)),
+            last_progress=timezone.now(),
+        )
+        if not target.copies_pending:
+            return True
+        ArchiveTarget.objects.filter(id=target.id).update(copies_pending=F('copies_pending') - 1)
+        target.refresh_from_db(fields=['copies_pending'])
+        return target.copies_pending <= 0
+
     def update_target(self, addon_short_name, status, stat_result=None, errors=None):
         stat_result = stat_result or {}
         errors = errors or []
@@ -24,6 +24,7 @@ from osf.models.validators import validate_location
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 from osf.utils.fields import NonNaiveDateTimeField
 from api.base.utils import waterbutler_api_url_for
+from api.caching.tasks import update_storage_usage
 from website.files import utils
 from website.files.exceptions import VersionNotFoundError
 from website.util import api_v2_url, web_url_for, api_url_for
@@ -663,6 +664,8 @@ class TrashedFileNode(BaseFileNode):
 
         if save:
             self.save()
+            if self.is_file and self.provider == 'osfstorage':
+                update_storage_usage(self.target, self.versions.aggregate(sum=models.Sum('size'))['sum'] or 0)
 
         return self
 
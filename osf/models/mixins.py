@@ -8,7 +8,7 @@ from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models, transaction
 from django.utils import timezone
 from django.utils.functional import cached_property
-from guardian.shortcuts import assign_perm, get_perms, remove_perm, get_group_perms
+from guardian.shortcuts import assign_perm, get_perms, remove_perm
 
 from include import IncludeQuerySet
 
@@ -31,6 +31,7 @@ from osf.models.tag import Tag
 from osf.models.validators import validate_subject_hierarchy, validate_email, expand_subject_hierarchy
 from osf.utils.fields import NonNaiveDateTimeField
 from osf.utils.machines import ReviewsMachine, NodeRequestMachine, PreprintRequestMachine
+from osf.utils.permission_resolver import get_object_type, get_resolver
 from osf.utils.permissions import ADMIN, REVIEW_GROUPS, READ, WRITE
 from osf.utils.workflows import DefaultStates, DefaultTriggers, ReviewStates, ReviewTriggers
 from osf.utils.requests import get_request_and_user_id
@@ -982,10 +983,7 @@ class ContributorMixin(models.Model):
 
         Important: having admin permissions through group membership but being a write contributor doesn't suffice.
         """
-        if not user or user.is_anonymous:
-            return False
-
-        return self.has_permission(user, ADMIN) and self.get_group(ADMIN) in user.groups.all()
+        return get_resolver().in_group(user, self, ADMIN)
 
     def active_contributors(self, include=lambda n: True):
         """
@@ -1558,15 +1556,12 @@ class ContributorMixin(models.Model):
         :param str permission: Required permission
         :returns: User has required permission
         """
-        Preprint = apps.get_model('osf.Preprint')
-        object_type = 'preprint' if isinstance(self, Preprint) else 'node'
-
         if not user or user.is_anonymous:
             return False
+        object_type = get_object_type(self)
         perm = '{}_{}'.format(permission, object_type)
-        # Using get_group_perms to get permissions that are inferred through
-        # group membership - not inherited from superuser status
-        has_permission = perm in get_group_perms(user, self)
+        # Permissions that are inferred through group membership - not inherited from superuser status
+        has_permission = perm in get_resolver().get_perms(user, self)
         if object_type == 'node':
             if not has_permission and permission == READ and check_parent:
                 return self.is_admin_parent(user)
@@ -1612,12 +1607,10 @@ class ContributorMixin(models.Model):
             self.save()
 
     def clear_permissions(self, user):
-        for name in self.groups.keys():
-            if user.groups.filter(name=self.get_group(name)).exists():
-                self.remove_permission(user, name)
+        user.groups.remove(*user.groups.filter(name__in=self.group_names))
 
     def belongs_to_permission_group(self, user, permission):
-        return self.get_group(permission).user_set.filter(id=user.id).exists()
+        return user.groups.filter(name=self.format_group(permission)).exists()
 
     def remove_permission(self, user, permission, save=False):
         """Revoke permission from a user.
@@ -1,5 +1,4 @@
 import functools
-import itertools
 import logging
 import re
 from future.moves.urllib.parse import urljoin
@@ -7,7 +6,10 @@ import warnings
 from rest_framework import status as http_status
 
 import bson
-from django.db.models import Q
+import waffle
+from django.db.models import BooleanField, Case, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
 from dirtyfields import DirtyFieldsMixin
 from django.apps import apps
 from django_bulk_update.helper import bulk_update
@@ -28,13 +30,14 @@ from guardian.models import (
     GroupObjectPermissionBase,
     UserObjectPermissionBase,
 )
-from guardian.shortcuts import get_objects_for_user, get_groups_with_perms, get_group_perms
+from guardian.shortcuts import get_objects_for_user, get_groups_with_perms
 
 from framework import status
 from framework.auth import oauth_scopes
 from framework.celery_tasks.handlers import enqueue_task, get_task_from_queue
 from framework.exceptions import PermissionsError, HTTPError
 from framework.sentry import log_exception
+from osf import features
 from osf.exceptions import (InvalidTagError, NodeStateError,
                             TagNotFoundError, UserNotAffiliatedError)
 from osf.models.contributor import Contributor
@@ -44,7 +47,8 @@ from osf.models.identifiers import Identifier, IdentifierMixin
 from osf.models.licenses import NodeLicenseRecord
 from osf.models.mixins import (AddonModelMixin, CommentableMixin, Loggable, ContributorMixin, GuardianMixin,
                                NodeLinkMixin, Taggable, TaxonomizableMixin, SpamOverrideMixin)
-from osf.models.node_relation import NodeRelation
+from osf.models.node_relation import NodeClosure, NodeRelation
+from osf.models.node_tree import NodeTree
 from osf.models.nodelog import NodeLog
 from osf.models.sanctions import RegistrationApproval
 from osf.models.private_link import PrivateLink
@@ -54,6 +58,7 @@ from osf.models.validators import validate_title, validate_doi
 from framework.auth.core import Auth
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 from osf.utils.fields import NonNaiveDateTimeField
+from osf.utils.permission_resolver import get_resolver
 from osf.utils.requests import get_request_and_user_id, string_type_request_headers
 from osf.utils import sanitize
 from website import language, settings
@@ -69,6 +74,7 @@ from osf.utils.permissions import (
     ADMIN_NODE,
     CONTRIB_PERMISSIONS,
     CREATOR_PERMISSIONS,
+    PERMISSION_LEVELS,
     PERMISSIONS,
     READ,
     READ_NODE,
@@ -83,6 +89,38 @@ from api.caching.utils import storage_usage_cache
 
 logger = logging.getLogger(__name__)
 
+IMPLICIT_ADMIN_SQL = """
+    WITH RECURSIVE implicit_read AS (
+        SELECT N.id as node_id
+        FROM osf_abstractnode as N, auth_permission as P, osf_nodegroupobjectpermission as G, osf_osfuser_groups as UG
+        WHERE P.codename = 'admin_node'
+        AND G.permission_id = P.id
+        AND UG.osfuser_id = %s
+        AND G.group_id = UG.group_id
+        AND G.content_object_id = N.id
+        AND N.type = 'osf.node'
+    UNION ALL
+        SELECT "osf_noderelation"."child_id"
+        FROM "implicit_read"
+        LEFT JOIN "osf_noderelation" ON "osf_noderelation"."parent_id" = "implicit_read"."node_id"
+        WHERE "osf_noderelation"."is_node_link" IS FALSE
+    ) SELECT * FROM implicit_read
+"""
+
+
+def implicit_admin_query(user):
+    """Q of the projects ``user`` is an admin of, as a contributor or through an OSF Group,
+    and of all of their components, which admins of a project can implicitly read.
+    """
+    if waffle.switch_is_active(features.NODE_CLOSURE_TABLE):
+        admin_nodes = NodeGroupObjectPermission.objects.filter(
+            permission__codename=ADMIN_NODE,
+            group__user=user,
+            content_object__type='osf.node',
+        ).values('content_object_id')
+        return Q(id__in=admin_nodes) | Q(id__in=NodeClosure.objects.filter(ancestor_id__in=admin_nodes).values('descendant_id'))
+    return Q(id__in=RawSQL(IMPLICIT_ADMIN_SQL, (user.id, )))
+
 
 class AbstractNodeQuerySet(GuidMixinQuerySet):
 
@@ -97,6 +135,14 @@ class AbstractNodeQuerySet(GuidMixinQuerySet):
             if active:
                 query = query.filter(is_deleted=False)
             return query
+        elif waffle.switch_is_active(features.NODE_CLOSURE_TABLE):
+            query = Q(id__in=NodeClosure.objects.filter(ancestor_id=root.pk).values('descendant_id'))
+            if include_root:
+                query |= Q(id=root.pk)
+            nodes = AbstractNode.objects.filter(query)
+            if active:
+                nodes = nodes.filter(is_deleted=False)
+            return nodes
         else:
             sql = """
                 WITH RECURSIVE descendants AS (
@@ -153,27 +199,39 @@ class AbstractNodeQuerySet(GuidMixinQuerySet):
         if user is not None and not isinstance(user, AnonymousUser):
             read_user_query = get_objects_for_user(user, READ_NODE, self, with_superuser=False)
             qs |= read_user_query
-            qs |= self.extra(where=["""
-                "osf_abstractnode".id in (
-                    WITH RECURSIVE implicit_read AS (
-                        SELECT N.id as node_id
-                        FROM osf_abstractnode as N, auth_permission as P, osf_nodegroupobjectpermission as G, osf_osfuser_groups as UG
-                        WHERE P.codename = 'admin_node'
-                        AND G.permission_id = P.id
-                        AND UG.osfuser_id = %s
-                        AND G.group_id = UG.group_id
-                        AND G.content_object_id = N.id
-                        AND N.type = 'osf.node'
-                    UNION ALL
-                        SELECT "osf_noderelation"."child_id"
-                        FROM "implicit_read"
-                        LEFT JOIN "osf_noderelation" ON "osf_noderelation"."parent_id" = "implicit_read"."node_id"
-                        WHERE "osf_noderelation"."is_node_link" IS FALSE
-                    ) SELECT * FROM implicit_read
-                )
-            """], params=(user.id, ))
+            qs |= self.filter(implicit_admin_query(user))
         return qs.filter(is_deleted=False)
 
+    def annotate_user_permissions(self, user):
+        """Annotate the nodes with the permissions of ``user`` on them, computed in the same query:
+
+        - ``user_permission_level``: the ``PERMISSION_LEVELS`` level of the highest permission the
+          user has on the node as a contributor or through an OSF Group, or 0 if they have none
+        - ``user_is_admin_parent``: whether the user can implicitly read the node as an admin of
+          it or of one of its ancestors
+        """
+        if user is None or isinstance(user, AnonymousUser):
+            return self.annotate(
+                user_permission_level=Value(0, output_field=IntegerField()),
+                user_is_admin_parent=Value(False, output_field=BooleanField()),
+            )
+        levels = NodeGroupObjectPermission.objects.filter(
+            group__user=user,
+            content_object_id=OuterRef('pk'),
+        ).annotate(level=Case(
+            *[When(permission__codename=codename, then=Value(level)) for codename, level in PERMISSION_LEVELS.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )).order_by('-level').values('level')[:1]
+        return self.annotate(
+            user_permission_level=Coalesce(Subquery(levels, output_field=IntegerField()), Value(0)),
+            user_is_admin_parent=Case(
+                When(implicit_admin_query(user), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            ),
+        )
+
 
 class AbstractNodeManager(TypedModelManager, IncludeManager):
 
@@ -193,6 +251,9 @@ class AbstractNodeManager(TypedModelManager, IncludeManager):
     def can_view(self, user=None, private_link=None):
         return self.get_queryset().can_view(user=user, private_link=private_link)
 
+    def annotate_user_permissions(self, user):
+        return self.get_queryset().annotate_user_permissions(user)
+
     def get_nodes_for_user(self, user, permission=READ_NODE, base_queryset=None, include_public=False):
         """
         Return all AbstractNodes that the user has permissions to - either through contributorship or group membership.
@@ -205,7 +266,6 @@ class AbstractNodeManager(TypedModelManager, IncludeManager):
         :param include_public: If True, will include public nodes in query that user may not have explicit perms to
         :returns node queryset that the user has perms to
         """
-        OSFUserGroup = apps.get_model('osf', 'osfuser_groups')
         if base_queryset is None:
             base_queryset = self
 
@@ -213,10 +273,14 @@ class AbstractNodeManager(TypedModelManager, IncludeManager):
             raise ValueError('Permission must be one of {}, {}, or {}.'.format(PERMISSIONS[0], PERMISSIONS[1], PERMISSIONS[2]))
 
         nodes = base_queryset.filter(is_deleted=False)
-        permission_object_id = Permission.objects.get(codename=permission).id
-        user_groups = OSFUserGroup.objects.filter(osfuser_id=user.id if user else None).values_list('group_id', flat=True)
-        node_groups = NodeGroupObjectPermission.objects.filter(group_id__in=user_groups, permission_id=permission_object_id).values_list('content_object_id', flat=True)
-        query = Q(id__in=node_groups)
+        if user and user.id:
+            node_groups = NodeGroupObjectPermission.objects.filter(
+                group__user=user,
+                permission__codename=permission,
+            ).values('content_object_id')
+            query = Q(id__in=node_groups)
+        else:
+            query = Q(id__in=[])
         if include_public:
             query |= Q(is_public=True)
         return nodes.filter(query)
@@ -715,7 +779,9 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
     def bulk_update_search(cls, nodes, index=None):
         from website import search
         try:
-            serialize = functools.partial(search.search.update_node, index=index, bulk=True, async_update=False)
+            nodes = list(nodes)
+            prefetched = search.search.prefetch_nodes(nodes)
+            serialize = functools.partial(search.search.update_node, index=index, bulk=True, async_update=False, prefetched=prefetched)
             search.search.bulk_update_nodes(serialize, nodes, index=index)
         except search.exceptions.SearchUnavailableError as e:
             logger.exception(e)
@@ -893,7 +959,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         if isinstance(user, AnonymousUser):
             return []
         # Returns perms either through contributorship or group membership
-        user_perms = sorted(set(get_group_perms(user, self)).intersection(PERMISSIONS), key=PERMISSIONS.index)
+        user_perms = sorted(get_resolver().get_perms(user, self).intersection(PERMISSIONS), key=PERMISSIONS.index)
         return [CONTRIB_PERMISSIONS[perm] for perm in user_perms]
 
     def has_permission_on_children(self, user, permission):
@@ -914,15 +980,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
                                     Useful for checking parent permissions for non-group actions like registrations.
         :return: bool Does the user have admin permissions on this object or its parents?
         """
-        if self.has_permission(user, ADMIN, check_parent=False):
-            ret = True
-            if not include_group_admin and not self.is_contributor(user):
-                ret = False
-            return ret
-        parent = self.parent_node
-        if parent:
-            return parent.is_admin_parent(user, include_group_admin=include_group_admin)
-        return False
+        return get_resolver().is_admin_parent(user, self, include_group_admin=include_group_admin)
 
     def find_readable_descendants(self, auth):
         """ Returns a generator of first descendant node(s) readable by <user>
@@ -1587,19 +1645,12 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
     def get_primary(self, node):
         return NodeRelation.objects.filter(parent=self, child=node, is_node_link=False).exists()
 
-    # TODO optimize me
+    def get_node_tree(self):
+        """Return a NodeTree that loads this node's whole subtree in a constant number of queries."""
+        return NodeTree(self)
+
     def get_descendants_recursive(self, primary_only=False):
-        query = self.nodes_primary if primary_only else self._nodes
-        for node in query.all():
-            yield node
-            if not primary_only:
-                primary = self.get_primary(node)
-                if primary:
-                    for descendant in node.get_descendants_recursive(primary_only=primary_only):
-                        yield descendant
-            else:
-                for descendant in node.get_descendants_recursive(primary_only=primary_only):
-                    yield descendant
+        return self.get_node_tree().get_descendants(primary_only=primary_only)
 
     @property
     def nodes_primary(self):
@@ -1615,12 +1666,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         """Recursively checks whether the current node or any of its nodes
         contains a pointer.
         """
-        if self.linked_nodes.exists():
-            return True
-        for node in self.nodes_primary:
-            if node.has_pointers_recursive:
-                return True
-        return False
+        return self.get_node_tree().has_pointers()
 
     def add_affiliations(self, user, new):
         # add all of the user's affiliations to the forked or templated node
@@ -1886,22 +1932,14 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
 
         returns a list of [(node, [children]), ...]
         """
-        ret = []
-        for node in self._nodes.order_by('created').all():
-            if condition(auth, node):
-                # base case
-                ret.append((node, []))
-            else:
-                ret.append((node, node.next_descendants(auth, condition)))
-        ret = [item for item in ret if item[1] or condition(auth, item[0])]  # prune empty branches
-        return ret
+        return self.get_node_tree().next_descendants(auth, condition)
 
     def node_and_primary_descendants(self):
         """Return an iterator for a node and all of its primary (non-pointer) descendants.
 
         :param node Node: target Node
         """
-        return itertools.chain([self], self.get_descendants_recursive(primary_only=True))
+        return self.get_node_tree().node_and_primary_descendants()
 
     def get_active_contributors_recursive(self, unique_users=False, *args, **kwargs):
         """Yield (admin, node) tuples for this node and
@@ -1910,15 +1948,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         :param bool unique_users: If True, a given admin will only be yielded once
             during iteration.
         """
-        visited_user_ids = []
-        for node in self.node_and_primary_descendants(*args, **kwargs):
-            for contrib in node.active_contributors(*args, **kwargs):
-                if unique_users:
-                    if contrib._id not in visited_user_ids:
-                        visited_user_ids.append(contrib._id)
-                        yield (contrib, node)
-                else:
-                    yield (contrib, node)
+        return self.get_node_tree().get_active_contributors(unique_users=unique_users)
 
     def get_admin_contributors_recursive(self, unique_users=False, *args, **kwargs):
         """Yield (admin, node) tuples for this node and
@@ -1928,16 +1958,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         :param bool unique_users: If True, a given admin will only be yielded once
             during iteration.
         """
-        visited_user_ids = []
-        for node in self.node_and_primary_descendants(*args, **kwargs):
-            for contrib in node.contributors.all():
-                if node.has_permission(contrib, ADMIN) and contrib.is_active:
-                    if unique_users:
-                        if contrib._id not in visited_user_ids:
-                            visited_user_ids.append(contrib._id)
-                            yield (contrib, node)
-                    else:
-                        yield (contrib, node)
+        return self.get_node_tree().get_admin_contributors(unique_users=unique_users)
 
     def set_access_requests_enabled(self, access_requests_enabled, auth, save=False):
         user = auth.user
@@ -2429,7 +2450,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         key = cache_settings.STORAGE_USAGE_KEY.format(target_id=self._id)
 
         storage_usage_total = storage_usage_cache.get(key)
-        if storage_usage_total:
+        if storage_usage_total is not None:
             return storage_usage_total
         else:
             update_storage_usage(self)  # sets cache
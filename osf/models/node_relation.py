@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 from .base import BaseModel, ObjectIDMixin
 
@@ -25,3 +27,116 @@ class NodeRelation(ObjectIDMixin, BaseModel):
         index_together = (
             ('is_node_link', 'child', 'parent'),
         )
+
+
+CLOSURE_SQL = """
+    WITH RECURSIVE closure(ancestor_id, descendant_id, depth, path) AS (
+        SELECT parent_id, child_id, 1, ARRAY[parent_id, child_id]
+        FROM osf_noderelation
+        WHERE is_node_link IS FALSE
+    UNION ALL
+        SELECT closure.ancestor_id, R.child_id, closure.depth + 1, closure.path || R.child_id
+        FROM closure
+        JOIN osf_noderelation AS R ON R.parent_id = closure.descendant_id
+        WHERE R.is_node_link IS FALSE
+        AND NOT R.child_id = ANY(closure.path)
+    ) SELECT ancestor_id, descendant_id, MIN(depth) AS depth
+    FROM closure
+    GROUP BY ancestor_id, descendant_id
+"""
+
+
+class NodeClosureManager(models.Manager):
+
+    def add_relation(self, parent_id, child_id):
+        """Link every ancestor of ``parent_id`` (and itself) to every descendant of ``child_id`` (and itself)."""
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO osf_nodeclosure (ancestor_id, descendant_id, depth)
+                SELECT A.ancestor_id, D.descendant_id, A.depth + D.depth + 1
+                FROM (
+                    SELECT ancestor_id, depth FROM osf_nodeclosure WHERE descendant_id = %(parent_id)s
+                    UNION ALL SELECT %(parent_id)s, 0
+                ) AS A
+                CROSS JOIN (
+                    SELECT descendant_id, depth FROM osf_nodeclosure WHERE ancestor_id = %(child_id)s
+                    UNION ALL SELECT %(child_id)s, 0
+                ) AS D
+                ON CONFLICT (ancestor_id, descendant_id) DO NOTHING
+            """, {'parent_id': parent_id, 'child_id': child_id})
+
+    def remove_relation(self, parent_id, child_id):
+        """Unlink the subtree rooted at ``child_id`` from ``parent_id`` and everything above it.
+
+        Components have a single parent, so no other path can still connect the two halves.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM osf_nodeclosure
+                WHERE ancestor_id IN (
+                    SELECT ancestor_id FROM osf_nodeclosure WHERE descendant_id = %(parent_id)s
+                    UNION ALL SELECT %(parent_id)s
+                )
+                AND descendant_id IN (
+                    SELECT descendant_id FROM osf_nodeclosure WHERE ancestor_id = %(child_id)s
+                    UNION ALL SELECT %(child_id)s
+                )
+            """, {'parent_id': parent_id, 'child_id': child_id})
+
+    def rebuild(self):
+        """Recompute the whole table from osf_noderelation. Returns the number of rows written."""
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE osf_nodeclosure IN EXCLUSIVE MODE')
+                cursor.execute('DELETE FROM osf_nodeclosure')
+                cursor.execute('INSERT INTO osf_nodeclosure (ancestor_id, descendant_id, depth) ' + CLOSURE_SQL)
+                return cursor.rowcount
+
+    def verify(self):
+        """Compare the table with osf_noderelation.
+
+        :return: tuple of (number of missing or wrong rows, number of stale rows)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                WITH expected AS ({closure})
+                SELECT
+                    (SELECT COUNT(*) FROM (
+                        SELECT ancestor_id, descendant_id, depth FROM expected
+                        EXCEPT SELECT ancestor_id, descendant_id, depth FROM osf_nodeclosure
+                    ) AS missing),
+                    (SELECT COUNT(*) FROM (
+                        SELECT ancestor_id, descendant_id, depth FROM osf_nodeclosure
+                        EXCEPT SELECT ancestor_id, descendant_id, depth FROM expected
+                    ) AS stale)
+            """.format(closure=CLOSURE_SQL))
+            return cursor.fetchone()
+
+
+class NodeClosure(models.Model):
+    """Transitive closure of the component tree (node links are excluded).
+
+    One row per (ancestor, descendant) pair, where ``depth`` is the number of
+    relations between them; a node is not its own ancestor. Kept up to date by
+    the NodeRelation signals below and rebuilt by ``manage.py rebuild_node_closure``.
+    """
+    ancestor = models.ForeignKey('AbstractNode', related_name='+', on_delete=models.CASCADE)
+    descendant = models.ForeignKey('AbstractNode', related_name='+', on_delete=models.CASCADE)
+    depth = models.PositiveIntegerField()
+
+    objects = NodeClosureManager()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+
+
+@receiver(post_save, sender=NodeRelation)
+def add_node_closure(sender, instance, created, **kwargs):
+    if created and not instance.is_node_link:
+        NodeClosure.objects.add_relation(instance.parent_id, instance.child_id)
+
+
+@receiver(post_delete, sender=NodeRelation)
+def remove_node_closure(sender, instance, **kwargs):
+    if not instance.is_node_link:
+        NodeClosure.objects.remove_relation(instance.parent_id, instance.child_id)
@@ -0,0 +1,165 @@
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import connection
+from django.utils.functional import cached_property
+
+from osf.utils.permissions import ADMIN_NODE
+
+
+SUBTREE_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT parent_id, child_id, is_node_link, _order, 1 AS depth
+        FROM osf_noderelation
+        WHERE parent_id = %s
+    UNION ALL
+        SELECT R.parent_id, R.child_id, R.is_node_link, R._order, tree.depth + 1
+        FROM tree
+        JOIN osf_noderelation AS R ON R.parent_id = tree.child_id
+        WHERE tree.is_node_link IS FALSE
+    ) SELECT parent_id, child_id, is_node_link
+    FROM tree
+    ORDER BY depth, parent_id, _order
+"""
+
+
+class NodeTree(object):
+    """In-memory view of a node and everything below it.
+
+    The relations of the whole subtree are fetched with a single query, and the
+    nodes, contributors and admin permissions with one query each the first time
+    they are needed. Components are recursed into; node links are leaves.
+
+    Usage:
+
+        tree = NodeTree(node)
+        for descendant in tree.get_descendants(primary_only=True):
+            ...
+    """
+    def __init__(self, root):
+        self.root = root
+
+    @cached_property
+    def _relations(self):
+        """Map of parent id -> list of (child id, is_node_link), in NodeRelation order."""
+        relations = defaultdict(list)
+        with connection.cursor() as cursor:
+            cursor.execute(SUBTREE_SQL, [self.root.id])
+            for parent_id, child_id, is_node_link in cursor.fetchall():
+                relations[parent_id].append((child_id, is_node_link))
+        return relations
+
+    @cached_property
+    def nodes(self):
+        """Map of node id -> node for every node in the tree, including linked nodes."""
+        AbstractNode = apps.get_model('osf.AbstractNode')
+        ids = {child_id for children in self._relations.values() for child_id, _ in children}
+        nodes = {node.id: node for node in AbstractNode.objects.filter(id__in=ids)}
+        nodes[self.root.id] = self.root
+        return nodes
+
+    @cached_property
+    def _contributors(self):
+        """Map of node id -> list of Contributors (with users), in contributor order."""
+        Contributor = apps.get_model('osf.Contributor')
+        contributors = defaultdict(list)
+        queryset = (
+            Contributor.objects.filter(node_id__in=self.primary_ids)
+            .select_related('user')
+            .order_by('node_id', '_order')
+        )
+        for contributor in queryset:
+            contributors[contributor.node_id].append(contributor)
+        return contributors
+
+    @cached_property
+    def _admin_user_ids(self):
+        """Map of node id -> set of ids of users with admin permissions, through contributorship or OSF groups."""
+        NodeGroupObjectPermission = apps.get_model('osf.NodeGroupObjectPermission')
+        admins = defaultdict(set)
+        permissions = NodeGroupObjectPermission.objects.filter(
+            content_object_id__in=self.primary_ids,
+            permission__codename=ADMIN_NODE,
+            group__user__isnull=False,
+        ).values_list('content_object_id', 'group__user')
+        for node_id, user_id in permissions:
+            admins[node_id].add(user_id)
+        return admins
+
+    @cached_property
+    def primary_ids(self):
+        """Ids of the root and its primary (non-pointer) descendants."""
+        return [node.id for node in self.node_and_primary_descendants()]
+
+    def get_children(self, node, primary_only=False):
+        return [
+            self.nodes[child_id]
+            for child_id, is_node_link in self._relations.get(node.id, [])
+            if not (primary_only and is_node_link)
+        ]
+
+    def get_descendants(self, node=None, primary_only=False):
+        """Yield the descendants of ``node`` (default: the root) depth-first,
+        recursing into components only.
+        """
+        node = node or self.root
+        for child_id, is_node_link in self._relations.get(node.id, []):
+            if primary_only and is_node_link:
+                continue
+            yield self.nodes[child_id]
+            if not is_node_link:
+                for descendant in self.get_descendants(self.nodes[child_id], primary_only=primary_only):
+                    yield descendant
+
+    def node_and_primary_descendants(self):
+        yield self.root
+        for descendant in self.get_descendants(primary_only=True):
+            yield descendant
+
+    def has_pointers(self):
+        """Whether the root or any of its primary descendants contains a node link."""
+        return any(
+            is_node_link
+            for children in self._relations.values()
+            for _, is_node_link in children
+        )
+
+    def next_descendants(self, auth, condition, node=None):
+        """See ``AbstractNode.next_descendants``."""
+        node = node or self.root
+        ret = []
+        for child in sorted(self.get_children(node), key=lambda child: child.created):
+            if condition(auth, child):
+                ret.append((child, []))
+            else:
+                ret.append((child, self.next_descendants(auth, condition, node=child)))
+        return [item for item in ret if item[1] or condition(auth, item[0])]
+
+    def get_active_contributors(self, unique_users=False):
+        """Yield (user, node) tuples for the root and its primary descendants. Group members excluded."""
+        visited_user_ids = set()
+        for node in self.node_and_primary_descendants():
+            for contributor in self._contributors[node.id]:
+                user = contributor.user
+                if not user.is_active:
+                    continue
+                if unique_users:
+                    if user.id in visited_user_ids:
+                        continue
+                    visited_user_ids.add(user.id)
+                yield (user, node)
+
+    def get_admin_contributors(self, unique_users=False):
+        """Yield (user, node) tuples of active admin contributors for the root and its primary descendants."""
+        visited_user_ids = set()
+        for node in self.node_and_primary_descendants():
+            admin_user_ids = self._admin_user_ids[node.id]
+            for contributor in self._contributors[node.id]:
+                user = contributor.user
+                if user.id not in admin_user_ids or not user.is_active:
+                    continue
+                if unique_users:
+                    if user.id in visited_user_ids:
+                        continue
+                    visited_user_ids.add(user.id)
+                yield (user, node)
@@ -1,3 +1,5 @@
+import copy
+
 from osf.models.base import BaseModel, ObjectIDMixin
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 
@@ -5,6 +7,12 @@ from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 class Session(ObjectIDMixin, BaseModel):
     data = DateTimeAwareJSONField(default=dict, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        session = super(Session, cls).from_db(db, field_names, values)
+        session._saved_data = copy.deepcopy(session.data)
+        return session
+
     @property
     def is_authenticated(self):
         return 'auth_user_id' in self.data
@@ -12,3 +20,21 @@ class Session(ObjectIDMixin, BaseModel):
     @property
     def is_external_first_login(self):
         return 'auth_user_external_first_login' in self.data
+
+    @property
+    def is_dirty(self):
+        """Whether this session has never been saved or its data changed since it was loaded or saved"""
+        return self._state.adding or self.data != getattr(self, '_saved_data', None)
+
+    def save(self, *args, **kwargs):
+        from framework.sessions.utils import forget_sessions
+
+        ret = super(Session, self).save(*args, **kwargs)
+        self._saved_data = copy.deepcopy(self.data)
+        forget_sessions([self._id])
+        return ret
+
+    def save_if_dirty(self):
+        """Save only if the session data changed, sessions are read far more often than they change"""
+        if self.is_dirty:
+            self.save()
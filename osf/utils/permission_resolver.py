@@ -0,0 +1,177 @@
+"""Request-scoped resolution of users' permissions on nodes and preprints.
+
+A user's permissions on an object are the permissions granted to the Django groups they
+belong to: the object's own read/write/admin contributor groups and the groups of OSF
+Groups added to it. ``PermissionResolver`` loads these grants for many objects in one
+query, and the ancestors of nodes in one more, so that repeated ``has_permission``,
+``is_admin_parent`` and ``get_permissions`` calls on the same objects do not query again.
+
+While a request is handled, a single resolver is shared by every check made in it. It
+is cleared whenever group memberships, object permissions or node relations change.
+Outside of requests, every check loads what it needs from scratch.
+"""
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from osf.utils.permissions import ADMIN, READ, WRITE
+
+_local = threading.local()
+
+# Object type -> model of the grants of permissions on that type of object to groups
+GROUP_OBJECT_PERMISSION_MODELS = {
+    'node': 'osf.NodeGroupObjectPermission',
+    'preprint': 'osf.PreprintGroupObjectPermission',
+}
+
+ANCESTORS_SQL = """
+    WITH RECURSIVE ancestors AS (
+        SELECT child_id, parent_id FROM osf_noderelation
+        WHERE child_id = ANY(%s) AND is_node_link IS FALSE
+    UNION
+        SELECT R.child_id, R.parent_id FROM osf_noderelation R
+        JOIN ancestors A ON R.child_id = A.parent_id
+        WHERE R.is_node_link IS FALSE
+    ) SELECT child_id, parent_id FROM ancestors
+"""
+
+
+def get_object_type(obj):
+    Preprint = apps.get_model('osf.Preprint')
+    return 'preprint' if isinstance(obj, Preprint) else 'node'
+
+
+class PermissionResolver(object):
+    """Permissions of users on nodes and preprints, loaded in bulk and kept until cleared."""
+
+    def __init__(self):
+        # (object type, object id, user id) -> frozenset of (permission codename, group name)
+        self.grants = {}
+        # node id -> id of its parent, or None
+        self.parents = {}
+
+    def clear(self):
+        self.grants.clear()
+        self.parents.clear()
+
+    def load(self, user, object_type, object_ids):
+        """Load the grants to ``user`` on the objects of ``object_type`` with ``object_ids``
+        that are not loaded yet, in one query.
+        """
+        missing = {pk for pk in object_ids if (object_type, pk, user.pk) not in self.grants}
+        if not missing:
+            return
+        model = apps.get_model(GROUP_OBJECT_PERMISSION_MODELS[object_type])
+        grants = defaultdict(set)
+        rows = model.objects.filter(
+            group__user=user,
+            content_object_id__in=missing,
+        ).values_list('content_object_id', 'permission__codename', 'group__name')
+        for object_id, codename, group_name in rows:
+            grants[object_id].add((codename, group_name))
+        for object_id in missing:
+            self.grants[(object_type, object_id, user.pk)] = frozenset(grants[object_id])
+
+    def preload(self, user, objects):
+        """Load the grants to ``user`` on ``objects``, for example the page of a list view."""
+        if not user or user.is_anonymous:
+            return
+        ids_by_type = defaultdict(list)
+        for obj in objects:
+            ids_by_type[get_object_type(obj)].append(obj.pk)
+        for object_type, object_ids in ids_by_type.items():
+            self.load(user, object_type, object_ids)
+
+    def get_grants(self, user, object_type, object_id):
+        self.load(user, object_type, [object_id])
+        return self.grants[(object_type, object_id, user.pk)]
+
+    def get_perms(self, user, obj):
+        """The permission codenames of ``user`` on ``obj``, like guardian's ``get_group_perms``."""
+        if not user or user.is_anonymous:
+            return set()
+        return {codename for codename, _ in self.get_grants(user, get_object_type(obj), obj.pk)}
+
+    def in_group(self, user, obj, permission):
+        """Whether ``user`` is in the ``permission`` contributor group of ``obj``."""
+        if not user or user.is_anonymous:
+            return False
+        object_type = get_object_type(obj)
+        grant = ('{}_{}'.format(permission, object_type), contributor_group_name(object_type, obj.pk, permission))
+        return grant in self.get_grants(user, object_type, obj.pk)
+
+    def get_lineage(self, node_id):
+        """The ids of the node and of its ancestors, nearest first."""
+        if node_id not in self.parents:
+            with connection.cursor() as cursor:
+                cursor.execute(ANCESTORS_SQL, [[node_id]])
+                parents = dict(cursor.fetchall())
+            root_id = node_id
+            while root_id in parents:
+                root_id = parents[root_id]
+            parents[root_id] = None
+            self.parents.update(parents)
+        lineage = [node_id]
+        while self.parents[lineage[-1]] is not None:
+            lineage.append(self.parents[lineage[-1]])
+        return lineage
+
+    def is_admin_parent(self, user, node, include_group_admin=True):
+        """See ``AbstractNode.is_admin_parent``."""
+        if not user or user.is_anonymous:
+            return False
+        lineage = self.get_lineage(node.pk)
+        self.load(user, 'node', lineage)
+        for node_id in lineage:
+            grants = self.grants[('node', node_id, user.pk)]
+            if any(codename == 'admin_node' for codename, _ in grants):
+                if include_group_admin:
+                    return True
+                # only admins who are also contributors, rather than OSF Group members
+                contributor_groups = {contributor_group_name('node', node_id, group) for group in (READ, WRITE, ADMIN)}
+                return any(group_name in contributor_groups for _, group_name in grants)
+        return False
+
+
+def contributor_group_name(object_type, object_id, permission):
+    # As formatted by the group_format of AbstractNode and Preprint
+    return '{}_{}_{}'.format(object_type, object_id, permission)
+
+
+def current_resolver():
+    """The resolver of the request being handled, if any."""
+    return getattr(_local, 'resolver', None)
+
+
+def get_resolver():
+    """The resolver of the request being handled, or a new one to use once outside of requests."""
+    return current_resolver() or PermissionResolver()
+
+
+def resolver_before_request():
+    _local.resolver = PermissionResolver()
+
+
+def resolver_teardown_request(exc=None):
+    _local.resolver = None
+
+
+handlers = {
+    'before_request': resolver_before_request,
+    'teardown_request': resolver_teardown_request,
+}
+
+
+def clear_resolver(*args, **kwargs):
+    resolver = current_resolver()
+    if resolver is not None:
+        resolver.clear()
+
+
+for sender in ('osf.OSFUser_groups', 'osf.NodeRelation') + tuple(GROUP_OBJECT_PERMISSION_MODELS.values()):
+    post_save.connect(clear_resolver, sender=sender, dispatch_uid='permission_resolver_save_{}'.format(sender))
+    post_delete.connect(clear_resolver, sender=sender, dispatch_uid='permission_resolver_delete_{}'.format(sender))
+m2m_changed.connect(clear_resolver, sender='osf.OSFUser_groups', dispatch_uid='permission_resolver_groups')
@@ -9,6 +9,8 @@ READ_NODE = 'read_node'
 WRITE_NODE = 'write_node'
 ADMIN_NODE = 'admin_node'
 PERMISSIONS = [READ_NODE, WRITE_NODE, ADMIN_NODE]
+# Each level includes the permissions of the levels below it; 0 is no permission
+PERMISSION_LEVELS = {READ_NODE: 1, WRITE_NODE: 2, ADMIN_NODE: 3}
 CONTRIB_PERMISSIONS = {ADMIN_NODE: ADMIN, WRITE_NODE: WRITE, READ_NODE: READ}
 API_CONTRIBUTOR_PERMISSIONS = [READ, WRITE, ADMIN]
 CREATOR_PERMISSIONS = ADMIN
@@ -8,11 +8,13 @@ import pytest
 from django.utils import timezone
 from nose.tools import *  # noqa: F403
 
-from datetime import datetime
+from datetime import date, datetime
 
 from addons.osfstorage.models import OsfStorageFile
 from framework import analytics
-from osf.models import PageCounter, OSFGroup
+from osf.management.commands.migrate_pagecounter_dates import migrate_pagecounter_dates
+from osf.models import PageCounter, PageCounterDay, PageCounterEvent, OSFGroup, UserActivityCounter, UserActivityEvent
+from osf.models.analytics import VisitedPages
 
 from tests.base import OsfTestCase
 from osf_tests.factories import UserFactory, ProjectFactory
@@ -28,6 +30,7 @@ class TestAnalytics(OsfTestCase):
         assert_equal(analytics.get_total_activity_count(user._id), user.get_activity_points())
 
         analytics.increment_user_activity_counters(user._id, 'project_created', date.isoformat())
+        UserActivityCounter.flush_events()
 
         assert_equal(analytics.get_total_activity_count(user._id), 1)
         assert_equal(analytics.get_total_activity_count(user._id), user.get_activity_points())
@@ -38,8 +41,35 @@ class TestAnalytics(OsfTestCase):
 
         assert_equal(user.get_activity_points(), 0)
         analytics.increment_user_activity_counters(user._id, 'project_created', date.isoformat())
+        assert_equal(user.get_activity_points(), 0)
+        UserActivityCounter.flush_events()
         assert_equal(user.get_activity_points(), 1)
 
+    def test_user_activity_is_counted_per_day(self):
+        user = UserFactory()
+        legacy = UserActivityCounter.objects.create(_id=user._id, total=5, date={'2018/02/04': {'total': 5}})
+        for action, date_string in [
+            ('project_created', '2019-02-04T10:00:00+00:00'),
+            ('project_created', '2019-02-04T11:00:00+00:00'),
+            ('file_added', '2019-02-04T12:00:00+00:00'),
+            ('project_created', '2019-02-05T10:00:00+00:00'),
+        ]:
+            analytics.increment_user_activity_counters(user._id, action, date_string)
+
+        assert_equal(UserActivityCounter.flush_events(batch_size=3), 4)
+        assert_equal(UserActivityEvent.objects.count(), 0)
+        legacy.refresh_from_db()
+        assert_equal(legacy.total, 9)
+        assert_equal(legacy.date, {'2018/02/04': {'total': 5}})
+        assert_equal(
+            set(legacy.days.values_list('action', 'date', 'total')),
+            {
+                ('project_created', date(2019, 2, 4), 2),
+                ('file_added', date(2019, 2, 4), 1),
+                ('project_created', date(2019, 2, 5), 1),
+            }
+        )
+
 
 @pytest.fixture()
 def user():
@@ -89,6 +119,30 @@ def page_counter_for_individual_version(project, file_node3):
     return page_counter
 
 
+class TestVisitedPages:
+
+    def test_add(self):
+        visited = VisitedPages()
+        assert visited.add('download:abcde:fghij')
+        assert not visited.add('download:abcde:fghij')
+        assert 'download:abcde:fghij' in visited
+        assert 'download:abcde:klmno' not in visited
+
+    def test_serialize(self):
+        visited = VisitedPages(pages=['download:abcde:fghij', 'view:abcde:fghij'])
+        restored = VisitedPages(visited.serialize())
+        assert 'download:abcde:fghij' in restored
+        assert 'view:abcde:fghij' in restored
+        assert VisitedPages(VisitedPages().serialize()).hashes == []
+
+    def test_oldest_pages_are_forgotten_when_full(self):
+        with mock.patch('website.settings.SESSION_VISITED_PAGES_MAX', 3):
+            visited = VisitedPages(pages=['a', 'b', 'c', 'd'])
+            assert 'a' not in visited
+            assert all(page in visited for page in 'bcd')
+            assert len(VisitedPages(visited.serialize()).hashes) == 3
+
+
 @pytest.mark.django_db
 class TestPageCounter:
 
@@ -97,12 +151,14 @@ class TestPageCounter:
         mock_session.data = {}
         resource = project.guids.first()
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={})
+        PageCounter.flush_events()
 
         page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
         assert page_counter.total == 1
         assert page_counter.unique == 1
 
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={})
+        PageCounter.flush_events()
 
         page_counter.refresh_from_db()
         assert page_counter.total == 2
@@ -114,12 +170,14 @@ class TestPageCounter:
         resource = project.guids.first()
 
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={'contributors': project.contributors})
+        PageCounter.flush_events()
 
         page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
         assert page_counter.total == 0
         assert page_counter.unique == 0
 
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={'contributors': project.contributors})
+        PageCounter.flush_events()
 
         page_counter.refresh_from_db()
         assert page_counter.total == 0
@@ -133,6 +191,7 @@ class TestPageCounter:
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={
             'contributors': project.contributors_and_group_members}
         )
+        PageCounter.flush_events()
         page_counter.refresh_from_db()
         assert page_counter.total == 1
         assert page_counter.unique == 1
@@ -141,9 +200,79 @@ class TestPageCounter:
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={
             'contributors': project.contributors_and_group_members}
         )
+        PageCounter.flush_events()
         assert page_counter.total == 1
         assert page_counter.unique == 1
 
+    @mock.patch('osf.models.analytics.session')
+    def test_hits_are_counted_when_flushed(self, mock_session, project, file_node):
+        mock_session.data = {}
+        resource = project.guids.first()
+        PageCounter.update_counters(resource, file_node, [None, 0], action='download', node_info={})
+        PageCounter.update_counters(resource, file_node, [None, 0], action='download', node_info={})
+
+        page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
+        assert page_counter.total == 0
+        assert PageCounterEvent.objects.count() == 4
+
+        assert PageCounter.flush_events(batch_size=3) == 4
+        assert PageCounterEvent.objects.count() == 0
+        page_counter.refresh_from_db()
+        assert page_counter.total == 2
+        assert page_counter.unique == 1
+        day = page_counter.days.get()
+        assert day.date == timezone.now().date()
+        assert (day.total, day.unique) == (2, 1)
+        assert PageCounter.get_basic_counters(resource, file_node, version=0, action='download') == (1, 2)
+
+    @mock.patch('osf.models.analytics.session')
+    def test_contributor_hits_count_towards_the_day_only(self, mock_session, user, project, file_node):
+        mock_session.data = {'auth_user_id': user._id}
+        resource = project.guids.first()
+        PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={'contributors': project.contributors})
+        PageCounter.flush_events()
+
+        page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
+        assert (page_counter.total, page_counter.unique) == (0, 0)
+        day = page_counter.days.get()
+        assert (day.total, day.unique) == (1, 1)
+
+    @mock.patch('osf.models.analytics.session')
+    def test_legacy_session_lists_are_replaced(self, mock_session, project, file_node):
+        resource = project.guids.first()
+        page = 'download:{}:{}'.format(resource._id, file_node._id)
+        today = timezone.now().strftime('%Y/%m/%d')
+        mock_session.data = {
+            'visited': ['download:abcde:fghij', page],
+            'visited_by_date': {'date': today, 'pages': [page] * 3},
+        }
+        PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={})
+        PageCounter.flush_events()
+
+        page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
+        assert (page_counter.total, page_counter.unique) == (1, 0)
+        assert page_counter.days.get().unique == 0
+        assert 'visited' not in mock_session.data
+        assert 'visited_by_date' not in mock_session.data
+        assert 'download:abcde:fghij' in VisitedPages(mock_session.data['visited_pages'])
+        assert mock_session.data['visited_pages_by_date']['date'] == today
+        assert page in VisitedPages(mock_session.data['visited_pages_by_date']['pages'])
+
+    @mock.patch('osf.models.analytics.session')
+    def test_visits_on_a_new_day_are_unique_that_day(self, mock_session, project, file_node):
+        resource = project.guids.first()
+        page = 'download:{}:{}'.format(resource._id, file_node._id)
+        mock_session.data = {
+            'visited_pages': VisitedPages(pages=[page]).serialize(),
+            'visited_pages_by_date': {'date': '2018/02/04', 'pages': VisitedPages(pages=[page]).serialize()},
+        }
+        PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={})
+        PageCounter.flush_events()
+
+        page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
+        assert (page_counter.total, page_counter.unique) == (1, 0)
+        assert page_counter.days.get().unique == 1
+
     def test_get_all_downloads_on_date(self, page_counter, page_counter2):
         """
         This method tests that multiple pagecounter objects have their download totals summed properly.
@@ -171,3 +300,25 @@ class TestPageCounter:
         total_downloads = PageCounter.get_all_downloads_on_date(date)
 
         assert total_downloads == 45
+
+    def test_get_all_downloads_on_date_includes_days(self, page_counter, page_counter2, page_counter_for_individual_version):
+        date = datetime(2018, 2, 4)
+        PageCounterDay.objects.create(page_counter=page_counter, date=date, total=5, unique=2)
+        PageCounterDay.objects.create(page_counter=page_counter_for_individual_version, date=date, total=3, unique=3)
+        PageCounterDay.objects.create(page_counter=page_counter2, date=datetime(2018, 2, 5), total=7, unique=7)
+
+        assert PageCounter.get_all_downloads_on_date(date) == 50
+        assert PageCounter.get_all_downloads_on_date(datetime(2018, 2, 5)) == 7
+        assert PageCounter.get_all_downloads_on_date(datetime(2018, 2, 6)) is None
+
+    def test_migrate_pagecounter_dates(self, page_counter, page_counter2):
+        PageCounterDay.objects.create(page_counter=page_counter, date=datetime(2018, 2, 4), total=5, unique=2)
+        date = datetime(2018, 2, 4)
+        total_downloads = PageCounter.get_all_downloads_on_date(date)
+
+        migrate_pagecounter_dates(batch_size=1)
+
+        page_counter.refresh_from_db()
+        assert page_counter.date == {}
+        assert (page_counter.days.get().total, page_counter.days.get().unique) == (46, 35)
+        assert PageCounter.get_all_downloads_on_date(date) == total_downloads == 50
@@ -29,7 +29,7 @@ from website.archiver.decorators import fail_archive_on_error
 
 from website import mails
 from website import settings
-from osf.models import RegistrationSchema, Registration
+from osf.models import BaseFileNode, RegistrationSchema, Registration
 from osf.utils.sanitize import strip_html
 from addons.base.models import BaseStorageAddon
 from api.base.utils import waterbutler_api_url_for
@@ -175,6 +175,22 @@ WB_FILE_TREE = {
     }
 }
 
+# Listings of the folders of FILE_TREE, as returned by _get_fileobj_child_metadata
+FILE_TREE_LISTINGS = {
+    '/': [
+        {'path': '/1234567', 'name': 'Afile.file', 'kind': 'file', 'size': '128'},
+        {'path': '/qwerty', 'name': 'A Folder', 'kind': 'folder'},
+    ],
+    '/qwerty': [
+        {'path': '/qwerty/asdfgh', 'name': 'coolphoto.png', 'kind': 'file', 'size': '256'},
+    ],
+}
+
+COPY_UNITS = [
+    {'target_id': '/1234567', 'target_name': 'Afile.file', 'num_files': 1, 'disk_usage': 128.0, 'destination': ''},
+    {'target_id': '/qwerty/asdfgh', 'target_name': 'coolphoto.png', 'num_files': 1, 'disk_usage': 256.0, 'destination': 'A Folder/'},
+]
+
 
 class MockAddon(object):
 
@@ -562,6 +578,53 @@ class TestArchiverTasks(ArchiverTestCase):
             )
         ))
 
+    @mock.patch('website.settings.ARCHIVE_BATCH_MAX_FILES', 1)
+    @mock.patch('website.archiver.tasks.archive_batch.si')
+    @mock.patch('celery.group')
+    def test_archive_addon_in_batches(self, mock_group, mock_archive_batch):
+        target = self.archive_job.get_target('osfstorage')
+        target.stat_result = {'batched': True, 'targets': COPY_UNITS}
+        target.save()
+        archive_addon('osfstorage', self.archive_job._id)
+        target.refresh_from_db()
+        assert_equal(target.copies_pending, 2)
+        assert_equal(mock_archive_batch.call_count, 2)
+        archive_folder = BaseFileNode.objects.get(target_object_id=self.dst.id, name='Archive of OSF Storage')
+        nested_folder = BaseFileNode.objects.get(target_object_id=self.dst.id, name='A Folder')
+        assert_equal(nested_folder.parent, archive_folder)
+        copies = [call[1]['copies'] for call in mock_archive_batch.call_args_list]
+        assert_equal([[data['path'] for url, data in batch] for batch in copies], [
+            ['/{}/'.format(archive_folder._id)],
+            ['/{}/'.format(nested_folder._id)],
+        ])
+        assert_in('/1234567', copies[0][0][0])
+
+    def test_archive_folder_is_named_like_whole_addon_copies(self):
+        folders = archiver_utils.make_archive_folders(self.dst, 'Archive of GitHub: user/repo', [])
+        archive_folder = BaseFileNode.objects.get(target_object_id=self.dst.id, name='Archive of GitHub: user-repo')
+        assert_equal(folders, {'': '/{}/'.format(archive_folder._id)})
+
+    def test_record_copy_of_batched_target(self):
+        target = self.archive_job.get_target('osfstorage')
+        target.stat_result = {'batched': True, 'targets': COPY_UNITS}
+        target.copies_pending = 2
+        target.save()
+        assert_false(self.archive_job.record_copy('osfstorage', '/1234567'))
+        assert_true(self.archive_job.record_copy('osfstorage', '/qwerty/asdfgh'))
+        self.archive_job.refresh_from_db()
+        assert_equal(self.archive_job.files_archived, 2)
+        assert_equal(self.archive_job.bytes_archived, 128 + 256)
+        assert_true(self.archive_job.throughput > 0)
+
+    def test_find_stalled(self):
+        assert_not_in(self.archive_job, ArchiveJob.find_stalled())
+        ArchiveJob.objects.filter(id=self.archive_job.id).update(
+            datetime_initiated=timezone.now() - settings.ARCHIVE_STALLED_TIMEDELTA * 2
+        )
+        assert_in(self.archive_job, ArchiveJob.find_stalled())
+        self.archive_job.record_copy('osfstorage', '/')
+        assert_not_in(self.archive_job, ArchiveJob.find_stalled())
+
     def test_archive_success(self):
         node = factories.NodeFactory(creator=self.user)
         file_trees, selected_files, node_index = generate_file_tree([node])
@@ -889,6 +952,28 @@ class TestArchiverUtils(ArchiverTestCase):
         assert_equal(a_stat_result.num_files, 2)
         assert_equal(len(a_stat_result.targets), 2)
 
+    @mock.patch('website.settings.ARCHIVE_BATCH_MAX_SIZE', 200)
+    def test_plan_copy_units_splits_folders_that_do_not_fit(self):
+        listing = lambda fileobj, *args, **kwargs: FILE_TREE_LISTINGS[fileobj['path']]
+        with mock.patch.object(BaseStorageAddon, '_get_fileobj_child_metadata', side_effect=listing):
+            result = archiver_utils.plan_copy_units(self.src.get_addon('osfstorage'), 'osfstorage', self.user)
+        assert_true(result['batched'])
+        assert_equal(result['num_files'], 2)
+        assert_equal(result['disk_usage'], 128 + 256)
+        assert_equal(result['targets'], COPY_UNITS)
+
+    def test_plan_copy_units_copies_small_trees_whole(self):
+        listing = lambda fileobj, *args, **kwargs: FILE_TREE_LISTINGS[fileobj['path']]
+        with mock.patch.object(BaseStorageAddon, '_get_fileobj_child_metadata', side_effect=listing):
+            result = archiver_utils.plan_copy_units(self.src.get_addon('osfstorage'), 'osfstorage', self.user)
+        assert_equal([(unit['target_id'], unit['num_files']) for unit in result['targets']], [('/', 2)])
+
+    @mock.patch('website.settings.ARCHIVE_BATCH_MAX_FILES', 3)
+    def test_batch_copy_units(self):
+        units = [{'num_files': num_files, 'disk_usage': 1} for num_files in (1, 2, 1, 5, 1)]
+        batches = archiver_utils.batch_copy_units(units)
+        assert_equal([[unit['num_files'] for unit in batch] for batch in batches], [[1, 2], [1], [5], [1]])
+
     @use_fake_addons
     def test_archive_provider_for(self):
         provider = self.src.get_addon(settings.ARCHIVE_PROVIDER)
@@ -2,6 +2,8 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import mock
+import os
+import tempfile
 import time
 import unittest
 import logging
@@ -16,7 +18,7 @@ from website import settings
 import website.search.search as search
 from website.search import elastic_search
 from website.search.util import build_query
-from website.search_migration.migrate import migrate
+from website.search_migration.migrate import migrate, migrate_doctype, partition, Checkpoint
 from osf.models import (
     Retraction,
     NodeLicense,
@@ -1401,6 +1403,33 @@ class TestSearchMigration(OsfTestCase):
         res = self.es.search(index=settings.ELASTIC_INDEX, doc_type='collectionSubmission', search_type='count', body=count_query)
         assert res['hits']['total'] == 2
 
+    def test_partition_covers_ids_created_during_migration(self):
+        assert partition(25, 10) == [(0, 10), (10, 20), (20, 30), (30, 40)]
+
+    def test_migration_with_checkpoint_resumes_into_same_index(self):
+        checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        with mock.patch('website.search_migration.migrate.set_up_alias', side_effect=KeyboardInterrupt):
+            with assert_raises(KeyboardInterrupt):
+                migrate(delete=False, index=settings.ELASTIC_INDEX, app=self.app.app, checkpoint_path=checkpoint_path)
+        checkpoint = Checkpoint(checkpoint_path, settings.ELASTIC_INDEX)
+        assert checkpoint.new_index == settings.ELASTIC_INDEX + '_v1'
+        assert checkpoint.completed['nodes']
+
+        with mock.patch('website.search_migration.migrate.migrate_range') as mock_migrate_range:
+            migrate(delete=False, index=settings.ELASTIC_INDEX, app=self.app.app, checkpoint_path=checkpoint_path)
+        assert not mock_migrate_range.called
+        var = self.es.indices.get_aliases()
+        assert_equal(list(var[settings.ELASTIC_INDEX + '_v1']['aliases'].keys())[0], settings.ELASTIC_INDEX)
+        assert not os.path.exists(checkpoint_path)
+
+    def test_ranges_are_checkpointed_as_they_finish(self):
+        checkpoint = Checkpoint(None, settings.ELASTIC_INDEX)
+        factories.ProjectFactory()
+        with mock.patch('website.search_migration.migrate.migrate_range', side_effect=[('nodes', 0, 1, 1), KeyboardInterrupt]):
+            with assert_raises(KeyboardInterrupt):
+                migrate_doctype('nodes', settings.ELASTIC_INDEX, False, checkpoint, chunk_size=1)
+        assert checkpoint.completed['nodes'] == {(0, 1)}
+
 @pytest.mark.enable_search
 @pytest.mark.enable_enqueue_task
 class TestSearchFiles(OsfTestCase):
@@ -1542,3 +1571,42 @@ class TestSearchFiles(OsfTestCase):
 
         find = query_file('GreenLight.mp3')['results']
         assert_equal(len(find), 0)
+
+
+class TestBulkIndexing(OsfTestCase):
+
+    @mock.patch('website.search.elastic_search.send_bulk_actions')
+    def test_flushes_when_buffer_is_full(self, mock_send):
+        indexer = elastic_search.BulkIndexer(flush_size=2, flush_interval=60)
+        indexer.add({'_id': 1})
+        assert not mock_send.called
+        indexer.add({'_id': 2})
+        mock_send.assert_called_once_with([{'_id': 1}, {'_id': 2}], refresh=False)
+        assert indexer.actions == []
+
+    @mock.patch('website.search.elastic_search.send_bulk_actions')
+    def test_writes_are_buffered_until_block_exits(self, mock_send):
+        with elastic_search.bulk_indexing():
+            elastic_search.index_document('test', 'project', 'abcde', {'title': 'Tom Sawyer'})
+            with elastic_search.bulk_indexing():
+                elastic_search.delete_document('test', 'project', 'fghij')
+            assert not mock_send.called
+        assert mock_send.call_count == 1
+        actions = mock_send.call_args[0][0]
+        assert [(action['_op_type'], action['_id']) for action in actions] == [('index', 'abcde'), ('delete', 'fghij')]
+
+    @mock.patch('website.search.elastic_search.send_bulk_actions')
+    def test_nothing_is_sent_for_empty_block(self, mock_send):
+        with elastic_search.bulk_indexing():
+            pass
+        assert not mock_send.called
+
+    def test_prefetched_serialization_matches_per_node(self):
+        user = factories.UserFactory()
+        parent = factories.ProjectFactory(creator=user, is_public=True)
+        child = factories.NodeFactory(parent=parent, creator=user, is_public=True)
+        child.add_tag('bulk', auth=Auth(user), save=True)
+        prefetched = elastic_search.NodeSearchPrefetch([parent, child])
+        for node in (parent, child):
+            category = elastic_search.get_doctype_from_node(node)
+            assert elastic_search.serialize_node(node, category, prefetched=prefetched) == elastic_search.serialize_node(node, category)
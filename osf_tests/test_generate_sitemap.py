@@ -1,9 +1,11 @@
+import gzip
 import os
 
 import pytest
 import mock
 import shutil
 import tempfile
+import threading
 import xml
 from future.moves.urllib.parse import urljoin
 
@@ -18,16 +20,19 @@ def get_all_sitemap_urls():
 
     generate_sitemap.main()
 
-    # Parse the generated XML sitemap file
-    with open(os.path.join(settings.STATIC_FOLDER, 'sitemaps/sitemap_0.xml')) as f:
-        tree = xml.etree.ElementTree.parse(f)
-
-    shutil.rmtree(settings.STATIC_FOLDER)
-
-    # Get all the urls in the sitemap
+    # Parse the generated XML sitemap shards
     # Note: namespace was defined in the XML file, therefore necessary to include in tag
     namespace = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
-    urls = [element.text for element in tree.iter(namespace + 'loc')]
+    sitemap_dir = os.path.join(settings.STATIC_FOLDER, 'sitemaps')
+    urls = []
+    for file_name in os.listdir(sitemap_dir):
+        if not file_name.endswith('.xml') or file_name == 'sitemap_index.xml':
+            continue
+        with gzip.open(os.path.join(sitemap_dir, file_name + '.gz')) as f:
+            tree = xml.etree.ElementTree.parse(f)
+        urls.extend(element.text for element in tree.iter(namespace + 'loc'))
+
+    shutil.rmtree(settings.STATIC_FOLDER)
 
     return urls
 
@@ -175,3 +180,80 @@ class TestGenerateSitemap:
             urls = get_all_sitemap_urls()
 
         assert urljoin(settings.DOMAIN, project_deleted.url) not in urls
+
+    def test_only_changed_shards_are_regenerated(self, project_registration_public, create_tmp_directory):
+
+        write_shard_ = generate_sitemap.Sitemap.write_shard
+
+        with mock.patch('website.settings.STATIC_FOLDER', create_tmp_directory):
+            generate_sitemap.main()
+            with mock.patch.object(generate_sitemap.Sitemap, 'write_shard', autospec=True, side_effect=write_shard_) as write_shard:
+                generate_sitemap.main()
+            assert not write_shard.called
+
+            project_registration_public.title = 'Changed'
+            project_registration_public.save()
+            with mock.patch.object(generate_sitemap.Sitemap, 'write_shard', autospec=True, side_effect=write_shard_) as write_shard:
+                generate_sitemap.main()
+            assert [call[0][1] for call in write_shard.call_args_list] == ['node_0']
+
+            with mock.patch.object(generate_sitemap.Sitemap, 'write_shard', autospec=True, side_effect=write_shard_) as write_shard:
+                generate_sitemap.main(full=True)
+            assert write_shard.call_count == 3
+
+        shutil.rmtree(create_tmp_directory)
+
+    def test_failed_shard_is_discarded(self, create_tmp_directory):
+
+        def urls():
+            yield {'loc': urljoin(settings.DOMAIN, 'new/')}
+            raise ValueError('database went away')
+
+        with mock.patch('website.settings.STATIC_FOLDER', create_tmp_directory):
+            sitemap = generate_sitemap.Sitemap()
+            sitemap.write_file('node_0', [{'loc': urljoin(settings.DOMAIN, 'old/')}])
+            with pytest.raises(ValueError):
+                sitemap.write_file('node_0', urls())
+
+        assert sorted(os.listdir(sitemap.sitemap_dir)) == ['sitemap_node_0.xml', 'sitemap_node_0.xml.gz']
+        with open(os.path.join(sitemap.sitemap_dir, 'sitemap_node_0.xml')) as fp:
+            assert 'old/' in fp.read()
+
+        shutil.rmtree(create_tmp_directory)
+
+    def test_legacy_files_are_removed_without_a_manifest(self, create_tmp_directory):
+        sitemap_dir = os.path.join(create_tmp_directory, 'sitemaps')
+        os.makedirs(sitemap_dir)
+        for file_name in ('sitemap_0.xml', 'sitemap_0.xml.gz', 'sitemap_12.xml', 'sitemap_12.xml.gz'):
+            open(os.path.join(sitemap_dir, file_name), 'w').close()
+
+        with mock.patch('website.settings.STATIC_FOLDER', create_tmp_directory):
+            generate_sitemap.main()
+
+        file_names = os.listdir(sitemap_dir)
+        assert not [file_name for file_name in file_names if generate_sitemap.LEGACY_FILE_NAME.match(file_name)]
+        assert 'sitemap_node_0.xml' in file_names
+        assert 'sitemap_static_0.xml.gz' in file_names
+
+        shutil.rmtree(create_tmp_directory)
+
+    def test_each_worker_thread_uploads_with_its_own_s3_resource(self):
+        with mock.patch('website.settings.SITEMAP_TO_S3', True), \
+                mock.patch('website.settings.SITEMAP_AWS_BUCKET', 'sitemaps-bucket'), \
+                mock.patch('website.settings.AWS_ACCESS_KEY_ID', 'key'), \
+                mock.patch('website.settings.AWS_SECRET_ACCESS_KEY', 'secret'), \
+                mock.patch('boto3.session.Session') as mock_session:
+            sitemap = generate_sitemap.Sitemap()
+            threads = [
+                threading.Thread(target=sitemap.write_file, args=('node_{}'.format(shard), []))
+                for shard in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            sitemap.cleanup()
+
+        assert mock_session.call_count == 2
+        bucket = mock_session.return_value.resource.return_value.Bucket.return_value
+        assert bucket.put_object.call_count == 4
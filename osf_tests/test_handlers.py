@@ -1,7 +1,15 @@
+import functools
+import time
+
+import gevent
+import mock
 import pytest
 from nose.tools import assert_raises
 
+from api.base import instrumentation
 from framework.celery_tasks import handlers
+from framework.postcommit_tasks import handlers as postcommit_handlers
+from website import settings
 from website.project.tasks import on_node_updated
 
 
@@ -40,3 +48,65 @@ class TestCeleryHandlers:
                 'website.project.tasks.on_node_updated',
                 predicate=lambda task: task.kwargs['node_id'] == 'woop'
             )
+
+
+class TestPostcommitHandlers:
+
+    @pytest.fixture(autouse=True)
+    def queues(self):
+        postcommit_handlers.postcommit_before_request()
+        yield
+        postcommit_handlers.postcommit_before_request()
+
+    def test_task_key_with_unhashable_arguments(self):
+        key = postcommit_handlers.task_key(on_node_updated, (), {'saved_fields': {'title'}})
+        assert key == postcommit_handlers.task_key(on_node_updated, (), {'saved_fields': {'title'}})
+        assert key != postcommit_handlers.task_key(on_node_updated, (), {'saved_fields': {'contributors'}})
+
+    def test_after_request_runs_tasks_and_records_timings(self):
+        calls = []
+
+        def record_call(value):
+            calls.append(value)
+
+        postcommit_handlers.postcommit_queue().update({
+            'a': functools.partial(record_call, 1),
+            'b': functools.partial(record_call, 2),
+        })
+        instrumentation.registry.clear()
+        postcommit_handlers.postcommit_after_request(mock.Mock(status_code=200))
+        assert sorted(calls) == [1, 2]
+        timings = instrumentation.registry.histograms[('osf_postcommit_task_seconds', '{}.record_call'.format(__name__))]
+        assert timings.count == 2
+        assert 'osf_postcommit_task_seconds_count{{task="{}.record_call"}} 2'.format(__name__) in instrumentation.render_metrics()
+
+    @mock.patch('website.settings.POSTCOMMIT_TIMEOUT', 0.1)
+    def test_after_request_does_not_wait_for_a_full_pool(self):
+        calls = []
+        semaphore = postcommit_handlers.get_postcommit_semaphore()
+        for _ in range(settings.POSTCOMMIT_POOL_SIZE):
+            semaphore.acquire()
+        try:
+            postcommit_handlers.postcommit_queue().update({'a': functools.partial(calls.append, 1)})
+            start = time.time()
+            postcommit_handlers.postcommit_after_request(mock.Mock(status_code=200))
+            assert time.time() - start < settings.POSTCOMMIT_TIMEOUT + 0.5
+            assert calls == []
+        finally:
+            for _ in range(settings.POSTCOMMIT_POOL_SIZE):
+                semaphore.release()
+        gevent.sleep(0.1)
+        assert calls == [1]
+
+    @mock.patch('website.settings.USE_CELERY', True)
+    def test_after_request_publishes_celery_tasks_over_one_connection(self):
+        postcommit_handlers.postcommit_celery_queue().update({
+            'a': on_node_updated.si(node_id='woop', user_id='heyyo', first_save=False, saved_fields=['title']),
+            'b': on_node_updated.si(node_id='boop', user_id='heyyo', first_save=False, saved_fields=['title']),
+        })
+        with mock.patch('framework.celery_tasks.app.producer_or_acquire') as mock_acquire, \
+                mock.patch('celery.canvas.Signature.apply_async') as mock_apply_async:
+            postcommit_handlers.postcommit_after_request(mock.Mock(status_code=200))
+        assert mock_acquire.call_count == 1
+        producer = mock_acquire.return_value.__enter__.return_value
+        assert [call[1] for call in mock_apply_async.call_args_list] == [{'producer': producer}] * 2
@@ -1799,6 +1799,53 @@ class TestPermissionMethods:
         project.save()
         assert project.is_contributor(unreg) is True
 
+    def test_annotate_user_permissions(self, project, django_assert_num_queries):
+        user = UserFactory()
+        child = NodeFactory(parent=project, creator=user)
+        grandchild = NodeFactory(parent=child, creator=user)
+        project.add_contributor(user, permissions=WRITE, save=True)
+        group = OSFGroupFactory(creator=UserFactory())
+        group.make_member(project.creator)
+        grandchild.add_osf_group(group, READ)
+        other = ProjectFactory()
+
+        with django_assert_num_queries(1):
+            creator_perms = {
+                node.id: (node.user_permission_level, node.user_is_admin_parent)
+                for node in Node.objects.filter(id__in=[project.id, child.id, grandchild.id, other.id]).annotate_user_permissions(project.creator)
+            }
+        assert creator_perms == {
+            project.id: (3, True),
+            child.id: (0, True),
+            grandchild.id: (1, True),
+            other.id: (0, False),
+        }
+
+        user_perms = Node.objects.filter(id__in=[project.id, child.id]).annotate_user_permissions(user)
+        assert {node.id: (node.user_permission_level, node.user_is_admin_parent) for node in user_perms} == {
+            project.id: (2, False),
+            child.id: (3, True),
+        }
+
+        anonymous_perms = Node.objects.filter(id=project.id).annotate_user_permissions(None).get()
+        assert (anonymous_perms.user_permission_level, anonymous_perms.user_is_admin_parent) == (0, False)
+
+    def test_get_nodes_for_user(self, project):
+        user = UserFactory()
+        public = ProjectFactory(is_public=True)
+        project.add_contributor(user, permissions=WRITE, save=True)
+        group = OSFGroupFactory(creator=UserFactory())
+        group.make_member(user)
+        group_project = ProjectFactory()
+        group_project.add_osf_group(group, ADMIN)
+
+        assert set(Node.objects.get_nodes_for_user(user)) == {project, group_project}
+        assert set(Node.objects.get_nodes_for_user(user, permissions.WRITE_NODE)) == {project, group_project}
+        assert set(Node.objects.get_nodes_for_user(user, permissions.ADMIN_NODE)) == {group_project}
+        assert public in Node.objects.get_nodes_for_user(user, include_public=True)
+        assert not Node.objects.get_nodes_for_user(None).exists()
+        assert set(Node.objects.get_nodes_for_user(None, include_public=True)) == set(Node.objects.filter(is_public=True, is_deleted=False))
+
 # Copied from tests/test_models
 # Permissions are now on the Contributor model, and are well-defined (i.e. not 'dance')
 # Consider removing this class
@@ -0,0 +1,89 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from waffle.testutils import override_switch
+
+from framework.auth.core import Auth
+from osf.features import NODE_CLOSURE_TABLE
+from osf.models import Node, NodeClosure, NodeRelation
+from osf.utils.permissions import ADMIN
+from osf_tests.factories import AuthUserFactory, NodeFactory, ProjectFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def closure(node):
+    return dict(NodeClosure.objects.filter(ancestor=node).values_list('descendant_id', 'depth'))
+
+
+@pytest.fixture()
+def tree():
+    root = ProjectFactory()
+    child = NodeFactory(parent=root)
+    grandchild = NodeFactory(parent=child)
+    great_grandchild = NodeFactory(parent=grandchild)
+    return root, child, grandchild, great_grandchild
+
+
+class TestNodeClosureMaintenance:
+
+    def test_components_are_added(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        assert closure(root) == {child.id: 1, grandchild.id: 2, great_grandchild.id: 3}
+        assert closure(child) == {grandchild.id: 1, great_grandchild.id: 2}
+        assert closure(great_grandchild) == {}
+
+    def test_node_links_are_ignored(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        other = ProjectFactory()
+        other.add_node_link(root, auth=Auth(other.creator), save=True)
+        assert closure(other) == {}
+
+    def test_removing_a_relation_removes_the_subtree(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        NodeRelation.objects.get(parent=child, child=grandchild).delete()
+        assert closure(root) == {child.id: 1}
+        assert closure(child) == {}
+        assert closure(grandchild) == {great_grandchild.id: 1}
+
+    def test_rebuild_and_verify(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        expected = closure(root)
+        NodeClosure.objects.filter(ancestor=root).delete()
+        with pytest.raises(CommandError):
+            call_command('rebuild_node_closure', verify=True)
+
+        call_command('rebuild_node_closure')
+        call_command('rebuild_node_closure', verify=True)
+        assert closure(root) == expected
+
+
+@override_switch(NODE_CLOSURE_TABLE, active=True)
+class TestNodeClosureQueries:
+
+    def test_get_children_of_component(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        great_grandchild.is_deleted = True
+        great_grandchild.save()
+
+        assert set(Node.objects.get_children(child)) == {grandchild, great_grandchild}
+        assert set(Node.objects.get_children(child, active=True)) == {grandchild}
+        assert set(Node.objects.get_children(child, include_root=True)) == {child, grandchild, great_grandchild}
+
+    def test_can_view_implicit_admin(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        user = AuthUserFactory()
+        child.add_contributor(user, permissions=ADMIN, save=True)
+
+        viewable = set(Node.objects.filter(id__in=[n.id for n in tree]).can_view(user))
+        assert viewable == {child, grandchild, great_grandchild}
+
+    def test_annotate_user_permissions_implicit_admin(self, tree):
+        root, child, grandchild, great_grandchild = tree
+        user = AuthUserFactory()
+        child.add_contributor(user, permissions=ADMIN, save=True)
+
+        annotated = Node.objects.filter(id__in=[n.id for n in tree]).annotate_user_permissions(user)
+        assert {node: node.user_is_admin_parent for node in annotated} == {
+            root: False, child: True, grandchild: True, great_grandchild: True,
+        }
@@ -0,0 +1,77 @@
+import pytest
+
+from framework.auth.core import Auth
+from osf.models.node_tree import NodeTree
+from osf.utils.permissions import ADMIN, WRITE
+from osf_tests.factories import AuthUserFactory, NodeFactory, ProjectFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def admin():
+    return AuthUserFactory()
+
+
+@pytest.fixture()
+def project(admin):
+    return ProjectFactory(creator=admin)
+
+
+@pytest.fixture()
+def component(project, admin):
+    return NodeFactory(parent=project, creator=admin)
+
+
+@pytest.fixture()
+def subcomponent(component, admin):
+    return NodeFactory(parent=component, creator=admin)
+
+
+@pytest.fixture()
+def linked(project):
+    linked = ProjectFactory()
+    project.add_node_link(linked, auth=Auth(project.creator), save=True)
+    return linked
+
+
+class TestNodeTree:
+
+    def test_descendants(self, project, component, subcomponent, linked):
+        tree = NodeTree(project)
+        assert list(tree.get_descendants(primary_only=True)) == [component, subcomponent]
+        assert set(tree.get_descendants()) == {component, subcomponent, linked}
+        assert list(tree.node_and_primary_descendants()) == [project, component, subcomponent]
+
+    def test_has_pointers(self, project, component, subcomponent):
+        assert NodeTree(project).has_pointers() is False
+        subcomponent.add_node_link(ProjectFactory(), auth=Auth(subcomponent.creator), save=True)
+        assert NodeTree(project).has_pointers() is True
+        assert project.has_pointers_recursive is True
+
+    def test_next_descendants(self, project, component, subcomponent):
+        condition = lambda auth, node: node == subcomponent
+        assert NodeTree(project).next_descendants(None, condition) == [(component, [(subcomponent, [])])]
+
+    def test_contributors(self, project, component, subcomponent, admin):
+        writer = AuthUserFactory()
+        component.add_contributor(writer, permissions=WRITE, save=True)
+        other_admin = AuthUserFactory()
+        subcomponent.add_contributor(other_admin, permissions=ADMIN, save=True)
+
+        active = list(NodeTree(project).get_active_contributors(unique_users=True))
+        assert active == [(admin, project), (writer, component), (other_admin, subcomponent)]
+
+        admins = list(NodeTree(project).get_admin_contributors())
+        assert admins == [(admin, project), (admin, component), (admin, subcomponent), (other_admin, subcomponent)]
+        assert list(project.get_admin_contributors_recursive(unique_users=True)) == [(admin, project), (other_admin, subcomponent)]
+
+    @pytest.mark.django_assert_num_queries
+    def test_query_count_is_constant(self, project, component, subcomponent, django_assert_num_queries):
+        for _ in range(3):
+            NodeFactory(parent=subcomponent)
+        tree = NodeTree(project)
+        # relations, nodes, contributors, admin permissions
+        with django_assert_num_queries(4):
+            list(tree.get_descendants())
+            list(tree.get_admin_contributors(unique_users=True))
@@ -0,0 +1,78 @@
+import pytest
+
+from osf.utils import permission_resolver
+from osf.utils.permissions import ADMIN, READ, WRITE
+from osf_tests.factories import (
+    AuthUserFactory,
+    NodeFactory,
+    OSFGroupFactory,
+    PreprintFactory,
+    ProjectFactory,
+)
+
+
+@pytest.mark.django_db
+class TestPermissionResolver:
+
+    @pytest.fixture(autouse=True)
+    def request_resolver(self):
+        permission_resolver.resolver_before_request()
+        yield
+        permission_resolver.resolver_teardown_request()
+
+    @pytest.fixture()
+    def user(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def project(self, user):
+        return ProjectFactory(creator=user)
+
+    @pytest.fixture()
+    def grandchild(self, project):
+        return NodeFactory(parent=NodeFactory(parent=project))
+
+    def test_checks_are_cached_for_the_request(self, project, user, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert project.has_permission(user, ADMIN)
+            assert project.has_permission(user, WRITE)
+            assert project.is_admin_contributor(user)
+            assert project.get_permissions(user) == [READ, WRITE, ADMIN]
+
+    def test_admin_parent_is_resolved_in_constant_queries(self, project, grandchild, user, django_assert_num_queries):
+        # grants on the node, ancestors, grants on the ancestors
+        with django_assert_num_queries(3):
+            assert grandchild.has_permission(user, READ)
+            assert grandchild.is_admin_parent(user)
+            assert grandchild.is_admin_parent(user, include_group_admin=False)
+            assert not grandchild.has_permission(user, WRITE)
+
+    def test_preload(self, project, grandchild, user, django_assert_num_queries):
+        preprint = PreprintFactory(creator=user)
+        permission_resolver.current_resolver().preload(user, [project, grandchild, preprint])
+        with django_assert_num_queries(0):
+            assert project.has_permission(user, ADMIN)
+            assert not grandchild.has_permission(user, ADMIN, check_parent=False)
+            assert preprint.has_permission(user, ADMIN)
+
+    def test_permission_changes_clear_the_cache(self, project, grandchild, user):
+        contributor = AuthUserFactory()
+        assert not project.has_permission(contributor, READ)
+        project.add_contributor(contributor, permissions=WRITE, save=True)
+        assert project.has_permission(contributor, WRITE)
+        project.set_permissions(contributor, READ, save=True)
+        assert not project.has_permission(contributor, WRITE)
+
+        member = AuthUserFactory()
+        group = OSFGroupFactory(creator=user)
+        project.add_osf_group(group, ADMIN)
+        assert not grandchild.is_admin_parent(member)
+        group.make_member(member)
+        assert grandchild.is_admin_parent(member)
+        assert not grandchild.is_admin_parent(member, include_group_admin=False)
+
+    def test_no_cache_outside_of_requests(self, project, user, django_assert_num_queries):
+        permission_resolver.resolver_teardown_request()
+        with django_assert_num_queries(2):
+            assert project.has_permission(user, ADMIN)
+            assert project.has_permission(user, ADMIN)
@@ -0,0 +1,52 @@
+import mock
+import pytest
+
+from api.base import instrumentation
+from website.search import debounce
+
+
+@pytest.mark.django_db
+class TestSearchUpdateDebounce:
+
+    @pytest.fixture(autouse=True)
+    def celery_settings(self):
+        with mock.patch('website.settings.USE_CELERY', True), \
+                mock.patch('website.settings.SEARCH_UPDATE_DEBOUNCE_WINDOW', 10):
+            debounce.search_update_cache().clear()
+            instrumentation.registry.clear()
+            yield
+
+    @pytest.fixture()
+    def task(self):
+        task = mock.Mock()
+        task.name = 'website.search.elastic_search.update_node_async'
+        return task
+
+    def test_updates_within_window_are_coalesced(self, task):
+        for _ in range(5):
+            debounce.schedule(task, 'abcde', index=None, bulk=False)
+        task.apply_async.assert_called_once_with(args=('abcde', ), kwargs={'index': None, 'bulk': False}, countdown=10)
+        assert instrumentation.registry.counters == {
+            ('osf_search_updates_total', 'scheduled'): 1,
+            ('osf_search_updates_total', 'coalesced'): 4,
+        }
+
+    def test_different_objects_and_arguments_are_not_coalesced(self, task):
+        debounce.schedule(task, 'abcde', op='update')
+        debounce.schedule(task, 'abcde', op='delete')
+        debounce.schedule(task, 'fghij', op='update')
+        assert task.apply_async.call_count == 3
+
+    def test_update_after_task_started_is_scheduled(self, task):
+        debounce.schedule(task, 'abcde', index=None)
+        task.request.args = ['abcde']
+        task.request.kwargs = {'index': None}
+        debounce.release(task)
+        debounce.schedule(task, 'abcde', index=None)
+        assert task.apply_async.call_count == 2
+
+    def test_no_window_schedules_every_update(self, task):
+        with mock.patch('website.settings.SEARCH_UPDATE_DEBOUNCE_WINDOW', 0):
+            debounce.schedule(task, 'abcde')
+            debounce.schedule(task, 'abcde')
+        assert task.apply_async.call_count == 2
@@ -1,6 +1,10 @@
+import mock
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from framework.sessions import utils
+from framework.sessions.utils import is_session_cache_shared
 from tests.base import DbTestCase
 from osf_tests.factories import SessionFactory, UserFactory
 from osf.models import OSFUser, Session
@@ -31,6 +35,66 @@ class TestSession:
         assert Session.objects.count() == 1
 
 
+@pytest.mark.django_db
+class TestSessionCache:
+
+    @pytest.fixture(autouse=True)
+    def shared_cache(self):
+        utils.session_cache().clear()
+        with mock.patch('framework.sessions.utils.is_session_cache_shared', return_value=True):
+            yield
+
+    def test_load_session_reads_through_cache(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        assert utils.load_session(session._id).data == {'auth_user_id': 'abc12'}
+        with CaptureQueriesContext(connection) as ctx:
+            cached = utils.load_session(session._id)
+        assert len(ctx.captured_queries) == 0
+        assert cached.id == session.id
+        assert cached.is_dirty is False
+
+    def test_saving_invalidates_cache(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        utils.load_session(session._id)
+        session.data['auth_user_id'] = 'def34'
+        session.save()
+        assert utils.load_session(session._id).data == {'auth_user_id': 'def34'}
+
+    def test_removed_session_is_not_loaded(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        utils.load_session(session._id)
+        utils.remove_session(session)
+        assert utils.load_session(session._id) is None
+
+    def test_sessions_are_not_cached_per_process(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        with mock.patch('framework.sessions.utils.is_session_cache_shared', return_value=False):
+            utils.load_session(session._id)
+            with CaptureQueriesContext(connection) as ctx:
+                assert utils.load_session(session._id).id == session.id
+        assert len(ctx.captured_queries) == 1
+        assert utils.session_cache().get(utils.session_cache_key(session._id)) is None
+
+    def test_local_memory_cache_is_not_shared(self):
+        assert is_session_cache_shared() is False
+
+    def test_save_if_dirty(self):
+        session = Session()
+        assert session.is_dirty
+        session.save_if_dirty()
+        session = Session.load(session._id)
+        assert session.is_dirty is False
+        with mock.patch.object(Session, 'save') as save:
+            session.save_if_dirty()
+            assert save.called is False
+        session.data['auth_user_id'] = 'abc12'
+        assert session.is_dirty
+
+
 class SessionUtilsTestCase(DbTestCase):
     def setUp(self, *args, **kwargs):
         super(SessionUtilsTestCase, self).setUp(*args, **kwargs)
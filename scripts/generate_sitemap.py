@@ -1,24 +1,43 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""Generate a sitemap for osf.io"""
+"""Generate a sitemap for osf.io
+
+Each section (users, nodes, preprints) is split into shards by ranges of primary
+key, so an object always lands in the same shard file. A manifest records a
+fingerprint of every shard; later runs only regenerate the shards whose
+fingerprint changed, unless run with ``--full``. Shards are streamed straight to
+disk from server-side cursors and are written by ``SITEMAP_WORKERS`` threads.
+
+Shard ``<section>_<n>`` is written to ``sitemap_<section>_<n>.xml``. The
+``sitemap_<n>.xml`` files of the unsharded sitemap are removed by the first run
+that finds no manifest.
+"""
 import boto3
 import datetime
 import gzip
+import json
 import os
+import re
 import shutil
-from future.moves.urllib.parse import urlparse, urljoin
-import xml
+import sys
+import threading
+from collections import OrderedDict
+from future.moves.queue import Queue, Empty
+from future.moves.urllib.parse import urljoin
+from xml.sax.saxutils import escape
 
 import django
 django.setup()
 import logging
 import tempfile
 
+from botocore.exceptions import ClientError
 from framework import sentry
 from framework.celery_tasks import app as celery_app
-from django.db.models import Q
-from osf.models import OSFUser, AbstractNode, Preprint, PreprintProvider
-from osf.utils.workflows import DefaultStates
+from django.db import connection
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max
+from include import IncludeQuerySet
+from osf.models import OSFUser, AbstractNode, Preprint
 from scripts import utils as script_utils
 from website import settings
 from website.app import init_app
@@ -26,12 +45,69 @@ from website.app import init_app
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+MANIFEST_NAME = 'sitemap_manifest.json'
+STATIC_SHARD = 'static_0'
+SHARD_FILE_NAME = 'sitemap_{}.xml'
+LEGACY_FILE_NAME = re.compile(r'^sitemap_\d+\.xml(\.gz)?$')
+
+
+class SitemapFile(object):
+    """Streams one urlset to ``sitemap_<name>.xml`` and ``sitemap_<name>.xml.gz``.
+
+    Both files are written under a temporary name and moved into place on
+    ``close``, or deleted by ``discard`` if writing fails, so a half-written
+    shard is never served.
+    """
+    def __init__(self, sitemap_dir, name):
+        self.file_name = SHARD_FILE_NAME.format(name)
+        self.file_path = os.path.join(sitemap_dir, self.file_name)
+        self.plain = open(self.file_path + '.tmp', 'wb')
+        self.zipped = gzip.open(self.file_path + '.gz.tmp', 'wb')
+        self.url_count = 0
+        self.write(u'<?xml version="1.0" encoding="utf-8"?>\n<urlset xmlns="{}">\n'.format(SITEMAP_NAMESPACE))
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.plain.write(data)
+        self.zipped.write(data)
+
+    def add_url(self, config):
+        self.write(u'  <url>{}</url>\n'.format(u''.join(
+            u'<{0}>{1}</{0}>'.format(k, escape(v)) for k, v in config.items()
+        )))
+        self.url_count += 1
+
+    def close(self):
+        self.write(u'</urlset>\n')
+        self.plain.close()
+        self.zipped.close()
+        os.rename(self.file_path + '.tmp', self.file_path)
+        os.rename(self.file_path + '.gz.tmp', self.file_path + '.gz')
+
+    def discard(self):
+        """Delete the temporary files, leaving any previous shard in place."""
+        self.plain.close()
+        self.zipped.close()
+        os.remove(self.file_path + '.tmp')
+        os.remove(self.file_path + '.gz.tmp')
+
 
 class Sitemap(object):
-    def __init__(self):
-        self.sitemap_count = 0
+    # section -> urls emitted per object; shards of a section span
+    # SITEMAP_URL_MAX // urls_per_object primary keys, so no shard can overflow
+    sections = OrderedDict([
+        ('user', 1),
+        ('node', 1),
+        ('preprint', 2),
+    ])
+
+    def __init__(self, full=False):
+        self.full = full
         self.errors = 0
-        self.new_doc()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.manifest = {}
         if not settings.SITEMAP_TO_S3:
             self.sitemap_dir = os.path.join(settings.STATIC_FOLDER, 'sitemaps')
             if not os.path.exists(self.sitemap_dir):
@@ -42,64 +118,24 @@ class Sitemap(object):
             assert settings.SITEMAP_AWS_BUCKET, 'SITEMAP_AWS_BUCKET must be set for sitemap files to be sent to S3'
             assert settings.AWS_ACCESS_KEY_ID, 'AWS_ACCESS_KEY_ID must be set for sitemap files to be sent to S3'
             assert settings.AWS_SECRET_ACCESS_KEY, 'AWS_SECRET_ACCESS_KEY must be set for sitemap files to be sent to S3'
-            self.s3 = boto3.resource(
+
+    @property
+    def s3(self):
+        """The S3 resource of the current thread; boto3 resources must not be shared
+        between the worker threads."""
+        if getattr(self.local, 's3', None) is None:
+            self.local.s3 = boto3.session.Session().resource(
                 's3',
                 aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
                 region_name='us-east-1'
             )
+        return self.local.s3
 
     def cleanup(self):
         if settings.SITEMAP_TO_S3:
             shutil.rmtree(self.sitemap_dir)
 
-    def new_doc(self):
-        """Creates new sitemap document and resets the url_count."""
-        self.doc = xml.dom.minidom.Document()
-        self.urlset = self.doc.createElement('urlset')
-        self.urlset.setAttribute('xmlns', 'http://www.sitemaps.org/schemas/sitemap/0.9')
-        self.doc.appendChild(self.urlset)
-        self.url_count = 0
-
-    def add_tag(self, name, text):
-        """Adds a tag to the current url"""
-        tag = self.doc.createElement(name)
-        self.url.appendChild(tag)
-        tag_text = self.doc.createTextNode(text)
-        tag.appendChild(tag_text)
-
-    def add_url(self, config):
-        """Adds a url to the current urlset"""
-        if self.url_count >= settings.SITEMAP_URL_MAX:
-            self.write_doc()
-            self.new_doc()
-        self.url = self.doc.createElement('url')
-        self.urlset.appendChild(self.url)
-
-        for k, v in config.items():
-            self.add_tag(k, v)
-        self.url_count += 1
-
-    def write_doc(self):
-        """Writes and gzips each sitemap xml file"""
-        file_name = 'sitemap_{}.xml'.format(str(self.sitemap_count))
-        file_path = os.path.join(self.sitemap_dir, file_name)
-        zip_file_name = file_name + '.gz'
-        zip_file_path = file_path + '.gz'
-        print('Writing and gzipping `{}`: url_count = {}'.format(file_path, str(self.url_count)))
-
-        xml_str = self.doc.toprettyxml(indent='  ', encoding='utf-8')
-        with open(file_path, 'wb') as f:
-            f.write(xml_str)
-
-        # Write zipped file
-        with open(file_path, 'rb') as f_in, gzip.open(zip_file_path, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-        if settings.SITEMAP_TO_S3:
-            self.ship_to_s3(file_name, file_path)
-            self.ship_to_s3(zip_file_name, zip_file_path)
-        self.sitemap_count += 1
-
     def ship_to_s3(self, name, path):
         data = open(path, 'rb')
         try:
@@ -110,145 +146,281 @@ class Sitemap(object):
             sentry.log_message('ERROR: Sitemaps could not be uploaded to s3, see `generate_sitemap` logs')
         data.close()
 
-    def write_sitemap_index(self):
-        """Writes the index file for all of the sitemap files"""
-        doc = xml.dom.minidom.Document()
-        sitemap_index = self.doc.createElement('sitemapindex')
-        sitemap_index.setAttribute('xmlns', 'http://www.sitemaps.org/schemas/sitemap/0.9')
-        doc.appendChild(sitemap_index)
+    def remove_file(self, name):
+        if settings.SITEMAP_TO_S3:
+            self.s3.Object(settings.SITEMAP_AWS_BUCKET, 'sitemaps/{}'.format(name)).delete()
+        elif os.path.exists(os.path.join(self.sitemap_dir, name)):
+            os.remove(os.path.join(self.sitemap_dir, name))
 
-        for f in range(self.sitemap_count):
-            sitemap = doc.createElement('sitemap')
-            sitemap_index.appendChild(sitemap)
+    def remove_legacy_files(self):
+        """Remove the ``sitemap_<n>.xml`` files of the unsharded sitemap, which no index lists anymore."""
+        if settings.SITEMAP_TO_S3:
+            objects = self.s3.Bucket(settings.SITEMAP_AWS_BUCKET).objects.filter(Prefix='sitemaps/sitemap_')
+            names = [obj.key[len('sitemaps/'):] for obj in objects]
+        else:
+            names = os.listdir(self.sitemap_dir)
+        for name in names:
+            if LEGACY_FILE_NAME.match(name):
+                print('Removing legacy sitemap `{}`'.format(name))
+                self.remove_file(name)
+
+    def load_manifest(self):
+        """Return the shard manifest of the previous run, or {} if there is none."""
+        try:
+            if settings.SITEMAP_TO_S3:
+                raw = self.s3.Object(settings.SITEMAP_AWS_BUCKET, 'sitemaps/{}'.format(MANIFEST_NAME)).get()['Body'].read()
+            else:
+                with open(os.path.join(self.sitemap_dir, MANIFEST_NAME), 'rb') as f:
+                    raw = f.read()
+        except (IOError, OSError, ClientError):
+            return {}
+        try:
+            return json.loads(raw.decode('utf-8'))['shards']
+        except (ValueError, KeyError):
+            logger.warning('Ignoring unreadable sitemap manifest')
+            return {}
 
-            loc = doc.createElement('loc')
-            sitemap.appendChild(loc)
-            loc_text = self.doc.createTextNode(urljoin(settings.DOMAIN, 'sitemaps/sitemap_{}.xml'.format(str(f))))
-            loc.appendChild(loc_text)
+    def write_manifest(self):
+        file_path = os.path.join(self.sitemap_dir, MANIFEST_NAME)
+        with open(file_path, 'wb') as f:
+            f.write(json.dumps({'shards': self.manifest}, sort_keys=True).encode('utf-8'))
+        if settings.SITEMAP_TO_S3:
+            self.ship_to_s3(MANIFEST_NAME, file_path)
 
-            datemod = doc.createElement('lastmod')
-            sitemap.appendChild(datemod)
-            datemod_text = self.doc.createTextNode(datetime.datetime.now().strftime('%Y-%m-%d'))
-            datemod.appendChild(datemod_text)
+    def write_file(self, name, urls):
+        """Stream ``urls`` (an iterable of url configs) into the shard ``name``."""
+        sitemap_file = SitemapFile(self.sitemap_dir, name)
+        try:
+            for config in urls:
+                sitemap_file.add_url(config)
+        except BaseException:
+            sitemap_file.discard()
+            raise
+        sitemap_file.close()
+        if settings.SITEMAP_TO_S3:
+            self.ship_to_s3(sitemap_file.file_name, sitemap_file.file_path)
+            self.ship_to_s3(sitemap_file.file_name + '.gz', sitemap_file.file_path + '.gz')
+        return sitemap_file.url_count
 
+    def write_sitemap_index(self):
+        """Writes the index file for all of the sitemap files"""
         print('Writing `sitemap_index.xml`')
         file_name = 'sitemap_index.xml'
         file_path = os.path.join(self.sitemap_dir, file_name)
-        xml_str = doc.toprettyxml(indent='  ', encoding='utf-8')
         with open(file_path, 'wb') as f:
-            f.write(xml_str)
+            f.write(u'<?xml version="1.0" encoding="utf-8"?>\n<sitemapindex xmlns="{}">\n'.format(SITEMAP_NAMESPACE).encode('utf-8'))
+            for name in sorted(self.manifest, key=self.shard_sort_key):
+                f.write(u'  <sitemap><loc>{}</loc><lastmod>{}</lastmod></sitemap>\n'.format(
+                    escape(urljoin(settings.DOMAIN, 'sitemaps/' + SHARD_FILE_NAME.format(name))),
+                    self.manifest[name]['lastmod'],
+                ).encode('utf-8'))
+            f.write(b'</sitemapindex>\n')
         if settings.SITEMAP_TO_S3:
             self.ship_to_s3(file_name, file_path)
 
+    def shard_sort_key(self, name):
+        section, shard = name.rsplit('_', 1)
+        return (section != 'static', section, int(shard))
+
     def log_errors(self, obj, obj_id, error):
-        if not self.errors:
-            script_utils.add_file_logger(logger, __file__)
-        self.errors += 1
+        with self.lock:
+            if not self.errors:
+                script_utils.add_file_logger(logger, __file__)
+            self.errors += 1
+            errors = self.errors
         logger.info('Error on {}, {}:'.format(obj, obj_id))
         logger.exception(error)
 
-        if self.errors <= 10:
+        if errors <= 10:
             sentry.log_message('Sitemap Error: {}'.format(error))
 
-        if self.errors == 1000:
+        if errors == 1000:
             sentry.log_message('ERROR: generate_sitemap stopped execution after reaching 1000 errors. See logs for details.')
             raise Exception('Too many errors generating sitemap.')
 
-    def generate(self):
-        print('Generating Sitemap')
+    # Querysets and url builders for each section
 
-        # Progress bar
-        progress = script_utils.Progress(precision=0)
-
-        # Static urls
-        progress.start(len(settings.SITEMAP_STATIC_URLS), 'STAT: ')
-        for config in settings.SITEMAP_STATIC_URLS:
-            config['loc'] = urljoin(settings.DOMAIN, config['loc'])
-            self.add_url(config)
-            progress.increment()
-        progress.stop()
-
-        # User urls
-        objs = OSFUser.objects.filter(is_active=True).exclude(date_confirmed__isnull=True).values_list('guids___id', flat=True)
-        progress.start(objs.count(), 'USER: ')
-        for obj in objs:
+    def user_queryset(self):
+        return OSFUser.objects.filter(is_active=True).exclude(date_confirmed__isnull=True)
+
+    def user_urls(self, rows):
+        for row in rows:
             try:
-                config = settings.SITEMAP_USER_CONFIG
-                config['loc'] = urljoin(settings.DOMAIN, '/{}/'.format(obj))
-                self.add_url(config)
+                config = OrderedDict(settings.SITEMAP_USER_CONFIG)
+                config['loc'] = urljoin(settings.DOMAIN, '/{}/'.format(row['guids___id']))
+                yield config
             except Exception as e:
-                self.log_errors('USER', obj, e)
-            progress.increment()
-        progress.stop()
+                self.log_errors('USER', row['guids___id'], e)
 
-        # AbstractNode urls (Nodes and Registrations, no Collections)
-        objs = (AbstractNode.objects
+    def node_queryset(self):
+        # Nodes and Registrations, no Collections
+        return (AbstractNode.objects
             .filter(is_public=True, is_deleted=False, retraction_id__isnull=True)
-            .exclude(type__in=['osf.collection', 'osf.quickfilesnode'])
-            .values('guids___id', 'modified'))
-        progress.start(objs.count(), 'NODE: ')
-        for obj in objs:
+            .exclude(type__in=['osf.collection', 'osf.quickfilesnode']))
+
+    def node_urls(self, rows):
+        for row in rows:
             try:
-                config = settings.SITEMAP_NODE_CONFIG
-                config['loc'] = urljoin(settings.DOMAIN, '/{}/'.format(obj['guids___id']))
-                config['lastmod'] = obj['modified'].strftime('%Y-%m-%d')
-                self.add_url(config)
+                config = OrderedDict(settings.SITEMAP_NODE_CONFIG)
+                config['loc'] = urljoin(settings.DOMAIN, '/{}/'.format(row['guids___id']))
+                config['lastmod'] = row['modified'].strftime('%Y-%m-%d')
+                yield config
             except Exception as e:
-                self.log_errors('NODE', obj['guids___id'], e)
-            progress.increment()
-        progress.stop()
+                self.log_errors('NODE', row['guids___id'], e)
+
+    def preprint_queryset(self):
+        return Preprint.objects.can_view()
 
-        # Preprint urls
+    def preprint_fields(self):
+        return ('provider___id', 'provider__domain', 'provider__domain_redirect_enabled')
 
-        objs = (Preprint.objects.can_view()
-                    .select_related('node', 'provider', 'primary_file'))
-        progress.start(objs.count() * 2, 'PREP: ')
-        osf = PreprintProvider.objects.get(_id='osf')
-        for obj in objs:
+    def preprint_urls(self, rows):
+        for row in rows:
+            guid = row['guids___id']
             try:
-                preprint_date = obj.modified.strftime('%Y-%m-%d')
-                config = settings.SITEMAP_PREPRINT_CONFIG
-                preprint_url = obj.url
-                provider = obj.provider
-                domain = provider.domain if (provider.domain_redirect_enabled and provider.domain) else settings.DOMAIN
-                if provider == osf:
-                    preprint_url = '/preprints/{}/'.format(obj._id)
-                config['loc'] = urljoin(domain, preprint_url)
+                preprint_date = row['modified'].strftime('%Y-%m-%d')
+                redirect = row['provider__domain_redirect_enabled'] and row['provider__domain']
+                if redirect or row['provider___id'] == 'osf':
+                    preprint_url = '/{}/'.format(guid)
+                else:
+                    preprint_url = '/preprints/{}/{}/'.format(row['provider___id'], guid)
+                if row['provider___id'] == 'osf':
+                    preprint_url = '/preprints/{}/'.format(guid)
+                config = OrderedDict(settings.SITEMAP_PREPRINT_CONFIG)
+                config['loc'] = urljoin(row['provider__domain'] if redirect else settings.DOMAIN, preprint_url)
                 config['lastmod'] = preprint_date
-                self.add_url(config)
+                yield config
 
                 # Preprint file urls
-                try:
-                    file_config = settings.SITEMAP_PREPRINT_FILE_CONFIG
-                    file_config['loc'] = urljoin(
-                        obj.provider.domain or settings.DOMAIN,
-                        os.path.join(
-                            obj._id,
-                            'download',
-                            '?format=pdf'
-                        )
-                    )
-                    file_config['lastmod'] = preprint_date
-                    self.add_url(file_config)
-                except Exception as e:
-                    self.log_errors(obj.primary_file, obj.primary_file._id, e)
+                file_config = OrderedDict(settings.SITEMAP_PREPRINT_FILE_CONFIG)
+                file_config['loc'] = urljoin(
+                    row['provider__domain'] or settings.DOMAIN,
+                    os.path.join(guid, 'download', '?format=pdf')
+                )
+                file_config['lastmod'] = preprint_date
+                yield file_config
             except Exception as e:
-                self.log_errors(obj, obj._id, e)
-            progress.increment(2)
-        progress.stop()
+                self.log_errors('PREPRINT', guid, e)
+
+    # Sharding
+
+    def base_queryset(self, section):
+        queryset = getattr(self, '{}_queryset'.format(section))()
+        if isinstance(queryset, IncludeQuerySet):
+            queryset = queryset.include(None)
+        return queryset
+
+    def shard_width(self, section):
+        return settings.SITEMAP_URL_MAX // self.sections[section]
+
+    def fingerprints(self, section):
+        """Map each non-empty shard of ``section`` to (fingerprint, lastmod) in one aggregate query.
+
+        A shard changes fingerprint when an object enters, leaves or is modified in it.
+        """
+        rows = (self.base_queryset(section)
+            .annotate(sitemap_shard=ExpressionWrapper(F('id') / self.shard_width(section), output_field=IntegerField()))
+            .values('sitemap_shard')
+            .annotate(object_count=Count('id'), last_modified=Max('modified'))
+            .order_by('sitemap_shard'))
+        return OrderedDict(
+            ('{}_{}'.format(section, row['sitemap_shard']), (
+                '{}:{}'.format(row['object_count'], row['last_modified'].isoformat()),
+                row['last_modified'].strftime('%Y-%m-%d'),
+            ))
+            for row in rows
+        )
+
+    def write_shard(self, name, fingerprint, lastmod):
+        section, shard = name.rsplit('_', 1)
+        width = self.shard_width(section)
+        fields = ('id', 'guids___id', 'modified') + getattr(self, '{}_fields'.format(section), tuple)()
+        rows = (self.base_queryset(section)
+            .filter(id__gte=int(shard) * width, id__lt=(int(shard) + 1) * width)
+            .order_by('id')
+            .values(*fields)
+            .iterator())
+        url_count = self.write_file(name, getattr(self, '{}_urls'.format(section))(rows))
+        with self.lock:
+            self.manifest[name] = {'fingerprint': fingerprint, 'lastmod': lastmod, 'url_count': url_count}
+
+    def run_workers(self, jobs):
+        """Write the shards in ``jobs`` with up to SITEMAP_WORKERS threads.
+
+        Inside a transaction (as in tests) the shards are written serially, since
+        other threads would use their own connections and not see its rows.
+        """
+        workers = min(settings.SITEMAP_WORKERS, len(jobs))
+        if workers <= 1 or connection.in_atomic_block:
+            for job in jobs:
+                self.write_shard(*job)
+            return
+
+        queue = Queue()
+        for job in jobs:
+            queue.put(job)
+        failures = []
+
+        def work():
+            try:
+                while not failures:
+                    try:
+                        job = queue.get_nowait()
+                    except Empty:
+                        return
+                    self.write_shard(*job)
+            except Exception as e:
+                failures.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failures:
+            raise failures[0]
+
+    def generate(self):
+        print('Generating Sitemap')
+        previous = self.load_manifest()
+        if not previous:
+            self.remove_legacy_files()
+        today = datetime.datetime.now().strftime('%Y-%m-%d')
+
+        # Static urls are cheap; always rewrite them
+        url_count = self.write_file(STATIC_SHARD, (
+            OrderedDict(config, loc=urljoin(settings.DOMAIN, config['loc']))
+            for config in settings.SITEMAP_STATIC_URLS
+        ))
+        self.manifest[STATIC_SHARD] = {'fingerprint': None, 'lastmod': today, 'url_count': url_count}
+
+        jobs = []
+        for section in self.sections:
+            for name, (fingerprint, lastmod) in self.fingerprints(section).items():
+                if not self.full and previous.get(name, {}).get('fingerprint') == fingerprint:
+                    self.manifest[name] = previous[name]
+                else:
+                    jobs.append((name, fingerprint, lastmod))
+        print('Regenerating {} of {} shards'.format(len(jobs), len(jobs) + len(self.manifest) - 1))
+        self.run_workers(jobs)
+
+        for name in set(previous) - set(self.manifest):
+            print('Removing empty shard `{}`'.format(name))
+            self.remove_file(SHARD_FILE_NAME.format(name))
+            self.remove_file(SHARD_FILE_NAME.format(name) + '.gz')
 
-        # Final write
-        self.write_doc()
         # Create index file
         self.write_sitemap_index()
+        self.write_manifest()
 
         # TODO: once the sitemap is validated add a ping to google with sitemap index file location
-        # TODO: server side cursor query wrapper might be useful as the index gets larger.
         # Sitemap indexable limit check
-        if self.sitemap_count > settings.SITEMAP_INDEX_MAX * .90:  # 10% of urls remaining
+        if len(self.manifest) > settings.SITEMAP_INDEX_MAX * .90:  # 10% of urls remaining
             sentry.log_message('WARNING: Max sitemaps nearly reached.')
-        print('Total url_count = {}'.format((self.sitemap_count - 1) * settings.SITEMAP_URL_MAX + self.url_count))
-        print('Total sitemap_count = {}'.format(str(self.sitemap_count)))
+        print('Total url_count = {}'.format(sum(shard['url_count'] for shard in self.manifest.values())))
+        print('Total sitemap_count = {}'.format(len(self.manifest)))
         if self.errors:
             sentry.log_message('WARNING: Generate sitemap encountered errors. See logs for details.')
             print('Total errors = {}'.format(str(self.errors)))
@@ -256,12 +428,12 @@ class Sitemap(object):
             print('No errors')
 
 @celery_app.task(name='scripts.generate_sitemap')
-def main():
+def main(full=False):
     init_app(routes=False)  # Sets the storage backends on all models
-    sitemap = Sitemap()
+    sitemap = Sitemap(full=full)
     sitemap.generate()
     sitemap.cleanup()
 
 if __name__ == '__main__':
     init_app(set_backends=True, routes=False)
-    main()
+    main(full='--full' in sys.argv)
@@ -3,23 +3,26 @@ Find all users and projects where their total usage (current file + deleted file
 Projects or users can have their GUID whitelisted via `usage_audit whitelist [GUID ...]`
 User usage is defined as the total usage of all projects they have > READ access on
 Project usage is defined as the total usage of it and all its children
+Both are computed with grouped queries over the whole site; with `incremental`, only the
+projects whose files changed since the last run's snapshot are recounted
 total usage is defined as the sum of the size of all verions associated with X via OsfStorageFileNode and OsfStorageTrashedFileNode
 """
 
 import os
-import gc
 import json
 import logging
-import functools
+import itertools
+import operator
 
-from collections import defaultdict
 from django.contrib.contenttypes.models import ContentType
-
-from tqdm import tqdm
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 
 from framework.celery_tasks import app as celery_app
-from osf.models import TrashedFile, Node
+from osf.utils.permissions import WRITE_NODE
 
 from website import mails
 from website.app import init_app
@@ -29,7 +32,8 @@ from scripts import utils as scripts_utils
 # App must be init'd before django models are imported
 init_app(set_backends=True, routes=False)
 
-from osf.models import BaseFileNode, FileVersion, OSFUser, AbstractNode
+from osf.models import AbstractNode, OSFUser, TrashedFile, TrashedFileNode, TrashedFolder
+from osf.models.node import NodeGroupObjectPermission
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -39,7 +43,38 @@ GBs = 1024 ** 3.0
 USER_LIMIT = 5 * GBs
 PROJECT_LIMIT = 5 * GBs
 
+TRASHED_TYPES = [TrashedFileNode._typedmodels_type, TrashedFile._typedmodels_type, TrashedFolder._typedmodels_type]
+EXCLUDED_NODE_TYPES = ['osf.collection', 'osf.quickfilesnode']
+
+# Sizes of every version of every osfstorage file, active or trashed, summed per project tree
+PROJECT_USAGE_SQL = """
+    SELECT N.root_id,
+        SUM(CASE WHEN F.type = ANY(%(trashed_types)s) THEN 0 ELSE COALESCE(V.size, 0) END),
+        SUM(CASE WHEN F.type = ANY(%(trashed_types)s) THEN COALESCE(V.size, 0) ELSE 0 END)
+    FROM osf_basefilenode AS F
+    JOIN osf_basefileversionsthrough AS T ON T.basefilenode_id = F.id
+    JOIN osf_fileversion AS V ON V.id = T.fileversion_id
+    JOIN osf_abstractnode AS N ON N.id = F.target_object_id
+    WHERE F.provider = 'osfstorage'
+        AND F.target_content_type_id = %(content_type)s
+        AND N.type <> ALL(%(excluded_types)s)
+        {roots}
+    GROUP BY N.root_id
+"""
+ROOTS_FILTER = 'AND N.root_id = ANY(%(root_ids)s)'
+
+CHANGED_ROOTS_SQL = """
+    SELECT DISTINCT N.root_id
+    FROM osf_basefilenode AS F
+    JOIN osf_abstractnode AS N ON N.id = F.target_object_id
+    WHERE F.provider = 'osfstorage'
+        AND F.target_content_type_id = %(content_type)s
+        AND F.modified >= %(since)s
+"""
+
 WHITE_LIST_PATH = os.path.join(os.path.dirname(__file__), 'usage_whitelist.json')
+# Per-project usage of the last run, for incremental audits
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'usage_snapshot.json')
 
 
 try:
@@ -59,50 +94,101 @@ def add_to_white_list(gtg):
     logger.info('Whitelist updated to {}'.format(WHITE_LIST))
 
 
-def get_usage(node):
-    node_content_type = ContentType.objects.get_for_model(Node)
-
-    vids = [each for each in BaseFileNode.active.filter(provider='osfstorage', target_object_id=node.id, target_content_type=node_content_type).values_list('versions', flat=True) if each]
-    t_vids = [each for eac in TrashedFile.objects.filter(provider='osfstorage', target_object_id=node.id, target_content_type=node_content_type).values_list('versions', flat=True) if each]
-
-    usage = sum([v.size or 0 for v in FileVersion.objects.filter(id__in=vids)])
-    trashed_usage = sum([v.size or 0 for v in FileVersion.objects.filter(id__in=t_vids)])
-
-    return list(map(sum, zip(*([(usage, trashed_usage)] + [get_usage(child) for child in node.nodes_primary]))))  # Adds tuples together, map(sum, zip((a, b), (c, d))) -> (a+c, b+d)
-
-
-def limit_filter(limit, (item, usage)):
+def project_usage(content_type_id, root_ids=None, chunk_size=1000):
+    """Yield (root id, (current usage, deleted usage)) for every project tree with osfstorage files,
+    summed in one grouped query. Restricted to the trees of ``root_ids`` if given.
+    """
+    params = {
+        'content_type': content_type_id,
+        'trashed_types': TRASHED_TYPES,
+        'excluded_types': EXCLUDED_NODE_TYPES,
+        'root_ids': list(root_ids or []),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(PROJECT_USAGE_SQL.format(roots=ROOTS_FILTER if root_ids is not None else ''), params)
+        rows = cursor.fetchmany(chunk_size)
+        while rows:
+            for root_id, used, deleted in rows:
+                yield root_id, (int(used), int(deleted))
+            rows = cursor.fetchmany(chunk_size)
+
+
+def changed_roots(content_type_id, since):
+    """Ids of the project trees with osfstorage files created, updated or trashed since ``since``."""
+    with connection.cursor() as cursor:
+        cursor.execute(CHANGED_ROOTS_SQL, {'content_type': content_type_id, 'since': since})
+        return {root_id for root_id, in cursor.fetchall()}
+
+
+def user_usage(projects, excluded):
+    """Yield (user id, (current usage, deleted usage)) for every contributor with write permission on
+    a project in ``projects``. The (user, project) pairs are streamed in user order, so only one
+    user's total is held at a time.
+    """
+    editors = (NodeGroupObjectPermission.objects
+        .filter(
+            permission__codename=WRITE_NODE,
+            content_object__root=F('content_object'),
+            group__user__contributor__node=F('content_object'),
+        )
+        .order_by('group__user', 'content_object')
+        .values_list('group__user', 'content_object')
+        .distinct()
+        .iterator())
+    for user_id, pairs in itertools.groupby(editors, key=operator.itemgetter(0)):
+        usage = [projects[root_id] for _, root_id in pairs if root_id in projects and root_id not in excluded]
+        if usage:
+            yield user_id, tuple(map(sum, zip(*usage)))  # Adds tuples together, map(sum, zip((a, b), (c, d))) -> (a+c, b+d)
+
+
+def load_snapshot():
+    try:
+        with open(SNAPSHOT_PATH, 'r') as fobj:
+            snapshot = json.load(fobj)
+    except (IOError, ValueError):
+        return None, {}
+    return parse_datetime(snapshot['taken']), {int(root_id): tuple(usage) for root_id, usage in snapshot['projects'].items()}
+
+
+def save_snapshot(taken, projects):
+    with open(SNAPSHOT_PATH, 'w') as fobj:
+        json.dump({'taken': taken.isoformat(), 'projects': projects}, fobj)
+
+
+def over_limit(limit, usage):
     """Note: usage is a tuple(current_usage, deleted_usage)"""
-    return item not in WHITE_LIST and sum(usage) >= limit
+    return sum(usage) >= limit
 
 
-def main(send_email=False):
+def main(send_email=False, incremental=False):
+    """Audit storage usage. With ``incremental``, only the project trees whose files changed since
+    the last snapshot are recounted; the rest are taken from the snapshot.
+    """
     logger.info('Starting Project storage audit')
 
     lines = []
-    projects = {}
-    users = defaultdict(lambda: (0, 0))
-
-    top_level_nodes = AbstractNode.objects.get_roots()
-    progress_bar = tqdm(total=top_level_nodes.count())
-    top_level_nodes = top_level_nodes.iterator()
-
-    for i, node in enumerate(top_level_nodes):
-        progress_bar.update(i+1)
-        if node._id in WHITE_LIST:
-            continue  # Dont count whitelisted nodes against users
-        projects[node._id] = get_usage(node)
-        for contrib in node.contributors:
-            if node.can_edit(user=contrib):
-                users[contrib._id] = tuple(map(sum, zip(users[contrib._id], projects[node._id])))  # Adds tuples together, map(sum, zip((a, b), (c, d))) -> (a+c, b+d)
-
-        if i % 25 == 0:
-            gc.collect()
-    progress_bar.close()
-
-    for model, collection, limit in ((OSFUser, users, USER_LIMIT), (AbstractNode, projects, PROJECT_LIMIT)):
-        for item, (used, deleted) in filter(functools.partial(limit_filter, limit), collection.items()):
-            line = '{!r} has exceeded the limit {:.2f}GBs ({}b) with {:.2f}GBs ({}b) used and {:.2f}GBs ({}b) deleted.'.format(model.load(item), limit / GBs, limit, used / GBs, used, deleted / GBs, deleted)
+    taken = timezone.now()
+    content_type_id = ContentType.objects.get_for_model(AbstractNode).id
+    since, projects = load_snapshot() if incremental else (None, {})
+
+    if since:
+        root_ids = changed_roots(content_type_id, since)
+        logger.info('Recounting {} project(s) changed since {}'.format(len(root_ids), since.isoformat()))
+        for root_id in root_ids:
+            projects.pop(root_id, None)
+        projects.update(project_usage(content_type_id, root_ids=root_ids))
+    else:
+        projects.update(project_usage(content_type_id))
+    save_snapshot(taken, projects)
+
+    # Whitelisted projects are not counted against their users
+    excluded = set(AbstractNode.objects.filter(guids___id__in=WHITE_LIST).values_list('id', flat=True))
+
+    for model, usage, limit in ((OSFUser, user_usage(projects, excluded), USER_LIMIT), (AbstractNode, iter(projects.items()), PROJECT_LIMIT)):
+        offenders = dict((pk, used) for pk, used in usage if over_limit(limit, used))
+        for item in model.objects.filter(id__in=offenders).exclude(guids___id__in=WHITE_LIST):
+            used, deleted = offenders[item.id]
+            line = '{!r} has exceeded the limit {:.2f}GBs ({}b) with {:.2f}GBs ({}b) used and {:.2f}GBs ({}b) deleted.'.format(item, limit / GBs, limit, used / GBs, used, deleted / GBs, deleted)
             logger.info(line)
             lines.append(line)
 
@@ -118,9 +204,9 @@ def main(send_email=False):
 
 
 @celery_app.task(name='scripts.osfstorage.usage_audit')
-def run_main(send_mail=False, white_list=None):
+def run_main(send_mail=False, white_list=None, incremental=False):
     scripts_utils.add_file_logger(logger, __file__)
     if white_list:
         add_to_white_list(white_list)
     else:
-        main(send_mail)
+        main(send_mail, incremental=incremental)
@@ -0,0 +1,133 @@
+import json
+import os
+
+import mock
+import pytest
+from django.contrib.contenttypes.models import ContentType
+
+from framework.auth.core import Auth
+from osf.models import AbstractNode, BaseFileNode, TrashedFile
+from osf.utils.permissions import READ, WRITE
+from osf_tests.factories import AuthUserFactory, NodeFactory, ProjectFactory
+from website import settings
+
+from scripts.osfstorage import usage_audit
+
+
+def add_file(node, name, *sizes):
+    """Add an osfstorage file to ``node`` with one version of each size."""
+    file_node = node.get_addon('osfstorage').get_root().append_file(name)
+    for i, size in enumerate(sizes):
+        file_node.create_version(node.creator, {
+            'service': 'cloud',
+            settings.WATERBUTLER_RESOURCE: 'osf',
+            'object': '{}-{}'.format(name, i),
+        }, {'size': size})
+    return file_node
+
+
+def get_usage(node):
+    """(current usage, deleted usage) of ``node`` and its components, counted the way the
+    audit did before it was rewritten: one node at a time, recursing through nodes_primary.
+    """
+    content_type = ContentType.objects.get_for_model(AbstractNode)
+    files = {'provider': 'osfstorage', 'target_object_id': node.id, 'target_content_type': content_type}
+    used = sum(version.size or 0 for file_node in BaseFileNode.active.filter(**files) for version in file_node.versions.all())
+    deleted = sum(version.size or 0 for file_node in TrashedFile.objects.filter(**files) for version in file_node.versions.all())
+    return tuple(map(sum, zip((used, deleted), *[get_usage(child) for child in node.nodes_primary])))
+
+
+@pytest.mark.django_db
+class TestUsageAudit:
+
+    @pytest.fixture()
+    def admin(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def write_contrib(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def read_contrib(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def project(self, admin, write_contrib, read_contrib):
+        project = ProjectFactory(creator=admin)
+        project.add_contributor(write_contrib, permissions=WRITE, auth=Auth(admin), save=True)
+        project.add_contributor(read_contrib, permissions=READ, auth=Auth(admin), save=True)
+        add_file(project, 'data.csv', 100, 50)
+        add_file(project, 'old.csv', 10).delete()
+        return project
+
+    @pytest.fixture()
+    def component(self, admin, project):
+        component = NodeFactory(parent=project, creator=admin)
+        add_file(component, 'results.csv', 1000)
+        return component
+
+    @pytest.fixture()
+    def whitelisted(self, write_contrib):
+        whitelisted = ProjectFactory(creator=write_contrib)
+        add_file(whitelisted, 'big.zip', 5000)
+        with mock.patch.object(usage_audit, 'WHITE_LIST', {whitelisted._id}):
+            yield whitelisted
+
+    @pytest.fixture()
+    def content_type_id(self):
+        return ContentType.objects.get_for_model(AbstractNode).id
+
+    @pytest.fixture()
+    def snapshot_path(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'usage_snapshot.json')
+        with mock.patch.object(usage_audit, 'SNAPSHOT_PATH', path):
+            yield path
+
+    def test_project_usage_matches_recursive_count(self, content_type_id, project, component, whitelisted):
+        usage = dict(usage_audit.project_usage(content_type_id))
+
+        assert usage[project.id] == (1150, 10)
+        assert usage[project.id] == get_usage(project)
+        assert usage[whitelisted.id] == get_usage(whitelisted)
+        assert component.id not in usage
+
+    def test_project_usage_of_some_roots(self, content_type_id, project, component, whitelisted):
+        usage = dict(usage_audit.project_usage(content_type_id, root_ids=[whitelisted.id]))
+
+        assert usage == {whitelisted.id: (5000, 0)}
+
+    def test_user_usage_counts_editors_only(self, content_type_id, admin, write_contrib, read_contrib, project, component, whitelisted):
+        projects = dict(usage_audit.project_usage(content_type_id))
+        usage = dict(usage_audit.user_usage(projects, excluded={whitelisted.id}))
+
+        editors = [contrib for contrib in project.contributors if project.can_edit(user=contrib)]
+        assert sorted(usage) == sorted(contrib.id for contrib in editors) == sorted([admin.id, write_contrib.id])
+        assert usage[admin.id] == usage[write_contrib.id] == get_usage(project)
+        assert read_contrib.id not in usage
+
+    @mock.patch('scripts.osfstorage.usage_audit.mails.send_mail')
+    def test_incremental_run_recounts_changed_roots_only(self, mock_mail, snapshot_path, project, component, whitelisted):
+        other = ProjectFactory()
+        add_file(other, 'notes.txt', 20)
+        usage_audit.main(incremental=True)
+
+        with open(snapshot_path) as fobj:
+            snapshot = json.load(fobj)
+        assert snapshot['projects'][str(project.id)] == [1150, 10]
+        # Roots that did not change are taken from the snapshot, not recounted
+        snapshot['projects'][str(other.id)] = [7, 7]
+        with open(snapshot_path, 'w') as fobj:
+            json.dump(snapshot, fobj)
+
+        add_file(component, 'more.csv', 1)
+        with mock.patch.object(usage_audit, 'project_usage', wraps=usage_audit.project_usage) as mock_usage:
+            usage_audit.main(incremental=True)
+        assert mock_usage.call_args[1]['root_ids'] == {project.id}
+
+        with open(snapshot_path) as fobj:
+            snapshot = json.load(fobj)
+        assert snapshot['projects'][str(project.id)] == [1151, 10]
+        assert snapshot['projects'][str(other.id)] == [7, 7]
+        assert snapshot['projects'][str(whitelisted.id)] == [5000, 0]
+        assert not mock_mail.called
@@ -183,8 +183,12 @@ def celery_beat(ctx, level='debug', schedule=None):
     ctx.run(bin_prefix(cmd), pty=True)
 
 @task
-def migrate_search(ctx, delete=True, remove=False, index=settings.ELASTIC_INDEX):
-    """Migrate the search-enabled models."""
+def migrate_search(ctx, delete=True, remove=False, index=settings.ELASTIC_INDEX, workers=1, chunk_size=None, checkpoint=None):
+    """Migrate the search-enabled models.
+
+    Use --workers to migrate id ranges in parallel processes, and --checkpoint
+    to record progress in a file so an interrupted migration can be resumed.
+    """
     from website.app import init_app
     init_app(routes=False, set_backends=False)
     from website.search_migration.migrate import migrate
@@ -195,7 +199,14 @@ def migrate_search(ctx, delete=True, remove=False, index=settings.ELASTIC_INDEX)
     for logger in SILENT_LOGGERS:
         logging.getLogger(logger).setLevel(logging.ERROR)
 
-    migrate(delete, remove=remove, index=index)
+    migrate(
+        delete,
+        remove=remove,
+        index=index,
+        workers=int(workers),
+        chunk_size=int(chunk_size) if chunk_size else None,
+        checkpoint_path=checkpoint,
+    )
 
 @task
 def rebuild_search(ctx):
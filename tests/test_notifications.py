@@ -1859,6 +1859,51 @@ class TestSendDigest(OsfTestCase):
         send_users_email(send_type)
         assert_false(mock_send_mail.called)
 
+    @mock.patch('website.notifications.tasks.DIGEST_CHUNK_SIZE', 2)
+    @mock.patch('website.mails.send_mail')
+    def test_send_users_email_sends_and_removes_digests_in_chunks(self, mock_send_mail):
+        send_type = 'email_transactional'
+        users = [factories.UserFactory() for _ in range(3)]
+        for user in users:
+            factories.NotificationDigestFactory(
+                user=user,
+                send_type=send_type,
+                event='comment_replies',
+                timestamp=timezone.now(),
+                message='Hello',
+                node_lineage=[factories.ProjectFactory()._id]
+            )
+        send_users_email(send_type)
+        sent_to = {kwargs['to_addr'] for args, kwargs in mock_send_mail.call_args_list}
+        assert_equal(sent_to, {user.username for user in users})
+        assert_false(NotificationDigest.objects.filter(user__in=users).exists())
+
+    @mock.patch('website.notifications.tasks.log_exception')
+    @mock.patch('website.mails.send_mail')
+    def test_send_users_email_keeps_digests_of_failed_mails(self, mock_send_mail, mock_log_exception):
+        send_type = 'email_transactional'
+        failing_user, user = factories.UserFactory(), factories.UserFactory()
+        for each in (failing_user, user):
+            factories.NotificationDigestFactory(
+                user=each,
+                send_type=send_type,
+                event='comment_replies',
+                timestamp=timezone.now(),
+                message='Hello',
+                node_lineage=[factories.ProjectFactory()._id]
+            )
+
+        def send_mail(**kwargs):
+            if kwargs['to_addr'] == failing_user.username:
+                raise Exception('SMTP error')
+        mock_send_mail.side_effect = send_mail
+
+        send_users_email(send_type)
+        assert_equal(mock_send_mail.call_count, 2)
+        assert_true(mock_log_exception.called)
+        assert_true(NotificationDigest.objects.filter(user=failing_user).exists())
+        assert_false(NotificationDigest.objects.filter(user=user).exists())
+
     def test_remove_sent_digest_notifications(self):
         d = factories.NotificationDigestFactory(
             event='comment_replies',
@@ -4,6 +4,7 @@ from rest_framework import status as http_status
 
 import celery
 from celery.utils.log import get_task_logger
+from django.utils import timezone
 
 from framework.celery_tasks import app as celery_app
 from framework.celery_tasks.utils import logged
@@ -29,10 +30,14 @@ from website import settings
 from website.app import init_addons
 from osf.models import (
     ArchiveJob,
+    ArchiveTarget,
     AbstractNode,
     DraftRegistration,
 )
 
+# Pooled connections to WaterButler for copy requests
+waterbutler_session = requests.Session()
+
 
 def create_app_context():
     try:
@@ -130,6 +135,10 @@ def stat_addon(addon_short_name, job_pk):
         # Addon enabled but not configured - no file trees, nothing to archive.
         return AggregateStatResult(src_addon._id, addon_short_name)
     try:
+        # Dataverse targets are told apart by the name of their archive folder, so they
+        # are always copied whole
+        if settings.ARCHIVE_BATCH_COPIES and addon_name != 'dataverse':
+            return utils.plan_copy_units(src_addon, addon_short_name, user, version=version)
         file_tree = src_addon._get_file_tree(user=user, version=version)
     except HTTPError as e:
         dst.archive_job.update_target(
@@ -146,6 +155,12 @@ def stat_addon(addon_short_name, job_pk):
     return result
 
 
+def send_copy_request(url, data):
+    res = waterbutler_session.post(url, data=json.dumps(data))
+    if res.status_code not in (http_status.HTTP_200_OK, http_status.HTTP_201_CREATED, http_status.HTTP_202_ACCEPTED):
+        raise HTTPError(res.status_code)
+
+
 @celery_app.task(base=ArchiverTask, ignore_result=False)
 @logged('make_copy_request')
 def make_copy_request(job_pk, url, data):
@@ -161,19 +176,64 @@ def make_copy_request(job_pk, url, data):
     job = ArchiveJob.load(job_pk)
     src, dst, user = job.info()
     logger.info('Sending copy request for addon: {0} on node: {1}'.format(data['provider'], dst._id))
-    res = requests.post(url, data=json.dumps(data))
-    if res.status_code not in (http_status.HTTP_200_OK, http_status.HTTP_201_CREATED, http_status.HTTP_202_ACCEPTED):
-        raise HTTPError(res.status_code)
+    send_copy_request(url, data)
+
 
-def make_waterbutler_payload(dst_id, rename):
+@celery_app.task(base=ArchiverTask, bind=True, ignore_result=False,
+                 max_retries=settings.ARCHIVE_BATCH_MAX_RETRIES, default_retry_delay=settings.ARCHIVE_BATCH_RETRY_DELAY)
+@logged('archive_batch')
+def archive_batch(self, job_pk, addon_short_name, copies):
+    """Make the copy requests of one batch of a batched addon, in order. On a network
+    error the batch is retried from the failed request, so accepted copies are not redone.
+
+    :param job_pk: primary key of ArchiveJob
+    :param addon_short_name: AddonConfig.short_name of the addon being archived
+    :param copies: <list> of (url, data) pairs of the copy requests
+    :return: None
+    """
+    create_app_context()
+    for i, (url, data) in enumerate(copies):
+        try:
+            send_copy_request(url, data)
+        except (HTTPError, requests.RequestException) as e:
+            logger.info('Retrying {0} of {1} copies for addon: {2} on job: {3}'.format(len(copies) - i, len(copies), addon_short_name, job_pk))
+            raise self.retry(exc=e, kwargs={'job_pk': job_pk, 'addon_short_name': addon_short_name, 'copies': copies[i:]})
+    ArchiveJob.objects.filter(_id=job_pk).update(last_progress=timezone.now())
+    logger.info('Sent {0} copies for addon: {1} on job: {2}'.format(len(copies), addon_short_name, job_pk))
+
+def make_waterbutler_payload(dst_id, rename, path='/'):
     return {
         'action': 'copy',
-        'path': '/',
+        'path': path,
         'rename': rename.replace('/', '-'),
         'resource': dst_id,
         'provider': settings.ARCHIVE_PROVIDER,
     }
 
+def archive_addon_in_batches(job, target, rename, params, units):
+    """Copy each unit of a batched addon into its folder of the archive, sending the
+    copies as parallel batches bounded by ARCHIVE_BATCH_MAX_FILES and ARCHIVE_BATCH_MAX_SIZE.
+    """
+    src, dst, user = job.info()
+    addon_short_name = target.name
+    folders = utils.make_archive_folders(dst, rename, units)
+    batches = [
+        [
+            (
+                waterbutler_api_url_for(src._id, addon_short_name, path=unit['target_id'], _internal=True, base_url=src.osfstorage_region.waterbutler_url, **params),
+                make_waterbutler_payload(dst._id, unit['target_name'], path=folders[unit['destination']]),
+            )
+            for unit in batch
+        ]
+        for batch in utils.batch_copy_units(units)
+    ]
+    ArchiveTarget.objects.filter(id=target.id).update(copies_total=len(units), copies_pending=len(units))
+    logger.info('Archiving addon: {0} on node: {1} in {2} batches of {3} copies'.format(addon_short_name, src._id, len(batches), len(units)))
+    celery.group([
+        archive_batch.si(job_pk=job._id, addon_short_name=addon_short_name, copies=copies)
+        for copies in batches
+    ]).apply_async()
+
 @celery_app.task(base=ArchiverTask, ignore_result=False)
 @logged('archive_addon')
 def archive_addon(addon_short_name, job_pk):
@@ -189,6 +249,7 @@ def archive_addon(addon_short_name, job_pk):
     src, dst, user = job.info()
     logger.info('Archiving addon: {0} on node: {1}'.format(addon_short_name, src._id))
 
+    target = job.get_target(addon_short_name)
     cookie = user.get_or_create_cookie()
     params = {'cookie': cookie}
     rename_suffix = ''
@@ -205,6 +266,10 @@ def archive_addon(addon_short_name, job_pk):
     src_provider = src.get_addon(addon_short_name)
     folder_name = src_provider.archive_folder_name
     rename = '{}{}'.format(folder_name, rename_suffix)
+    stat_result = target.stat_result if target else {}
+    if stat_result.get('batched') and stat_result['targets'][0]['target_id'] != '/':
+        archive_addon_in_batches(job, target, rename, params, stat_result['targets'])
+        return
     url = waterbutler_api_url_for(src._id, addon_short_name, _internal=True, base_url=src.osfstorage_region.waterbutler_url, **params)
     data = make_waterbutler_payload(dst._id, rename)
     make_copy_request.delay(job_pk=job_pk, url=url, data=data)
@@ -242,6 +307,13 @@ def archive_node(stat_results, job_pk):
             if not result['num_files']:
                 job.update_target(result['target_name'], ARCHIVER_SUCCESS)
             else:
+                # Kept for batching the copies and for measuring their progress
+                target = job.get_target(result['target_name'])
+                if target:
+                    target.stat_result = result if result.get('batched') else {
+                        key: result[key] for key in ('target_id', 'target_name', 'num_files', 'disk_usage')
+                    }
+                    target.save()
                 archive_addon.delay(
                     addon_short_name=result['target_name'],
                     job_pk=job_pk
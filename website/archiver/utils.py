@@ -170,6 +170,92 @@ def aggregate_file_tree_metadata(addon_short_name, fileobj_metadata, user):
             targets=[aggregate_file_tree_metadata(addon_short_name, child, user) for child in fileobj_metadata.get('children', [])],
         )
 
+def plan_copy_units(addon, addon_short_name, user, version=None):
+    """Walk the addon's file tree one folder listing at a time and split it into copy units.
+
+    A folder that fits within ARCHIVE_BATCH_MAX_FILES and ARCHIVE_BATCH_MAX_SIZE is copied
+    whole; a larger one is split into its children. Only the listings of the folders on the
+    current path and the resulting units are held in memory, never the whole tree.
+
+    :param addon: AddonNodeSettings instance of addon being examined
+    :param user: archive initatior
+    :return: AggregateStatResult of the addon whose targets are the copy units. Each unit
+    also has the `destination` folder, relative to the archive folder, it is copied into.
+    """
+    cookie = user.get_or_create_cookie()
+
+    def copy_unit(fileobj, num_files, disk_usage, destination):
+        return {
+            'target_id': fileobj['path'],
+            'target_name': fileobj['name'],
+            'num_files': num_files,
+            'disk_usage': disk_usage,
+            'destination': destination,
+        }
+
+    def walk(fileobj, path):
+        """Return (num_files, disk_usage, units), units being None if ``fileobj`` fits in one."""
+        if fileobj['kind'] == 'file':
+            return 1, float(fileobj.get('size') or 0), None
+        num_files, disk_usage, children = 0, 0.0, []
+        for child in addon._get_fileobj_child_metadata(fileobj, user, cookie=cookie, version=version):
+            child_files, child_usage, child_units = walk(child, '{}{}/'.format(path, child['name']))
+            num_files += child_files
+            disk_usage += child_usage
+            children.append((child, child_files, child_usage, child_units))
+        if num_files <= settings.ARCHIVE_BATCH_MAX_FILES and disk_usage <= settings.ARCHIVE_BATCH_MAX_SIZE:
+            return num_files, disk_usage, None
+        units = []
+        for child, child_files, child_usage, child_units in children:
+            if child_units is None:
+                units.append(copy_unit(child, child_files, child_usage, path))
+            else:
+                units.extend(child_units)
+        return num_files, disk_usage, units
+
+    root = {'path': '/', 'kind': 'folder', 'name': ''}
+    num_files, disk_usage, units = walk(root, '')
+    if units is None:
+        units = [copy_unit(root, num_files, disk_usage, '')]
+    result = AggregateStatResult(addon._id, addon_short_name, targets=units)
+    result['batched'] = True
+    return result
+
+def batch_copy_units(units):
+    """Group copy units, in order, into batches of at most ARCHIVE_BATCH_MAX_FILES files and
+    ARCHIVE_BATCH_MAX_SIZE bytes. A single unit above the limits makes a batch of its own.
+    """
+    batches, batch, num_files, disk_usage = [], [], 0, 0
+    for unit in units:
+        if batch and (num_files + unit['num_files'] > settings.ARCHIVE_BATCH_MAX_FILES or
+                      disk_usage + unit['disk_usage'] > settings.ARCHIVE_BATCH_MAX_SIZE):
+            batches.append(batch)
+            batch, num_files, disk_usage = [], 0, 0
+        batch.append(unit)
+        num_files += unit['num_files']
+        disk_usage += unit['disk_usage']
+    if batch:
+        batches.append(batch)
+    return batches
+
+def make_archive_folders(dst, rename, units):
+    """Create the archive folder ``rename`` and the folders the copy units go into in the
+    registration's archive provider.
+
+    :return: <dict> of unit destination -> WaterButler path of the folder
+    """
+    root = dst.get_addon(settings.ARCHIVE_PROVIDER).get_root()
+    # As named by whole-addon copies, see tasks.make_waterbutler_payload
+    folders = {'': root.append_folder(rename.replace('/', '-'))}
+    destinations = set()
+    for unit in units:
+        parts = unit['destination'].split('/')[:-1]
+        destinations.update('/'.join(parts[:i]) + '/' for i in range(1, len(parts) + 1))
+    for destination in sorted(destinations, key=lambda destination: destination.count('/')):
+        parent, _, name = destination[:-1].rpartition('/')
+        folders[destination] = folders[parent + '/' if parent else ''].append_folder(name)
+    return {destination: '/{}/'.format(folder._id) for destination, folder in folders.items()}
+
 def before_archive(node, user):
     from osf.models import ArchiveJob
     link_archive_provider(node, user)
@@ -4,6 +4,7 @@ Tasks for making even transactional emails consolidated.
 import itertools
 
 from django.db import connection
+from gevent.pool import Pool
 
 from framework.celery_tasks import app as celery_app
 from framework.sentry import log_exception
@@ -13,6 +14,11 @@ from osf.utils.permissions import ADMIN
 from website import mails, settings
 from website.notifications.utils import NotificationsDict
 
+# Digests loaded, sent and deleted together
+DIGEST_CHUNK_SIZE = 1000
+# Mails rendered and sent at once
+DIGEST_SEND_POOL_SIZE = 10
+
 
 @celery_app.task(name='website.notifications.tasks.send_users_email', max_retries=0)
 def send_users_email(send_type):
@@ -29,59 +35,129 @@ def _send_global_and_node_emails(send_type):
     """
     Called by `send_users_email`. Send all global and node-related notification emails.
     """
-    grouped_emails = get_users_emails(send_type)
-    for group in grouped_emails:
-        user = OSFUser.load(group['user_id'])
-        if not user:
-            log_exception()
-            continue
-        info = group['info']
-        notification_ids = [message['_id'] for message in info]
-        sorted_messages = group_by_node(info)
-        if sorted_messages:
-            if not user.is_disabled:
-                # If there's only one node in digest we can show it's preferences link in the template.
-                notification_nodes = list(sorted_messages['children'].keys())
-                node = AbstractNode.load(notification_nodes[0]) if len(
-                    notification_nodes) == 1 else None
-                mails.send_mail(
-                    to_addr=user.username,
-                    mimetype='html',
-                    can_change_node_preferences=bool(node),
-                    node=node,
-                    mail=mails.DIGEST,
-                    name=user.fullname,
-                    message=sorted_messages,
-                )
-            remove_notifications(email_notification_ids=notification_ids)
+    for chunk in chunked(get_users_emails(send_type), DIGEST_CHUNK_SIZE):
+        users = load_by_guid(OSFUser, [group['user_id'] for group in chunk])
+        messages = []
+        for group in chunk:
+            user = users.get(group['user_id'])
+            if not user:
+                log_exception()
+                continue
+            info = group['info']
+            sorted_messages = group_by_node(info)
+            if sorted_messages:
+                messages.append((user, sorted_messages, [message['_id'] for message in info]))
+
+        # If there's only one node in digest we can show it's preferences link in the template.
+        single_node_ids = {
+            list(sorted_messages['children'].keys())[0]
+            for _, sorted_messages, _ in messages
+            if len(sorted_messages['children']) == 1
+        }
+        nodes = load_by_guid(AbstractNode, single_node_ids)
+
+        mail_kwargs = []
+        mail_notification_ids = []
+        notification_ids = []
+        for user, sorted_messages, ids in messages:
+            if user.is_disabled:
+                notification_ids.extend(ids)
+                continue
+            mail_notification_ids.append(ids)
+            notification_nodes = list(sorted_messages['children'].keys())
+            node = nodes.get(notification_nodes[0]) if len(notification_nodes) == 1 else None
+            mail_kwargs.append(dict(
+                to_addr=user.username,
+                mimetype='html',
+                can_change_node_preferences=bool(node),
+                node=node,
+                mail=mails.DIGEST,
+                name=user.fullname,
+                message=sorted_messages,
+            ))
+        notification_ids.extend(sent_notification_ids(mail_notification_ids, send_mails(mail_kwargs)))
+        remove_notifications(email_notification_ids=notification_ids)
 
 
 def _send_reviews_moderator_emails(send_type):
     """
     Called by `send_users_email`. Send all reviews triggered emails.
     """
-    grouped_emails = get_moderators_emails(send_type)
-    for group in grouped_emails:
-        user = OSFUser.load(group['user_id'])
-        info = group['info']
-        notification_ids = [message['_id'] for message in info]
-        if not user.is_disabled:
-            provider = AbstractProvider.objects.get(id=group['provider_id'])
-            mails.send_mail(
-                to_addr=user.username,
-                mimetype='html',
-                mail=mails.DIGEST_REVIEWS_MODERATORS,
-                name=user.fullname,
-                message=info,
-                provider_name=provider.name,
-                reviews_submissions_url='{}reviews/preprints/{}'.format(settings.DOMAIN, provider._id),
-                notification_settings_url='{}reviews/preprints/{}/notifications'.format(settings.DOMAIN, provider._id),
-                is_reviews_moderator_notification=True,
-                is_admin=provider.get_group(ADMIN).user_set.filter(id=user.id).exists()
-            )
+    providers = {}
+    admin_ids = {}
+    for chunk in chunked(get_moderators_emails(send_type), DIGEST_CHUNK_SIZE):
+        users = load_by_guid(OSFUser, [group['user_id'] for group in chunk])
+        provider_ids = {group['provider_id'] for group in chunk} - set(providers)
+        providers.update(AbstractProvider.objects.in_bulk(provider_ids))
+        for provider_id in provider_ids:
+            admin_ids[provider_id] = set(providers[provider_id].get_group(ADMIN).user_set.values_list('id', flat=True))
+
+        mail_kwargs = []
+        mail_notification_ids = []
+        notification_ids = []
+        for group in chunk:
+            user = users[group['user_id']]
+            info = group['info']
+            ids = [message['_id'] for message in info]
+            if user.is_disabled:
+                notification_ids.extend(ids)
+            else:
+                mail_notification_ids.append(ids)
+                provider = providers[group['provider_id']]
+                mail_kwargs.append(dict(
+                    to_addr=user.username,
+                    mimetype='html',
+                    mail=mails.DIGEST_REVIEWS_MODERATORS,
+                    name=user.fullname,
+                    message=info,
+                    provider_name=provider.name,
+                    reviews_submissions_url='{}reviews/preprints/{}'.format(settings.DOMAIN, provider._id),
+                    notification_settings_url='{}reviews/preprints/{}/notifications'.format(settings.DOMAIN, provider._id),
+                    is_reviews_moderator_notification=True,
+                    is_admin=user.id in admin_ids[group['provider_id']],
+                ))
+        notification_ids.extend(sent_notification_ids(mail_notification_ids, send_mails(mail_kwargs)))
         remove_notifications(email_notification_ids=notification_ids)
 
 
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_by_guid(model, guids):
+    """Map of guid -> object for all objects of ``model`` with one of ``guids``, loaded in one query."""
+    return {obj._id: obj for obj in model.objects.filter(guids___id__in=guids)}
+
+
+def send_mail(kwargs):
+    """Send one mail, logging rather than raising any failure. Returns whether it was sent."""
+    try:
+        mails.send_mail(**kwargs)
+    except Exception:
+        log_exception()
+        return False
+    return True
+
+
+def send_mails(mail_kwargs):
+    """Render and send each mail in ``mail_kwargs`` concurrently. Returns whether each one
+    was sent, in order; a failed mail does not stop the others.
+    """
+    return Pool(DIGEST_SEND_POOL_SIZE).map(send_mail, mail_kwargs)
+
+
+def sent_notification_ids(mail_notification_ids, sent):
+    """The ids of the digests sent in the mails that went out, to be deleted. The digests of
+    failed mails are kept and sent in a later run.
+    """
+    return [_id for ids, was_sent in zip(mail_notification_ids, sent) if was_sent for _id in ids]
+
+
 def get_moderators_emails(send_type):
     """Get all emails for reviews moderators that need to be sent, grouped by users AND providers.
     :param send_type: from NOTIFICATION_TYPES, could be "email_digest" or "email_transactional"
@@ -116,9 +192,7 @@ def get_moderators_emails(send_type):
         ORDER BY osf_guid.id ASC
         """
 
-    with connection.cursor() as cursor:
-        cursor.execute(sql, [send_type, ])
-        return itertools.chain.from_iterable(cursor.fetchall())
+    return stream_rows(sql, [send_type, ])
 
 
 def get_users_emails(send_type):
@@ -163,9 +237,19 @@ def get_users_emails(send_type):
     ORDER BY osf_guid.id ASC
     """
 
-    with connection.cursor() as cursor:
-        cursor.execute(sql, [send_type, ])
-        return itertools.chain.from_iterable(cursor.fetchall())
+    return stream_rows(sql, [send_type, ])
+
+
+def stream_rows(sql, params):
+    """Yield the first column of each row of ``sql``, fetched from a server-side cursor in chunks."""
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(DIGEST_CHUNK_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
 
 
 def group_by_node(notifications, limit=15):
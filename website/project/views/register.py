@@ -259,8 +259,10 @@ def registration_callbacks(node, payload, *args, **kwargs):
         # for draft files and one for published files
         if src_provider == 'dataverse':
             src_provider += '-' + (payload['destination']['name'].split(' ')[-1].lstrip('(').rstrip(')').strip())
-        node.archive_job.update_target(
-            src_provider,
-            ARCHIVER_SUCCESS,
-        )
+        # Batched targets are archived once all of their copies have called back
+        if node.archive_job.record_copy(src_provider, payload['source'].get('path')):
+            node.archive_job.update_target(
+                src_provider,
+                ARCHIVER_SUCCESS,
+            )
     project_signals.archive_callback.send(node)
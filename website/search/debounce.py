@@ -0,0 +1,63 @@
+"""Coalesce bursts of search updates for the same object into a single celery task.
+
+The first update of an object schedules its task ``SEARCH_UPDATE_DEBOUNCE_WINDOW``
+seconds out and marks it pending in a shared cache. Updates that arrive while it is
+pending are dropped; the task clears the mark before loading the object, so it
+indexes the latest state, and any later update schedules a new task.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from flask import _app_ctx_stack as context_stack
+
+from api.base import instrumentation
+from api.base.api_globals import api_globals
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from website import settings
+
+logger = logging.getLogger(__name__)
+
+# Extra lifetime of a pending mark, in case its task is lost before it runs
+PENDING_GRACE_PERIOD = 60
+
+
+def search_update_cache():
+    return caches[django_settings.SEARCH_UPDATE_CACHE_NAME]
+
+
+def pending_key(task_name, args, kwargs):
+    raw = json.dumps([task_name, list(args), kwargs], sort_keys=True)
+    return 'search-update:{}'.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def schedule(task, obj_id, **kwargs):
+    """Apply ``task(obj_id, **kwargs)`` after the debounce window, unless one is already pending."""
+    window = settings.SEARCH_UPDATE_DEBOUNCE_WINDOW
+    if window:
+        key = pending_key(task.name, [obj_id], kwargs)
+        if not search_update_cache().add(key, True, timeout=window + PENDING_GRACE_PERIOD):
+            instrumentation.registry.increment('osf_search_updates_total', 'coalesced')
+            return
+    instrumentation.registry.increment('osf_search_updates_total', 'scheduled')
+    task.apply_async(args=(obj_id, ), kwargs=kwargs, countdown=window)
+
+
+def enqueue_debounced(task, obj_id, **kwargs):
+    """Debounced alternative to ``enqueue_task(task.s(obj_id, **kwargs))``.
+
+    Within a request the task is only scheduled once the request has committed, so
+    a failed request cannot leave a pending mark behind that swallows later updates.
+    """
+    if context_stack.top is None and getattr(api_globals, 'request', None) is None:
+        schedule(task, obj_id, **kwargs)
+    else:
+        enqueue_postcommit_task(schedule, (task, obj_id), kwargs, celery=False)
+
+
+def release(task):
+    """Clear the pending mark of the running ``task``. Call before loading the object."""
+    if settings.USE_CELERY and settings.SEARCH_UPDATE_DEBOUNCE_WINDOW:
+        search_update_cache().delete(pending_key(task.name, task.request.args or [], task.request.kwargs or {}))
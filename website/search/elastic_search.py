@@ -8,7 +8,11 @@ import functools
 import logging
 import math
 import re
+import threading
+import time
 import unicodedata
+from collections import defaultdict
+from contextlib import contextmanager
 from framework import sentry
 
 import six
@@ -16,7 +20,7 @@ import six
 from django.apps import apps
 from django.core.paginator import Paginator
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import F, Max, Q
 from elasticsearch2 import (ConnectionError, Elasticsearch, NotFoundError,
                            RequestError, TransportError, helpers)
 from framework.celery_tasks import app as celery_app
@@ -29,13 +33,13 @@ from osf.models import OSFGroup
 from osf.models import QuickFilesNode
 from osf.models import Preprint
 from osf.models import SpamStatus
-from addons.wiki.models import WikiPage
+from addons.wiki.models import WikiVersion
 from osf.models import CollectionSubmission
 from osf.utils.sanitize import unescape_entities
 from website import settings
 from website.filters import profile_image_url
 from osf.models.licenses import serialize_node_license_record
-from website.search import exceptions
+from website.search import debounce, exceptions
 from website.search.util import build_query, clean_splitters
 from website.views import validate_page_num
 
@@ -142,6 +146,75 @@ def requires_search(func):
     return wrapped
 
 
+_local = threading.local()
+
+
+class BulkIndexer(object):
+    """Buffers index and delete operations and sends them as ``_bulk`` requests,
+    once ``flush_size`` operations are queued or ``flush_interval`` seconds have
+    passed since the last flush, and when the buffer is closed.
+    """
+    def __init__(self, flush_size=None, flush_interval=None, refresh=False):
+        self.flush_size = flush_size or settings.ELASTIC_BULK_FLUSH_SIZE
+        self.flush_interval = flush_interval or settings.ELASTIC_BULK_FLUSH_INTERVAL
+        self.refresh = refresh
+        self.actions = []
+        self.last_flush = time.time()
+
+    def add(self, action):
+        self.actions.append(action)
+        if len(self.actions) >= self.flush_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        actions, self.actions = self.actions, []
+        self.last_flush = time.time()
+        if actions:
+            send_bulk_actions(actions, refresh=self.refresh)
+
+
+@requires_search
+def send_bulk_actions(actions, refresh=False):
+    _, errors = helpers.bulk(client(), actions, refresh=refresh, raise_on_error=False)
+    for error in errors:
+        # Deleting a document that was never indexed is fine
+        if error.get('delete', {}).get('status') != 404:
+            logger.error('Bulk search update failed: {}'.format(error))
+
+
+@contextmanager
+def bulk_indexing():
+    """Buffer every search write made inside the block into ``_bulk`` requests.
+
+    Nested blocks share the outermost buffer. When celery tasks run inline, the
+    final flush refreshes the index so the caller can read its own writes.
+    """
+    if getattr(_local, 'bulk_indexer', None) is not None:
+        yield _local.bulk_indexer
+        return
+    _local.bulk_indexer = BulkIndexer(refresh=not settings.USE_CELERY)
+    try:
+        yield _local.bulk_indexer
+        _local.bulk_indexer.flush()
+    finally:
+        _local.bulk_indexer = None
+
+
+def index_document(index, doc_type, doc_id, body):
+    indexer = getattr(_local, 'bulk_indexer', None)
+    if indexer is None:
+        client().index(index=index, doc_type=doc_type, id=doc_id, body=body, refresh=True)
+    else:
+        indexer.add({'_op_type': 'index', '_index': index, '_type': doc_type, '_id': doc_id, '_source': body})
+
+
+def delete_document(index, doc_type, doc_id):
+    indexer = getattr(_local, 'bulk_indexer', None)
+    if indexer is None:
+        client().delete(index=index, doc_type=doc_type, id=doc_id, refresh=True, ignore=[404])
+    else:
+        indexer.add({'_op_type': 'delete', '_index': index, '_type': doc_type, '_id': doc_id})
+
 @requires_search
 def get_aggregations(query, doc_type):
     query['aggregations'] = {
@@ -356,43 +429,123 @@ def get_doctype_from_node(node):
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
 def update_node_async(self, node_id, index=None, bulk=False):
+    debounce.release(self)
     AbstractNode = apps.get_model('osf.AbstractNode')
     node = AbstractNode.load(node_id)
     try:
-        update_node(node=node, index=index, bulk=bulk, async_update=True)
+        with bulk_indexing():
+            update_node(node=node, index=index, bulk=bulk, async_update=True)
     except Exception as exc:
         self.retry(exc=exc)
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
 def update_preprint_async(self, preprint_id, index=None, bulk=False):
+    debounce.release(self)
     Preprint = apps.get_model('osf.Preprint')
     preprint = Preprint.load(preprint_id)
     try:
-        update_preprint(preprint=preprint, index=index, bulk=bulk, async_update=True)
+        with bulk_indexing():
+            update_preprint(preprint=preprint, index=index, bulk=bulk, async_update=True)
     except Exception as exc:
         self.retry(exc=exc)
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
 def update_group_async(self, group_id, index=None, bulk=False, deleted_id=None):
+    debounce.release(self)
     OSFGroup = apps.get_model('osf.OSFGroup')
     group = OSFGroup.load(group_id)
     try:
-        update_group(group=group, index=index, bulk=bulk, async_update=True, deleted_id=deleted_id)
+        with bulk_indexing():
+            update_group(group=group, index=index, bulk=bulk, async_update=True, deleted_id=deleted_id)
     except Exception as exc:
         self.retry(exc=exc)
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
 def update_user_async(self, user_id, index=None):
+    debounce.release(self)
     OSFUser = apps.get_model('osf.OSFUser')
     user = OSFUser.objects.get(id=user_id)
     try:
-        update_user(user, index)
+        with bulk_indexing():
+            update_user(user, index)
     except Exception as exc:
         self.retry(exc)
 
-def serialize_node(node, category):
+class NodeSearchPrefetch(object):
+    """The related rows ``serialize_node`` needs, loaded for many nodes at once
+    with a fixed number of queries instead of several queries per node.
+    """
+    def __init__(self, nodes):
+        Contributor = apps.get_model('osf.Contributor')
+        NodeGroupObjectPermission = apps.get_model('osf.NodeGroupObjectPermission')
+        NodeLicenseRecord = apps.get_model('osf.NodeLicenseRecord')
+        NodeRelation = apps.get_model('osf.NodeRelation')
+        OSFGroupGroupObjectPermission = apps.get_model('osf.OSFGroupGroupObjectPermission')
+        ids = [node.id for node in nodes]
+
+        self.contributors = defaultdict(list)
+        contributors = (
+            Contributor.objects.filter(node_id__in=ids, visible=True)
+            .order_by('node_id', '_order')
+            .values('node_id', 'user__fullname', 'user__guids___id', 'user__is_active')
+        )
+        for x in contributors:
+            self.contributors[x['node_id']].append({
+                'fullname': x['user__fullname'],
+                'url': '/{}/'.format(x['user__guids___id']) if x['user__is_active'] else None
+            })
+
+        member_groups = defaultdict(set)
+        for node_id, group_id in NodeGroupObjectPermission.objects.filter(
+                content_object_id__in=ids, group__name__icontains='osfgroup').values_list('content_object_id', 'group_id'):
+            member_groups[group_id].add(node_id)
+        self.groups = defaultdict(dict)
+        for group_id, name, _id in OSFGroupGroupObjectPermission.objects.filter(
+                group_id__in=list(member_groups)).values_list('group_id', 'content_object__name', 'content_object___id'):
+            for node_id in member_groups[group_id]:
+                self.groups[node_id][_id] = {'name': name, 'url': '/{}/'.format(_id)}
+
+        self.tags = defaultdict(list)
+        for node_id, name, system in AbstractNode.tags.through.objects.filter(
+                abstractnode_id__in=ids).values_list('abstractnode_id', 'tag__name', 'tag__system'):
+            self.tags[node_id].append((name, system))
+
+        self.institutions = defaultdict(list)
+        for node_id, name in AbstractNode.affiliated_institutions.through.objects.filter(
+                abstractnode_id__in=ids).values_list('abstractnode_id', 'institution__name'):
+            self.institutions[node_id].append(name)
+
+        self.parent_ids = dict(
+            NodeRelation.objects.filter(child_id__in=ids, is_node_link=False).values_list('child_id', 'parent__guids___id')
+        )
+
+        self.licenses = NodeLicenseRecord.objects.select_related('node_license').in_bulk(
+            [node.node_license_id for node in nodes if node.node_license_id]
+        )
+
+        self.wikis = defaultdict(list)
+        latest_versions = (
+            WikiVersion.objects.annotate(newest_version=Max('wiki_page__versions__identifier'))
+            .filter(identifier=F('newest_version'), wiki_page__node_id__in=ids, wiki_page__deleted__isnull=True)
+            .select_related('wiki_page')
+        )
+        for wiki in latest_versions:
+            self.wikis[wiki.wiki_page.node_id].append(wiki)
+
+    def get_tag_names(self, node, include_system=True):
+        return [name for name, system in self.tags[node.id] if include_system or not system]
+
+    def get_license(self, node):
+        if node.node_license_id:
+            return self.licenses.get(node.node_license_id)
+        # Inherited from a parent
+        return node.license
+
+
+def serialize_node(node, category, prefetched=None):
+    prefetched = prefetched or NodeSearchPrefetch([node])
     elastic_document = {}
-    parent_id = node.parent_id
+    parent_id = prefetched.parent_ids.get(node.id)
 
     try:
         normalized_title = six.u(node.title)
@@ -401,26 +554,13 @@ def serialize_node(node, category):
     normalized_title = unicodedata.normalize('NFKD', normalized_title).encode('ascii', 'ignore').decode()
     elastic_document = {
         'id': node._id,
-        'contributors': [
-            {
-                'fullname': x['fullname'],
-                'url': '/{}/'.format(x['guids___id']) if x['is_active'] else None
-            }
-            for x in node._contributors.filter(contributor__visible=True).order_by('contributor___order')
-            .values('fullname', 'guids___id', 'is_active')
-        ],
-        'groups': [
-            {
-                'name': x['name'],
-                'url': '/{}/'.format(x['_id'])
-            }
-            for x in node.osf_groups.values('name', '_id')
-        ],
+        'contributors': prefetched.contributors[node.id],
+        'groups': list(prefetched.groups[node.id].values()),
         'title': node.title,
         'normalized_title': normalized_title,
         'category': category,
         'public': node.is_public,
-        'tags': list(node.tags.filter(system=False).values_list('name', flat=True)),
+        'tags': prefetched.get_tag_names(node, include_system=False),
         'description': node.description,
         'url': node.url,
         'is_registration': node.is_registration,
@@ -433,13 +573,13 @@ def serialize_node(node, category):
         'wikis': {},
         'parent_id': parent_id,
         'date_created': node.created,
-        'license': serialize_node_license_record(node.license),
-        'affiliated_institutions': list(node.affiliated_institutions.values_list('name', flat=True)),
+        'license': serialize_node_license_record(prefetched.get_license(node)),
+        'affiliated_institutions': prefetched.institutions[node.id],
         'boost': int(not node.is_registration) + 1,  # This is for making registered projects less relevant
         'extra_search_terms': clean_splitters(node.title),
     }
     if not node.is_retracted:
-        for wiki in WikiPage.objects.get_wiki_pages_latest(node):
+        for wiki in prefetched.wikis[node.id]:
             # '.' is not allowed in field names in ES2
             elastic_document['wikis'][wiki.wiki_page.page_name.replace('.', ' ')] = wiki.raw_text(node)
 
@@ -516,22 +656,23 @@ def serialize_group(group, category):
     return elastic_document
 
 @requires_search
-def update_node(node, index=None, bulk=False, async_update=False):
+def update_node(node, index=None, bulk=False, async_update=False, prefetched=None):
     from addons.osfstorage.models import OsfStorageFile
     index = index or INDEX
+    prefetched = prefetched or NodeSearchPrefetch([node])
     for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(node)), target_object_id=node.id)):
         update_file(file_, index=index)
 
-    is_qa_node = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(node.tags.all().values_list('name', flat=True))) or any(substring in node.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
+    is_qa_node = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(prefetched.get_tag_names(node))) or any(substring in node.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
     if node.is_deleted or not node.is_public or node.archiving or node.is_spam or (node.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or node.is_quickfiles or is_qa_node:
         delete_doc(node._id, node, index=index)
     else:
         category = get_doctype_from_node(node)
-        elastic_document = serialize_node(node, category)
+        elastic_document = serialize_node(node, category, prefetched=prefetched)
         if bulk:
             return elastic_document
         else:
-            client().index(index=index, doc_type=category, id=node._id, body=elastic_document, refresh=True)
+            index_document(index, category, node._id, elastic_document)
 
 @requires_search
 def update_preprint(preprint, index=None, bulk=False, async_update=False):
@@ -549,7 +690,7 @@ def update_preprint(preprint, index=None, bulk=False, async_update=False):
         if bulk:
             return elastic_document
         else:
-            client().index(index=index, doc_type=category, id=preprint._id, body=elastic_document, refresh=True)
+            index_document(index, category, preprint._id, elastic_document)
 
 @requires_search
 def update_group(group, index=None, bulk=False, async_update=False, deleted_id=None):
@@ -563,7 +704,7 @@ def update_group(group, index=None, bulk=False, async_update=False, deleted_id=N
         if bulk:
             return elastic_document
         else:
-            client().index(index=index, doc_type=category, id=group._id, body=elastic_document, refresh=True)
+            index_document(index, category, group._id, elastic_document)
 
 def bulk_update_nodes(serialize, nodes, index=None, category=None):
     """Updates the list of input projects
@@ -575,8 +716,9 @@ def bulk_update_nodes(serialize, nodes, index=None, category=None):
     """
     index = index or INDEX
     actions = []
-    for node in nodes:
-        serialized = serialize(node)
+    with bulk_indexing():  # deletes and file updates made while serializing
+        serialized_nodes = [(node, serialize(node)) for node in nodes]
+    for node, serialized in serialized_nodes:
         if serialized:
             actions.append({
                 '_op_type': 'update',
@@ -654,6 +796,7 @@ bulk_update_contributors = functools.partial(bulk_update_nodes, serialize_contri
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
 def update_contributors_async(self, user_id):
+    debounce.release(self)
     OSFUser = apps.get_model('osf.OSFUser')
     user = OSFUser.objects.get(id=user_id)
     # If search updated so group member names are displayed on project search results,
@@ -668,18 +811,12 @@ def update_user(user, index=None):
     index = index or INDEX
     if not user.is_active:
         try:
-            client().delete(index=index, doc_type='user', id=user._id, refresh=True, ignore=[404])
+            delete_document(index, 'user', user._id)
             # update files in their quickfiles node if the user has been marked as spam
             if user.spam_status == SpamStatus.SPAM:
                 quickfiles = QuickFilesNode.objects.get_for_user(user)
                 for quickfile_id in quickfiles.files.values_list('_id', flat=True):
-                    client().delete(
-                        index=index,
-                        doc_type='file',
-                        id=quickfile_id,
-                        refresh=True,
-                        ignore=[404]
-                    )
+                    delete_document(index, 'file', quickfile_id)
         except NotFoundError:
             pass
         return
@@ -718,7 +855,7 @@ def update_user(user, index=None):
         'boost': 2,  # TODO(fabianvf): Probably should make this a constant or something
     }
 
-    client().index(index=index, doc_type='user', body=user_doc, id=user._id, refresh=True)
+    index_document(index, 'user', user._id, user_doc)
 
 @requires_search
 def update_file(file_, index=None, delete=False):
@@ -733,25 +870,13 @@ def update_file(file_, index=None, delete=False):
     ) or any(substring in target.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
     if not file_.name or not target.is_public or delete or file_node_is_qa or getattr(target, 'is_deleted', False) or getattr(target, 'archiving', False) or target.is_spam or (
             target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-        client().delete(
-            index=index,
-            doc_type='file',
-            id=file_._id,
-            refresh=True,
-            ignore=[404]
-        )
+        delete_document(index, 'file', file_._id)
         return
 
     if isinstance(target, Preprint):
         if not getattr(target, 'verified_publishable', False) or target.primary_file != file_ or target.is_spam or (
                 target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-            client().delete(
-                index=index,
-                doc_type='file',
-                id=file_._id,
-                refresh=True,
-                ignore=[404]
-            )
+            delete_document(index, 'file', file_._id)
             return
 
     # We build URLs manually here so that this function can be
@@ -787,20 +912,14 @@ def update_file(file_, index=None, delete=False):
         'extra_search_terms': clean_splitters(file_.name),
     }
 
-    client().index(
-        index=index,
-        doc_type='file',
-        body=file_doc,
-        id=file_._id,
-        refresh=True
-    )
+    index_document(index, 'file', file_._id, file_doc)
 
 @requires_search
 def update_institution(institution, index=None):
     index = index or INDEX
     id_ = institution._id
     if institution.is_deleted:
-        client().delete(index=index, doc_type='institution', id=id_, refresh=True, ignore=[404])
+        delete_document(index, 'institution', id_)
     else:
         institution_doc = {
             'id': id_,
@@ -810,11 +929,12 @@ def update_institution(institution, index=None):
             'name': institution.name,
         }
 
-        client().index(index=index, doc_type='institution', body=institution_doc, id=id_, refresh=True)
+        index_document(index, 'institution', id_, institution_doc)
 
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
 def update_cgm_async(self, cgm_id, collection_id=None, op='update', index=None):
+    debounce.release(self)
     CollectionSubmission = apps.get_model('osf.CollectionSubmission')
     if collection_id:
         try:
@@ -830,7 +950,8 @@ def update_cgm_async(self, cgm_id, collection_id=None, op='update', index=None):
         else:
             if cgm and hasattr(cgm.guid.referent, 'is_public') and cgm.guid.referent.is_public:
                 try:
-                    update_cgm(cgm, op=op, index=index)
+                    with bulk_indexing():
+                        update_cgm(cgm, op=op, index=index)
                 except Exception as exc:
                     self.retry(exc=exc)
     else:
@@ -840,20 +961,21 @@ def update_cgm_async(self, cgm_id, collection_id=None, op='update', index=None):
             collection__deleted__isnull=True,
             collection__is_bookmark_collection=False)
 
-        for cgm in cgms:
-            try:
-                update_cgm(cgm, op=op, index=index)
-            except Exception as exc:
-                self.retry(exc=exc)
+        try:
+            with bulk_indexing():
+                for cgm in cgms:
+                    update_cgm(cgm, op=op, index=index)
+        except Exception as exc:
+            self.retry(exc=exc)
 
 @requires_search
 def update_cgm(cgm, op='update', index=None):
     index = index or INDEX
     if op == 'delete':
-        client().delete(index=index, doc_type='collectionSubmission', id=cgm._id, refresh=True, ignore=[404])
+        delete_document(index, 'collectionSubmission', cgm._id)
         return
     collection_submission_doc = serialize_cgm(cgm)
-    client().index(index=index, doc_type='collectionSubmission', body=collection_submission_doc, id=cgm._id, refresh=True)
+    index_document(index, 'collectionSubmission', cgm._id, collection_submission_doc)
 
 @requires_search
 def delete_all():
@@ -943,12 +1065,12 @@ def delete_doc(elastic_document_id, node, index=None, category=None):
             category = 'registration'
         else:
             category = node.project_or_component
-    client().delete(index=index, doc_type=category, id=elastic_document_id, refresh=True, ignore=[404])
+    delete_document(index, category, elastic_document_id)
 
 @requires_search
 def delete_group_doc(deleted_id, index=None):
     index = index or INDEX
-    client().delete(index=index, doc_type='group', id=deleted_id, refresh=True, ignore=[404])
+    delete_document(index, 'group', deleted_id)
 
 @requires_search
 def search_contributor(query, page=0, size=10, exclude=None, current_user=None):
@@ -1,8 +1,7 @@
 import logging
 
-from framework.celery_tasks.handlers import enqueue_task
-
 from website import settings
+from website.search.debounce import enqueue_debounced
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +24,7 @@ def search(query, index=None, doc_type=None, raw=None):
     return search_engine.search(query, index=index, doc_type=doc_type, raw=raw)
 
 @requires_search
-def update_node(node, index=None, bulk=False, async_update=True, saved_fields=None):
+def update_node(node, index=None, bulk=False, async_update=True, saved_fields=None, prefetched=None):
     kwargs = {
         'index': index,
         'bulk': bulk
@@ -37,12 +36,19 @@ def update_node(node, index=None, bulk=False, async_update=True, saved_fields=No
         # database in order for method that updates the Node's elastic search document
         # to run correctly.
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_node_async.s(node_id=node_id, **kwargs))
+            enqueue_debounced(search_engine.update_node_async, node_id, **kwargs)
         else:
             search_engine.update_node_async(node_id=node_id, **kwargs)
     else:
         index = index or settings.ELASTIC_INDEX
-        return search_engine.update_node(node, **kwargs)
+        return search_engine.update_node(node, prefetched=prefetched, **kwargs)
+
+@requires_search
+def prefetch_nodes(nodes):
+    """Load what the search serializer needs for all of ``nodes`` up front. Pass the
+    result to ``update_node`` as ``prefetched``.
+    """
+    return search_engine.NodeSearchPrefetch(nodes)
 
 @requires_search
 def update_preprint(preprint, index=None, bulk=False, async_update=True, saved_fields=None):
@@ -54,7 +60,7 @@ def update_preprint(preprint, index=None, bulk=False, async_update=True, saved_f
         preprint_id = preprint._id
         # We need the transaction to be committed before trying to run celery tasks.
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_preprint_async.s(preprint_id=preprint_id, **kwargs))
+            enqueue_debounced(search_engine.update_preprint_async, preprint_id, **kwargs)
         else:
             search_engine.update_preprint_async(preprint_id=preprint_id, **kwargs)
     else:
@@ -71,7 +77,7 @@ def update_group(group, index=None, bulk=False, async_update=True, saved_fields=
     if async_update:
         # We need the transaction to be committed before trying to run celery tasks.
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_group_async.s(group_id=group._id, **kwargs))
+            enqueue_debounced(search_engine.update_group_async, group._id, **kwargs)
         else:
             search_engine.update_group_async(group_id=group._id, **kwargs)
     else:
@@ -95,7 +101,7 @@ def delete_node(node, index=None):
 def update_contributors_async(user_id):
     """Async version of update_contributors above"""
     if settings.USE_CELERY:
-        enqueue_task(search_engine.update_contributors_async.s(user_id))
+        enqueue_debounced(search_engine.update_contributors_async, user_id)
     else:
         search_engine.update_contributors_async(user_id)
 
@@ -105,7 +111,7 @@ def update_user(user, index=None, async_update=True):
     if async_update:
         user_id = user.id
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_user_async.s(user_id, index=index))
+            enqueue_debounced(search_engine.update_user_async, user_id, index=index)
         else:
             search_engine.update_user_async(user_id, index=index)
     else:
@@ -126,7 +132,7 @@ def update_collected_metadata(cgm_id, collection_id=None, index=None, op='update
     index = index or settings.ELASTIC_INDEX
 
     if settings.USE_CELERY:
-        enqueue_task(search_engine.update_cgm_async.s(cgm_id, collection_id=collection_id, op=op, index=index))
+        enqueue_debounced(search_engine.update_cgm_async, cgm_id, collection_id=collection_id, op=op, index=index)
     else:
         search_engine.update_cgm_async(cgm_id, collection_id=collection_id, op=op, index=index)
 
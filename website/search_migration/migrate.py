@@ -2,15 +2,20 @@
 # -*- coding: utf-8 -*-
 """Migration script for Search-enabled Models."""
 from __future__ import absolute_import
-from math import ceil
+from collections import defaultdict
 import functools
+import itertools
+import json
 import logging
+import multiprocessing
+import os
+import time
 
-from django.db import connection
-from django.core.paginator import Paginator
+from django.db import connection, connections
 from elasticsearch2 import helpers
 
 import website.search.search as search
+from website.search import elastic_search
 from website.search.elastic_search import client
 from website.search_migration import (
     JSON_UPDATE_NODES_SQL, JSON_DELETE_NODES_SQL,
@@ -27,13 +32,19 @@ from website.search.search import update_institution, bulk_update_collected_meta
 
 logger = logging.getLogger(__name__)
 
-def sql_migrate(index, sql, max_id, increment, es_args=None, **kwargs):
-    """ Run provided SQL and send output to elastic.
+# Objects sent to elastic per `helpers.bulk` call by the queryset-based doctypes
+BATCH_SIZE = 100
+
+# Order in which doctypes are migrated; see `DOCTYPES`
+DOCTYPE_ORDER = ('nodes', 'files', 'users', 'preprints', 'preprint_files', 'collection_submissions', 'groups')
+
+def sql_migrate(index, sql, page_start, page_end, es_args=None, **kwargs):
+    """ Run provided SQL for a range of ids and send output to elastic.
 
     :param str index: Elastic index to update (formatted into `sql`)
     :param str sql: SQL to format and run. See __init__.py in this module
-    :param int max_id: Last known object id. Indicates when to stop paging
-    :param int increment: Page size
+    :param int page_start: Exclusive lower id bound
+    :param int page_end: Inclusive upper id bound
     :param  dict es_args:  Dict or None, to pass to `helpers.bulk`
     :kwargs: Additional format arguments for `sql` arg
 
@@ -41,133 +52,105 @@ def sql_migrate(index, sql, max_id, increment, es_args=None, **kwargs):
     """
     if es_args is None:
         es_args = {}
-    total_pages = int(ceil(max_id / float(increment)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(
+            index=index,
+            page_start=page_start,
+            page_end=page_end,
+            **kwargs))
+        ser_objs = cursor.fetchone()[0]
+    if not ser_objs:
+        return 0
+    helpers.bulk(client(), ser_objs, **es_args)
+    return len(ser_objs)
+
+def queryset_migrate(queryset, update, index, page_start, page_end):
+    """ Stream a range of `queryset` with a server-side cursor and pass it to `update` in batches.
+
+    :return int: Number of migrated objects
+    """
+    objs = queryset.filter(id__gt=page_start, id__lte=page_end).order_by('id').iterator()
     total_objs = 0
-    page_start = 0
-    page_end = 0
-    page = 0
-    while page_end <= (max_id + increment):
-        page += 1
-        page_end += increment
-        if page <= total_pages:
-            logger.info('Updating page {} / {}'.format(page_end / increment, total_pages))
-        else:
-            # An extra page is included to cover the edge case where:
-            #       max_id == (total_pages * increment) - 1
-            # and two additional objects are created during runtime.
-            logger.info('Cleaning up...')
-        with connection.cursor() as cursor:
-            cursor.execute(sql.format(
-                index=index,
-                page_start=page_start,
-                page_end=page_end,
-                **kwargs))
-            ser_objs = cursor.fetchone()[0]
-            if ser_objs:
-                total_objs += len(ser_objs)
-                helpers.bulk(client(), ser_objs, **es_args)
-        page_start = page_end
-    return total_objs
-
-def migrate_nodes(index, delete, increment=10000):
-    logger.info('Migrating nodes to index: {}'.format(index))
-    max_nid = AbstractNode.objects.last().id
+    while True:
+        batch = list(itertools.islice(objs, BATCH_SIZE))
+        if not batch:
+            return total_objs
+        update(batch, index=index)
+        total_objs += len(batch)
+
+def migrate_nodes(index, delete, page_start, page_end):
     total_nodes = sql_migrate(
         index,
         JSON_UPDATE_NODES_SQL,
-        max_nid,
-        increment,
+        page_start,
+        page_end,
         spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
-    logger.info('{} nodes migrated'.format(total_nodes))
     if delete:
-        logger.info('Preparing to delete old node documents')
-        max_nid = AbstractNode.objects.last().id
-        total_nodes = sql_migrate(
+        sql_migrate(
             index,
             JSON_DELETE_NODES_SQL,
-            max_nid,
-            increment,
+            page_start,
+            page_end,
             es_args={'raise_on_error': False},  # ignore 404s
             spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
-        logger.info('{} nodes marked deleted'.format(total_nodes))
-
-def migrate_preprints(index, delete):
-    logger.info('Migrating preprints to index: {}'.format(index))
-    preprints = Preprint.objects.all()
-    increment = 100
-    paginator = Paginator(preprints, increment)
-    for page_number in paginator.page_range:
-        logger.info('Updating page {} / {}'.format(page_number, paginator.num_pages))
-        Preprint.bulk_update_search(paginator.page(page_number).object_list, index=index)
-
-def migrate_preprint_files(index, delete):
-    logger.info('Migrating preprint files to index: {}'.format(index))
-    valid_preprints = Preprint.objects.all()
-    valid_preprint_files = BaseFileNode.objects.filter(preprint__in=valid_preprints)
-    paginator = Paginator(valid_preprint_files, 500)
-    serialize = functools.partial(search.update_file, index=index)
-    for page_number in paginator.page_range:
-        logger.info('Updating page {} / {}'.format(page_number, paginator.num_pages))
-        search.bulk_update_nodes(serialize, paginator.page(page_number).object_list, index=index, category='file')
-
-def migrate_groups(index, delete):
-    logger.info('Migrating groups to index: {}'.format(index))
-    groups = OSFGroup.objects.all()
-    increment = 100
-    paginator = Paginator(groups, increment)
-    for page_number in paginator.page_range:
-        logger.info('Updating page {} / {}'.format(page_number, paginator.num_pages))
-        OSFGroup.bulk_update_search(paginator.page(page_number).object_list, index=index)
-
-def migrate_files(index, delete, increment=10000):
-    logger.info('Migrating files to index: {}'.format(index))
-    max_fid = BaseFileNode.objects.last().id
+    return total_nodes
+
+def migrate_files(index, delete, page_start, page_end):
     total_files = sql_migrate(
         index,
         JSON_UPDATE_FILES_SQL,
-        max_fid,
-        increment,
+        page_start,
+        page_end,
         spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
-    logger.info('{} files migrated'.format(total_files))
     if delete:
-        logger.info('Preparing to delete old file documents')
-        max_fid = BaseFileNode.objects.last().id
-        total_files = sql_migrate(
+        sql_migrate(
             index,
             JSON_DELETE_FILES_SQL,
-            max_fid,
-            increment,
+            page_start,
+            page_end,
             es_args={'raise_on_error': False},  # ignore 404s
             spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
-        logger.info('{} files marked deleted'.format(total_files))
+    return total_files
 
-def migrate_users(index, delete, increment=10000):
-    logger.info('Migrating users to index: {}'.format(index))
-    max_uid = OSFUser.objects.last().id
+def migrate_users(index, delete, page_start, page_end):
     total_users = sql_migrate(
         index,
         JSON_UPDATE_USERS_SQL,
-        max_uid,
-        increment)
-    logger.info('{} users migrated'.format(total_users))
+        page_start,
+        page_end)
     if delete:
-        logger.info('Preparing to delete old user documents')
-        max_uid = OSFUser.objects.last().id
-        total_users = sql_migrate(
+        sql_migrate(
             index,
             JSON_DELETE_USERS_SQL,
-            max_uid,
-            increment,
+            page_start,
+            page_end,
             es_args={'raise_on_error': False})  # ignore 404s
-        logger.info('{} users marked deleted'.format(total_users))
+    return total_users
+
+def migrate_preprints(index, delete, page_start, page_end):
+    return queryset_migrate(Preprint.objects.all(), Preprint.bulk_update_search, index, page_start, page_end)
+
+def migrate_preprint_files(index, delete, page_start, page_end):
+    valid_preprint_files = BaseFileNode.objects.filter(preprint__in=Preprint.objects.all())
+    serialize = functools.partial(search.update_file, index=index)
+    update = functools.partial(search.bulk_update_nodes, serialize, category='file')
+    return queryset_migrate(valid_preprint_files, update, index, page_start, page_end)
+
+def migrate_collected_metadata(index, delete, page_start, page_end):
+    return queryset_migrate(collected_metadata(), bulk_update_collected_metadata, index, page_start, page_end)
 
-def migrate_collected_metadata(index, delete):
-    cgms = CollectionSubmission.objects.filter(
+def migrate_groups(index, delete, page_start, page_end):
+    return queryset_migrate(OSFGroup.objects.all(), OSFGroup.bulk_update_search, index, page_start, page_end)
+
+def collected_metadata():
+    return CollectionSubmission.objects.filter(
         collection__provider__isnull=False,
         collection__is_public=True,
         collection__deleted__isnull=True,
         collection__is_bookmark_collection=False)
 
+def clear_collected_metadata(index):
+    """Delete every collection submission document from `index` before they are re-added."""
     docs = helpers.scan(es_client(), query={
         'query': {'match': {'_type': 'collectionSubmission'}}
     }, index=index)
@@ -183,20 +166,116 @@ def migrate_collected_metadata(index, delete):
 
     bulk_update_cgm(None, actions=actions, op='delete', index=index)
 
-    bulk_update_collected_metadata(cgms, index=index)
-    logger.info('{} collection submissions migrated'.format(cgms.count()))
+# doctype -> (model whose ids are partitioned, function migrating one id range, default range size)
+DOCTYPES = {
+    'nodes': (AbstractNode, migrate_nodes, 10000),
+    'files': (BaseFileNode, migrate_files, 10000),
+    'users': (OSFUser, migrate_users, 10000),
+    'preprints': (Preprint, migrate_preprints, 1000),
+    'preprint_files': (BaseFileNode, migrate_preprint_files, 10000),
+    'collection_submissions': (CollectionSubmission, migrate_collected_metadata, 1000),
+    'groups': (OSFGroup, migrate_groups, 1000),
+}
+
+def partition(max_id, chunk_size):
+    """ Split the ids up to `max_id` into (page_start, page_end] ranges of `chunk_size`.
+
+    An extra range is included to cover objects created while the migration runs.
+    """
+    return [(page_start, page_start + chunk_size) for page_start in range(0, max_id + chunk_size, chunk_size)]
+
+def migrate_range(args):
+    """Migrate one id range of a doctype. Runs in the pool's worker processes."""
+    doctype, index, delete, page_start, page_end = args
+    _, migrate_func, _ = DOCTYPES[doctype]
+    return doctype, page_start, page_end, migrate_func(index, delete, page_start, page_end)
+
+def init_worker():
+    # Forked workers must not share the parent's database or elastic connections
+    connections.close_all()
+    elastic_search.CLIENT = None
+
+
+class Checkpoint(object):
+    """ Progress of a migration, saved as JSON after every finished range so an
+    interrupted run can resume into the same new index.
+    """
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index
+        self.new_index = None
+        self.completed = defaultdict(set)
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                data = json.load(fp)
+            if data['index'] == index:
+                self.new_index = data['new_index']
+                for doctype, ranges in data['completed'].items():
+                    self.completed[doctype] = set(tuple(r) for r in ranges)
+
+    def is_complete(self, doctype, page_range):
+        return tuple(page_range) in self.completed[doctype]
+
+    def complete(self, doctype, page_range):
+        self.completed[doctype].add(tuple(page_range))
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as fp:
+            json.dump({
+                'index': self.index,
+                'new_index': self.new_index,
+                'completed': {doctype: sorted(ranges) for doctype, ranges in self.completed.items()},
+            }, fp)
+        os.rename(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def migrate_doctype(doctype, index, delete, checkpoint, pool=None, chunk_size=None):
+    """ Migrate every pending id range of `doctype`, across `pool` if given.
+
+    :return tuple: (number of migrated objects, seconds taken)
+    """
+    model, _, default_chunk_size = DOCTYPES[doctype]
+    last = model.objects.order_by('id').last()
+    ranges = [
+        page_range for page_range in partition(last.id if last else 0, chunk_size or default_chunk_size)
+        if not checkpoint.is_complete(doctype, page_range)
+    ]
+    logger.info('Migrating {} {} ranges to index: {}'.format(len(ranges), doctype, index))
+    tasks = [(doctype, index, delete, page_start, page_end) for page_start, page_end in ranges]
+    start = time.time()
+    # Lazily, so that each range is checkpointed as soon as it is migrated
+    results = pool.imap_unordered(migrate_range, tasks) if pool else (migrate_range(task) for task in tasks)
+
+    total_objs = 0
+    for done, (_, page_start, page_end, count) in enumerate(results, 1):
+        checkpoint.complete(doctype, (page_start, page_end))
+        total_objs += count
+        logger.info('Updated {} range {} / {}'.format(doctype, done, len(ranges)))
+    return total_objs, time.time() - start
 
 def migrate_institutions(index):
     for inst in Institution.objects.filter(is_deleted=False):
         update_institution(inst, index)
 
-def migrate(delete, remove=False, index=None, app=None):
+def migrate(delete, remove=False, index=None, app=None, workers=1, chunk_size=None, checkpoint_path=None):
     """Reindexes relevant documents in ES
 
     :param bool delete: Delete documents that should not be indexed
     :param bool remove: Removes old index after migrating
     :param str index: index alias to version and migrate
     :param App app: Flask app for context
+    :param int workers: Number of processes migrating id ranges in parallel
+    :param int chunk_size: Ids per range, overriding each doctype's default
+    :param str checkpoint_path: File to record progress in. A run interrupted
+        before the alias swap resumes from it into the same new index.
     """
     index = index or settings.ELASTIC_INDEX
     app = app or init_app('website.settings', set_backends=True, routes=True)
@@ -208,19 +287,39 @@ def migrate(delete, remove=False, index=None, app=None):
     ctx = app.test_request_context()
     ctx.push()
 
-    new_index = set_up_index(index)
+    checkpoint = Checkpoint(checkpoint_path, index)
+    if checkpoint.new_index:
+        logger.info('Resuming migration into {}'.format(checkpoint.new_index))
+    else:
+        checkpoint.new_index = set_up_index(index)
+        checkpoint.save()
+    new_index = checkpoint.new_index
 
     if settings.ENABLE_INSTITUTIONS:
         migrate_institutions(new_index)
-    migrate_nodes(new_index, delete=delete)
-    migrate_files(new_index, delete=delete)
-    migrate_users(new_index, delete=delete)
-    migrate_preprints(new_index, delete=delete)
-    migrate_preprint_files(new_index, delete=delete)
-    migrate_collected_metadata(new_index, delete=delete)
-    migrate_groups(new_index, delete=delete)
+    if not checkpoint.completed['collection_submissions']:
+        clear_collected_metadata(new_index)
+
+    pool = None
+    if workers > 1:
+        connections.close_all()
+        pool = multiprocessing.Pool(workers, initializer=init_worker)
+    try:
+        stats = [
+            (doctype, migrate_doctype(doctype, new_index, delete, checkpoint, pool=pool, chunk_size=chunk_size))
+            for doctype in DOCTYPE_ORDER
+        ]
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for doctype, (total_objs, seconds) in stats:
+        logger.info('{}: {} migrated in {:.1f}s ({:.1f} docs/sec)'.format(
+            doctype, total_objs, seconds, total_objs / seconds if seconds else 0))
 
     set_up_alias(index, new_index)
+    checkpoint.clear()
 
     if remove:
         remove_old_index(new_index)
@@ -112,6 +112,18 @@ ELASTIC_KWARGS = {
     # 'client_cert': None,
     # 'client_key': None
 }
+# Index/delete operations issued inside search celery tasks are buffered and sent
+# as _bulk requests once this many are queued, or this many seconds have passed
+ELASTIC_BULK_FLUSH_SIZE = 500
+ELASTIC_BULK_FLUSH_INTERVAL = 5
+# Seconds during which repeated search updates of the same object are coalesced
+# into a single celery task. 0 disables debouncing.
+SEARCH_UPDATE_DEBOUNCE_WINDOW = 10
+
+# Download and view hits added to PageCounters per transaction by the flush task
+PAGE_COUNTER_FLUSH_BATCH_SIZE = 10000
+# User actions added to UserActivityCounters per transaction by the flush task
+USER_ACTIVITY_FLUSH_BATCH_SIZE = 10000
 
 # Sessions
 COOKIE_NAME = 'osf'
@@ -123,6 +135,9 @@ OSF_SESSION_TIMEOUT = 30 * 24 * 60 * 60  # 30 days in seconds
 SECRET_KEY = 'CHANGEME'
 SESSION_COOKIE_SECURE = SECURE_MODE
 SESSION_COOKIE_HTTPONLY = True
+# Pages remembered per session, ever and on the current day, to count unique downloads and views.
+# Each takes 4 bytes; once full, the pages visited longest ago are forgotten.
+SESSION_VISITED_PAGES_MAX = 1000
 
 # local path to private key and cert for local development using https, overwrite in local.py
 OSF_SERVER_KEY = None
@@ -182,6 +197,11 @@ MAILGUN_API_KEY = None
 # Use Celery for file rendering
 USE_CELERY = True
 
+# Postcommit tasks run at once, across all requests of a process
+POSTCOMMIT_POOL_SIZE = 30
+# Seconds a request waits for its postcommit tasks before responding
+POSTCOMMIT_TIMEOUT = 5.0
+
 # TODO: Override in local.py in production
 DB_HOST = 'localhost'
 DB_PORT = os_env.get('OSF_DB_PORT', 27017)
@@ -360,6 +380,16 @@ MAX_ARCHIVE_SIZE = 5 * 1024 ** 3  # == math.pow(1024, 3) == 1 GB
 
 ARCHIVE_TIMEOUT_TIMEDELTA = timedelta(1)  # 24 hours
 
+# Copy addon file trees larger than one batch as several parallel batches of WaterButler
+# copies, splitting folders that do not fit, instead of as a single copy of the whole addon
+ARCHIVE_BATCH_COPIES = False
+ARCHIVE_BATCH_MAX_FILES = 1000
+ARCHIVE_BATCH_MAX_SIZE = 1024 ** 3  # 1 GB
+ARCHIVE_BATCH_MAX_RETRIES = 3
+ARCHIVE_BATCH_RETRY_DELAY = 60  # seconds
+# Unfinished archive jobs that archived nothing for this long are considered stalled
+ARCHIVE_STALLED_TIMEDELTA = timedelta(hours=2)
+
 ENABLE_ARCHIVER = True
 
 JWT_SECRET = 'changeme'
@@ -407,6 +437,7 @@ class CeleryConfig:
         'scripts.remove_after_use.end_prereg_challenge',
         'osf.management.commands.check_crossref_dois',
         'osf.management.commands.migrate_pagecounter_data',
+        'osf.management.commands.migrate_pagecounter_dates',
         'osf.management.commands.migrate_deleted_date',
         'osf.management.commands.addon_deleted_date',
     }
@@ -462,6 +493,7 @@ class CeleryConfig:
     # Modules to import when celery launches
     imports = (
         'framework.celery_tasks',
+        'framework.analytics.tasks',
         'framework.email.tasks',
         'osf.external.tasks',
         'osf.management.commands.data_storage_usage',
@@ -622,6 +654,19 @@ class CeleryConfig:
                 'task': 'management.commands.check_crossref_dois',
                 'schedule': crontab(minute=0, hour=4),  # Daily 11:00 p.m.
             },
+            'reconcile_storage_usage': {
+                'task': 'api.caching.tasks.reconcile_storage_usage',
+                'schedule': crontab(minute=30, hour=8),  # Daily 3:30 a.m.
+                'kwargs': {'hours': 25},
+            },
+            'flush_page_counter_events': {
+                'task': 'framework.analytics.tasks.flush_page_counter_events',
+                'schedule': crontab(minute='*'),  # Every minute
+            },
+            'flush_user_activity_events': {
+                'task': 'framework.analytics.tasks.flush_user_activity_events',
+                'schedule': crontab(minute='*/5'),  # Every 5 minutes
+            },
         }
 
         # Tasks that need metrics and release requirements
@@ -1872,6 +1917,8 @@ SITEMAP_TO_S3 = False
 SITEMAP_AWS_BUCKET = None
 SITEMAP_URL_MAX = 25000
 SITEMAP_INDEX_MAX = 50000
+# Threads writing sitemap shards concurrently
+SITEMAP_WORKERS = 4
 SITEMAP_STATIC_URLS = [
     OrderedDict([('loc', ''), ('changefreq', 'yearly'), ('priority', '0.5')]),
     OrderedDict([('loc', 'preprints'), ('changefreq', 'yearly'), ('priority', '0.5')]),